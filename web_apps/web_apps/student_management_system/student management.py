@@ -5,36 +5,224 @@ Features
 1. Student CRUD with inline edit/delete actions
 2. Course CRUD with flexible description and credit tracking
 3. Enrollment management that links students to courses and tracks marks
-4. Auto-provisioning of templates and SQL schema on startup
-5. Built-in database bootstrap that creates required tables if missing
+4. Templates served from memory with a persistent Jinja bytecode cache
+   (the export-assets command writes them and the SQL schema to disk)
+5. Built-in database bootstrap that creates the database and applies pending migrations
+6. Pooled MySQL connections (POOL_* env vars) with checkout stats at /health/pool
+7. Keyset-paginated listings (?after=/?before= on the primary key, ?size=)
+8. Streamed full-table rendering (?stream=1 or STREAM_ROUTES) in constant memory
+9. Cached enrollment dropdowns with a /lookup/<students|courses> typeahead for large tables
+10. Bulk CSV/NDJSON import at /import/<students|courses|enrollments> with per-row errors
+11. Streaming CSV/NDJSON/Parquet export at /export/<listing>.<format> and the export command
+12. Secondary indexes on names/departments, unique (student_id, course_id) enrollments,
+    and an `advise` command that EXPLAINs every app query and flags full scans
+13. Versioned schema migrations (schema_migrations table) that skip all DDL when current
+14. Production `serve` command: pre-fork workers x threads (gunicorn when installed)
+15. Pluggable storage: MySQL or embedded SQLite in WAL mode (DB_BACKEND=sqlite)
+16. Read-through result cache for listings and lookups, invalidated on every write,
+    with an optional redis tier (REDIS_URL) and hit/miss stats at /health/cache
+17. Conditional GET on listings (ETag / Last-Modified -> 304 without a query) and
+    gzip/brotli compression of large HTML and JSON responses
+18. JSON API at /api/v1/<students|courses|enrollments> with fields= projection,
+    indexed filters, cursor pagination and transactional batch POST/PATCH/DELETE
+19. Concurrent fan-out of the independent enrollment-page queries on MySQL, and an
+    asyncio front end (`serve --engine uvicorn`) that keeps slow uploads off threads
+20. Grade analytics under /analytics (course averages, spread, pass rate, percentiles,
+    student GPA) read from aggregate tables kept current on every write
+21. Vectorized term-end reports (histogram, department x course crosstab, z-scores,
+    ranking) over columnar numpy arrays at /reports/<name>.<json|csv> and `report`
+22. Ranked full-text/prefix search over students and courses (MySQL FULLTEXT or
+    SQLite FTS5) at /search and from the search box on each listing
+23. Per-request timing of pool checkout, queries (normalized SQL), fetches and template
+    renders: Server-Timing header, Prometheus /metrics and a slow-query log with EXPLAIN
+24. `seed` command for reproducible synthetic data at any scale, and a `bench` command
+    that load-tests read/write mixes (p50/p95/p99, memory) against saved baselines
+25. Post/Redirect/Get on every form write (303 back to the listing), and in-place row
+    updates: the page JS posts with fetch and swaps in the single rendered row
+26. Grade sheet per course (/courses/<id>/grades) that saves a whole course's marks
+    (0-100) in one transaction, and group commit for concurrent single marks edits
+27. Read replicas (DB_REPLICAS): listing, lookup, search, API and analytics reads go to
+    the least busy replica within REPLICA_MAX_LAG, writes and reads-after-writes to
+    the primary, with a last-write cookie for read-your-writes
+28. Server-side prepared statements (binary protocol) for the fixed CRUD queries,
+    cached per pooled connection (STATEMENT_CACHE_SIZE), and `bench-statements`
+29. Live change feed: every committed Add/Update/Delete publishes the rendered row,
+    open listing pages follow /events (Server-Sent Events) and patch it in place
 
 Setup Steps
 1. Install dependencies: pip install flask mysql-connector-python
 2. Ensure MySQL is running and note the root password
+   (or set DB_BACKEND=sqlite to use a local database file instead)
 3. Update DB_PASSWORD below to match your local credentials
 4. Run python student_management_full.py
 5. Open http://127.0.0.1:5000 in a browser
+6. For deployment run python student_management_full.py serve --workers 4 --threads 8
 """
 from __future__ import annotations
 
+import argparse
+import asyncio
+import bisect
+import copy
+import csv
+import functools
+import hashlib
+import http.client
+import io
+import itertools
+import json
+import math
+import mmap
 import os
+import pickle
+import queue
+import random
+import re
+import shutil
+import signal
+import socket
+import sqlite3
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import weakref
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from flask import Flask, render_template, request
-import mysql.connector
+from flask import (
+    Flask,
+    Response,
+    before_render_template,
+    g,
+    get_template_attribute,
+    has_request_context,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+    template_rendered,
+)
+from jinja2 import DictLoader, FileSystemBytecodeCache
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+try:
+    import mysql.connector
+    from mysql.connector import errorcode
+    from mysql.connector.constants import ClientFlag
+except ImportError:
+    mysql = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+STARTUP_BEGAN = time.perf_counter()
 
 BASE_DIR = Path(__file__).parent
 TEMPLATES_DIR = BASE_DIR / "templates"
 SCHEMA_FILE = BASE_DIR / "setup_database.sql"
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR")
 
 DB_HOST = "localhost"
 DB_USER = "root"
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_NAME = "student_management"
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", str(BASE_DIR / "student_management.db"))
+DB_REPLICAS = [
+    address.strip()
+    for address in os.getenv("DB_REPLICAS", "").split(",")
+    if address.strip()
+]
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_LAG_INTERVAL = float(os.getenv("REPLICA_LAG_INTERVAL", "1"))
+LAST_WRITE_COOKIE = "sms_last_write"
+
+POOL_MIN_SIZE = int(os.getenv("POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("POOL_TIMEOUT", "5"))
+POOL_RECYCLE = float(os.getenv("POOL_RECYCLE", "1800"))
+POOL_PING_INTERVAL = float(os.getenv("POOL_PING_INTERVAL", "1"))
+STATEMENT_CACHE_SIZE = int(os.getenv("STATEMENT_CACHE_SIZE", "128"))
+
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+STREAM_ROUTES = {
+    name.strip() for name in os.getenv("STREAM_ROUTES", "").split(",") if name.strip()
+}
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "500"))
+STREAM_BUFFER = int(os.getenv("STREAM_BUFFER", "64"))
+
+LOOKUP_TTL = float(os.getenv("LOOKUP_TTL", "60"))
+LOOKUP_INLINE_LIMIT = int(os.getenv("LOOKUP_INLINE_LIMIT", "500"))
+TYPEAHEAD_LIMIT = int(os.getenv("TYPEAHEAD_LIMIT", "20"))
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+REDIS_URL = os.getenv("REDIS_URL", "")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "student_management:")
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+COMPRESS_MIMETYPES = {"text/html", "application/json"}
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+API_MAX_BATCH = int(os.getenv("API_MAX_BATCH", "5000"))
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "8"))
+PASS_MARK = int(os.getenv("PASS_MARK", "40"))
+REPORT_CHUNK_ROWS = int(os.getenv("REPORT_CHUNK_ROWS", "100000"))
+REPORT_TTL = float(os.getenv("REPORT_TTL", "600"))
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "20"))
+SEARCH_MAX_WORDS = 8
+GROUP_COMMIT_DELAY = float(os.getenv("GROUP_COMMIT_DELAY_MS", "0")) / 1000
+GROUP_COMMIT_MAX = int(os.getenv("GROUP_COMMIT_MAX", "500"))
+MARKS_BATCH_SIZE = 500
+INSTRUMENTATION = os.getenv("INSTRUMENTATION", "1") == "1"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+SLOW_QUERY_LOG_LIMIT = 5
+CHANGE_FEED = os.getenv("CHANGE_FEED", "1") == "1"
+FEED_POLL = float(os.getenv("FEED_POLL_MS", "25")) / 1000
+FEED_KEEPALIVE = float(os.getenv("FEED_KEEPALIVE", "15"))
+FEED_MAX_SUBSCRIBERS = int(os.getenv("FEED_MAX_SUBSCRIBERS", "4"))
+FEED_QUEUE_SIZE = 256
+FEED_HISTORY = 1024
+FEED_SLOTS = 1024
+FEED_SLOT_SIZE = 4096
+FEED_RETRY_MS = 2000
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_FLUSH = 1.0
+METRICS_MAX_QUERIES = 500
 
 FEATURES_TEXT = """\
-Key Features\n- CRUD for students, courses, enrollments\n- Auto-creation of templates & SQL schema\n- Database bootstrap with safe retries\n- Responsive HTML dashboards\n- Simple instructions printed on server start\n"""
+Key Features\n- CRUD for students, courses, enrollments\n- In-memory templates with a bytecode cache\n- MySQL or embedded SQLite storage (DB_BACKEND)\n- Versioned, idempotent schema migrations\n- Pooled connections with checkout stats at /health/pool\n- Write-invalidated result cache with stats at /health/cache\n- ETag/Last-Modified revalidation and gzip/brotli compression\n- Keyset pagination on every listing\n- JSON API with batch writes at /api/v1\n- Precomputed grade analytics at /analytics\n- Vectorized numpy reports at /reports\n- Ranked full-text search at /search\n- Prometheus metrics at /metrics and Server-Timing headers\n- seed and bench commands with baseline comparison\n- Post/Redirect/Get writes with in-place row updates\n- Grade sheets with batched, group-committed marks\n- Lag-aware read replicas with read-your-writes\n- Per-connection prepared statement cache\n- Live row updates over Server-Sent Events at /events\n- Responsive HTML dashboards\n- Simple instructions printed on server start\n"""
 
 SETUP_TEXT = """\
 Setup Recap\n1. pip install flask mysql-connector-python\n2. Start MySQL and ensure credentials above are valid\n3. Run: python student_management_full.py\n4. Visit: http://127.0.0.1:5000\n"""
@@ -78,7 +266,133 @@ INDEX_HTML = """<!DOCTYPE html>
 </html>
 """
 
-STUDENTS_HTML = """<!DOCTYPE html>
+ROWS_HTML = """{% macro student_row(student) %}
+<tr id=\"student-{{ student.student_id }}\">
+    <td>{{ student.student_id }}</td>
+    <td>{{ student.name }}</td>
+    <td>{{ student.age }}</td>
+    <td>{{ student.gender }}</td>
+    <td>{{ student.department }}</td>
+    <td>{{ student.email }}</td>
+    <td>{{ student.phone }}</td>
+    <td class=\"actions\">
+        <button class=\"edit-btn\" onclick='editStudent({{ student|tojson }})'>Edit</button>
+        <button class=\"delete-btn\" onclick=\"deleteStudent({{ student.student_id }})\">Delete</button>
+    </td>
+</tr>
+{% endmacro %}
+
+{% macro course_row(course) %}
+<tr id=\"course-{{ course.course_id }}\">
+    <td>{{ course.course_id }}</td>
+    <td>{{ course.course_name }}</td>
+    <td>{{ course.credits }}</td>
+    <td>{{ course.department }}</td>
+    <td>{{ course.description }}</td>
+    <td class=\"actions\">
+        <button class=\"edit-btn\" onclick='editCourse({{ course|tojson }})'>Edit</button>
+        <a class=\"grades-link\" href=\"/courses/{{ course.course_id }}/grades\">Grades</a>
+        <button class=\"delete-btn\" onclick=\"deleteCourse({{ course.course_id }})\">Delete</button>
+    </td>
+</tr>
+{% endmacro %}
+
+{% macro enrollment_row(enrollment) %}
+<tr id=\"enrollment-{{ enrollment.enroll_id }}\">
+    <td>{{ enrollment.enroll_id }}</td>
+    <td>{{ enrollment.student_name }}</td>
+    <td>{{ enrollment.course_name }}</td>
+    <td>{{ enrollment.marks }}</td>
+    <td>{{ enrollment.enrolled_on }}</td>
+    <td class=\"actions\">
+        <button class=\"edit-btn\" onclick='editEnrollment({{ enrollment.enroll_id }}, {{ enrollment.marks|tojson }})'>Edit</button>
+        <button class=\"delete-btn\" onclick=\"deleteEnrollment({{ enrollment.enroll_id }})\">Delete</button>
+    </td>
+</tr>
+{% endmacro %}
+
+{% macro row_script(kind, key) %}
+        const rowForm = document.querySelector('.form-section form');
+
+        function patchRow(result, append) {
+            const current = document.getElementById(`{{ kind }}-${result.id}`);
+            if (result.row === null) {
+                if (current) { current.remove(); }
+                return;
+            }
+            const template = document.createElement('template');
+            template.innerHTML = result.row.trim();
+            const row = template.content.firstElementChild;
+            if (current) {
+                current.replaceWith(row);
+            } else if (append) {
+                document.querySelector('.table-section tbody').appendChild(row);
+            }
+        }
+
+        function saveRow(data) {
+            return fetch(window.location.href, {
+                method: 'POST',
+                body: data,
+                headers: { 'Accept': 'application/json' },
+            })
+                .then((response) => {
+                    if (!response.ok) { throw new Error(`${response.status} ${response.statusText}`); }
+                    return response.json();
+                })
+                .then((result) => {
+                    patchRow(result, true);
+                    if (result.action !== 'delete') { clearForm(); }
+                })
+                .catch((error) => alert(`Could not save the change: ${error.message}`));
+        }
+
+        function deleteRow(id) {
+            const data = new FormData();
+            data.set('action', 'Delete');
+            data.set('{{ key }}', id);
+            saveRow(data);
+        }
+
+        rowForm.addEventListener('submit', (event) => {
+            event.preventDefault();
+            const data = new FormData(rowForm);
+            data.set('action', event.submitter ? event.submitter.value : 'Add');
+            saveRow(data);
+        });
+{% endmacro %}
+
+{% macro feed_script(listing, tail) %}
+        function showStale() {
+            if (document.querySelector('.feed-stale')) { return; }
+            const notice = document.createElement('p');
+            notice.className = 'feed-stale';
+            notice.style.cssText = 'background:#fff3cd;padding:10px;border-radius:4px;';
+            notice.innerHTML = 'This list has changed elsewhere. <a href="">Reload</a>';
+            document.querySelector('.table-section').prepend(notice);
+        }
+
+        function followChanges() {
+            if (!window.EventSource) { return; }
+            const source = new EventSource('/events?listings={{ listing }}');
+            source.onmessage = (message) => {
+                const change = JSON.parse(message.data);
+                if (change.action === 'stale') { showStale(); return; }
+                // rows edited on other pages are not on this one; new rows
+                // belong at the end of the list
+                patchRow(change, change.action === 'add' && {{ tail|tojson }});
+            };
+            source.addEventListener('reset', () => { source.close(); showStale(); });
+            source.onerror = () => {
+                if (source.readyState === EventSource.CLOSED) { setTimeout(followChanges, 30000); }
+            };
+        }
+
+        followChanges();
+{% endmacro %}
+"""
+
+STUDENTS_HTML = """{% from \"rows.html\" import student_row, row_script, feed_script %}<!DOCTYPE html>
 <html lang=\"en\">
 <head>
     <meta charset=\"UTF-8\">
@@ -111,6 +425,11 @@ STUDENTS_HTML = """<!DOCTYPE html>
         .delete-btn { background-color: #dc3545; color: white; }
         .back-link { display: inline-block; margin-bottom: 20px; color: #007bff; text-decoration: none; }
         .back-link:hover { text-decoration: underline; }
+        .search { display: flex; gap: 10px; align-items: center; }
+        .search input { flex: 1; padding: 8px; border: 1px solid #ddd; border-radius: 4px; }
+        .pagination { display: flex; justify-content: space-between; margin-top: 20px; }
+        .pagination a { color: #007bff; text-decoration: none; }
+        .pagination a:hover { text-decoration: underline; }
     </style>
 </head>
 <body>
@@ -168,6 +487,11 @@ STUDENTS_HTML = """<!DOCTYPE html>
 
         <div class=\"table-section\">
             <h2>Students List</h2>
+            <form method=\"GET\" class=\"search\">
+                <input type=\"search\" name=\"q\" value=\"{{ query }}\" placeholder=\"Search name, email or department\">
+                <button type=\"submit\" class=\"btn\">Search</button>
+                {% if query %}<a href=\"?\">Show all</a>{% endif %}
+            </form>
             <table>
                 <thead>
                     <tr>
@@ -182,23 +506,13 @@ STUDENTS_HTML = """<!DOCTYPE html>
                     </tr>
                 </thead>
                 <tbody>
-                    {% for student in students %}
-                    <tr>
-                        <td>{{ student.student_id }}</td>
-                        <td>{{ student.name }}</td>
-                        <td>{{ student.age }}</td>
-                        <td>{{ student.gender }}</td>
-                        <td>{{ student.department }}</td>
-                        <td>{{ student.email }}</td>
-                        <td>{{ student.phone }}</td>
-                        <td class=\"actions\">
-                            <button class=\"edit-btn\" onclick=\"editStudent({{ student.student_id }}, '{{ student.name }}', {{ student.age }}, '{{ student.gender }}', '{{ student.department }}', '{{ student.email }}', '{{ student.phone }}')\">Edit</button>
-                            <button class=\"delete-btn\" onclick=\"deleteStudent({{ student.student_id }})\">Delete</button>
-                        </td>
-                    </tr>
-                    {% endfor %}
+                    {% for student in students %}{{ student_row(student) }}{% endfor %}
                 </tbody>
             </table>
+            <div class=\"pagination\">
+                <span>{% if page.prev_cursor is not none %}<a href=\"?before={{ page.prev_cursor }}&size={{ page.size }}\">← Previous</a>{% endif %}</span>
+                <span>{% if page.next_cursor is not none %}<a href=\"?after={{ page.next_cursor }}&size={{ page.size }}\">Next →</a>{% endif %}</span>
+            </div>
         </div>
     </div>
 
@@ -214,36 +528,31 @@ STUDENTS_HTML = """<!DOCTYPE html>
             document.getElementById('update-btn').style.display = 'none';
         }
 
-        function editStudent(id, name, age, gender, department, email, phone) {
-            document.getElementById('student_id').value = id;
-            document.getElementById('name').value = name;
-            document.getElementById('age').value = age;
-            document.getElementById('gender').value = gender;
-            document.getElementById('department').value = department;
-            document.getElementById('email').value = email;
-            document.getElementById('phone').value = phone;
+        function editStudent(student) {
+            document.getElementById('student_id').value = student.student_id;
+            document.getElementById('name').value = student.name;
+            document.getElementById('age').value = student.age ?? '';
+            document.getElementById('gender').value = student.gender;
+            document.getElementById('department').value = student.department ?? '';
+            document.getElementById('email').value = student.email ?? '';
+            document.getElementById('phone').value = student.phone ?? '';
             document.getElementById('update-btn').style.display = 'inline-block';
             window.scrollTo(0, 0);
         }
 
         function deleteStudent(id) {
             if (confirm('Are you sure you want to delete this student?')) {
-                const form = document.createElement('form');
-                form.method = 'POST';
-                form.innerHTML = `
-                    <input type="hidden" name="action" value="Delete">
-                    <input type="hidden" name="student_id" value="${id}">
-                `;
-                document.body.appendChild(form);
-                form.submit();
+                deleteRow(id);
             }
         }
+{{ row_script("student", "student_id") }}
+{{ feed_script("students", page.next_cursor is none and not query) }}
     </script>
 </body>
 </html>
 """
 
-COURSES_HTML = """<!DOCTYPE html>
+COURSES_HTML = """{% from \"rows.html\" import course_row, row_script, feed_script %}<!DOCTYPE html>
 <html lang=\"en\">
 <head>
     <meta charset=\"UTF-8\">
@@ -275,8 +584,14 @@ COURSES_HTML = """<!DOCTYPE html>
         .actions button { margin-right: 5px; padding: 5px 10px; border: none; border-radius: 3px; cursor: pointer; }
         .edit-btn { background-color: #ffc107; color: #212529; }
         .delete-btn { background-color: #dc3545; color: white; }
+        .grades-link { color: #007bff; text-decoration: none; margin-left: 5px; }
         .back-link { display: inline-block; margin-bottom: 20px; color: #007bff; text-decoration: none; }
         .back-link:hover { text-decoration: underline; }
+        .search { display: flex; gap: 10px; align-items: center; }
+        .search input { flex: 1; padding: 8px; border: 1px solid #ddd; border-radius: 4px; }
+        .pagination { display: flex; justify-content: space-between; margin-top: 20px; }
+        .pagination a { color: #007bff; text-decoration: none; }
+        .pagination a:hover { text-decoration: underline; }
     </style>
 </head>
 <body>
@@ -321,6 +636,11 @@ COURSES_HTML = """<!DOCTYPE html>
 
         <div class=\"table-section\">
             <h2>Courses List</h2>
+            <form method=\"GET\" class=\"search\">
+                <input type=\"search\" name=\"q\" value=\"{{ query }}\" placeholder=\"Search name or description\">
+                <button type=\"submit\" class=\"btn\">Search</button>
+                {% if query %}<a href=\"?\">Show all</a>{% endif %}
+            </form>
             <table>
                 <thead>
                     <tr>
@@ -333,21 +653,13 @@ COURSES_HTML = """<!DOCTYPE html>
                     </tr>
                 </thead>
                 <tbody>
-                    {% for course in courses %}
-                    <tr>
-                        <td>{{ course.course_id }}</td>
-                        <td>{{ course.course_name }}</td>
-                        <td>{{ course.credits }}</td>
-                        <td>{{ course.department }}</td>
-                        <td>{{ course.description }}</td>
-                        <td class=\"actions\">
-                            <button class=\"edit-btn\" onclick=\"editCourse({{ course.course_id }}, '{{ course.course_name }}', {{ course.credits }}, '{{ course.department }}', '{{ course.description }}')\">Edit</button>
-                            <button class=\"delete-btn\" onclick=\"deleteCourse({{ course.course_id }})\">Delete</button>
-                        </td>
-                    </tr>
-                    {% endfor %}
+                    {% for course in courses %}{{ course_row(course) }}{% endfor %}
                 </tbody>
             </table>
+            <div class=\"pagination\">
+                <span>{% if page.prev_cursor is not none %}<a href=\"?before={{ page.prev_cursor }}&size={{ page.size }}\">← Previous</a>{% endif %}</span>
+                <span>{% if page.next_cursor is not none %}<a href=\"?after={{ page.next_cursor }}&size={{ page.size }}\">Next →</a>{% endif %}</span>
+            </div>
         </div>
     </div>
 
@@ -361,34 +673,29 @@ COURSES_HTML = """<!DOCTYPE html>
             document.getElementById('update-btn').style.display = 'none';
         }
 
-        function editCourse(id, name, credits, department, description) {
-            document.getElementById('course_id').value = id;
-            document.getElementById('course_name').value = name;
-            document.getElementById('credits').value = credits;
-            document.getElementById('department').value = department;
-            document.getElementById('description').value = description;
+        function editCourse(course) {
+            document.getElementById('course_id').value = course.course_id;
+            document.getElementById('course_name').value = course.course_name;
+            document.getElementById('credits').value = course.credits;
+            document.getElementById('department').value = course.department ?? '';
+            document.getElementById('description').value = course.description ?? '';
             document.getElementById('update-btn').style.display = 'inline-block';
             window.scrollTo(0, 0);
         }
 
         function deleteCourse(id) {
             if (confirm('Are you sure you want to delete this course?')) {
-                const form = document.createElement('form');
-                form.method = 'POST';
-                form.innerHTML = `
-                    <input type="hidden" name="action" value="Delete">
-                    <input type="hidden" name="course_id" value="${id}">
-                `;
-                document.body.appendChild(form);
-                form.submit();
+                deleteRow(id);
             }
         }
+{{ row_script("course", "course_id") }}
+{{ feed_script("courses", page.next_cursor is none and not query) }}
     </script>
 </body>
 </html>
 """
 
-ENROLLMENTS_HTML = """<!DOCTYPE html>
+ENROLLMENTS_HTML = """{% from \"rows.html\" import enrollment_row, row_script, feed_script %}<!DOCTYPE html>
 <html lang=\"en\">
 <head>
     <meta charset=\"UTF-8\">
@@ -421,6 +728,9 @@ ENROLLMENTS_HTML = """<!DOCTYPE html>
         .delete-btn { background-color: #dc3545; color: white; }
         .back-link { display: inline-block; margin-bottom: 20px; color: #007bff; text-decoration: none; }
         .back-link:hover { text-decoration: underline; }
+        .pagination { display: flex; justify-content: space-between; margin-top: 20px; }
+        .pagination a { color: #007bff; text-decoration: none; }
+        .pagination a:hover { text-decoration: underline; }
     </style>
 </head>
 <body>
@@ -436,24 +746,25 @@ ENROLLMENTS_HTML = """<!DOCTYPE html>
             <form method=\"POST\">
                 <input type=\"hidden\" name=\"enroll_id\" id=\"enroll_id\">
                 <div class=\"form-row\">
+                    {% macro lookup_field(field, label, kind, options, typeahead) %}
                     <div class=\"form-group\">
-                        <label for=\"student_id\">Student:</label>
-                        <select name=\"student_id\" id=\"student_id\" required>
-                            <option value=\"\">Select Student</option>
-                            {% for student in students %}
-                            <option value=\"{{ student.student_id }}\">{{ student.name }}</option>
-                            {% endfor %}
-                        </select>
-                    </div>
-                    <div class=\"form-group\">
-                        <label for=\"course_id\">Course:</label>
-                        <select name=\"course_id\" id=\"course_id\" required>
-                            <option value=\"\">Select Course</option>
-                            {% for course in courses %}
-                            <option value=\"{{ course.course_id }}\">{{ course.course_name }}</option>
+                        <label for=\"{{ field }}\">{{ label }}:</label>
+                        {% if typeahead %}
+                        <input type=\"text\" id=\"{{ field }}_search\" list=\"{{ field }}_options\" data-kind=\"{{ kind }}\" data-target=\"{{ field }}\" placeholder=\"Type to search {{ kind }}\" autocomplete=\"off\" class=\"typeahead\" required>
+                        <datalist id=\"{{ field }}_options\"></datalist>
+                        <input type=\"hidden\" name=\"{{ field }}\" id=\"{{ field }}\">
+                        {% else %}
+                        <select name=\"{{ field }}\" id=\"{{ field }}\" required>
+                            <option value=\"\">Select {{ label }}</option>
+                            {% for option in options %}
+                            <option value=\"{{ option.id }}\">{{ option.name }}</option>
                             {% endfor %}
                         </select>
+                        {% endif %}
                     </div>
+                    {% endmacro %}
+                    {{ lookup_field(\"student_id\", \"Student\", \"students\", students, students_typeahead) }}
+                    {{ lookup_field(\"course_id\", \"Course\", \"courses\", courses, courses_typeahead) }}
                     <div class=\"form-group\">
                         <label for=\"marks\">Marks:</label>
                         <input type=\"number\" name=\"marks\" id=\"marks\" min=\"0\" max=\"100\">
@@ -481,22 +792,13 @@ ENROLLMENTS_HTML = """<!DOCTYPE html>
                     </tr>
                 </thead>
                 <tbody>
-                    {% for enrollment in enrollments %}
-                    <tr>
-                        <td>{{ enrollment.enroll_id }}</td>
-                        <td>{{ enrollment.student_name }}</td>
-                        <td>{{ enrollment.course_name }}</td>
-                        <td>{{ enrollment.marks }}</td>
-                        <td>{{ enrollment.enrolled_on }}
-                        </td>
-                        <td class=\"actions\">
-                            <button class=\"edit-btn\" onclick=\"editEnrollment({{ enrollment.enroll_id }}, '{{ enrollment.marks }}')\">Edit</button>
-                            <button class=\"delete-btn\" onclick=\"deleteEnrollment({{ enrollment.enroll_id }})\">Delete</button>
-                        </td>
-                    </tr>
-                    {% endfor %}
+                    {% for enrollment in enrollments %}{{ enrollment_row(enrollment) }}{% endfor %}
                 </tbody>
             </table>
+            <div class=\"pagination\">
+                <span>{% if page.prev_cursor is not none %}<a href=\"?before={{ page.prev_cursor }}&size={{ page.size }}\">← Previous</a>{% endif %}</span>
+                <span>{% if page.next_cursor is not none %}<a href=\"?after={{ page.next_cursor }}&size={{ page.size }}\">Next →</a>{% endif %}</span>
+            </div>
         </div>
     </div>
 
@@ -506,37 +808,133 @@ ENROLLMENTS_HTML = """<!DOCTYPE html>
             document.getElementById('student_id').value = '';
             document.getElementById('course_id').value = '';
             document.getElementById('marks').value = '';
+            document.querySelectorAll('.typeahead').forEach((input) => { input.value = ''; });
             document.getElementById('update-btn').style.display = 'none';
         }
 
+        document.querySelectorAll('.typeahead').forEach((input) => {
+            const target = document.getElementById(input.dataset.target);
+            const list = document.getElementById(input.list.id);
+            let pending = null;
+            input.addEventListener('input', () => {
+                const match = input.value.match(/#(\\d+)$/);
+                target.value = match ? match[1] : '';
+                if (match) { return; }
+                clearTimeout(pending);
+                pending = setTimeout(() => {
+                    fetch(`/lookup/${input.dataset.kind}?q=${encodeURIComponent(input.value)}`)
+                        .then((response) => response.json())
+                        .then((options) => {
+                            list.innerHTML = '';
+                            options.forEach((option) => {
+                                const item = document.createElement('option');
+                                item.value = `${option.name} #${option.id}`;
+                                list.appendChild(item);
+                            });
+                        });
+                }, 150);
+            });
+        });
+
         function editEnrollment(id, marks) {
             document.getElementById('enroll_id').value = id;
-            document.getElementById('marks').value = marks;
+            document.getElementById('marks').value = marks ?? '';
             document.getElementById('update-btn').style.display = 'inline-block';
             window.scrollTo(0, 0);
         }
 
         function deleteEnrollment(id) {
             if (confirm('Are you sure you want to delete this enrollment?')) {
-                const form = document.createElement('form');
-                form.method = 'POST';
-                form.innerHTML = `
-                    <input type="hidden" name="action" value="Delete">
-                    <input type="hidden" name="enroll_id" value="${id}">
-                `;
-                document.body.appendChild(form);
-                form.submit();
+                deleteRow(id);
             }
         }
+{{ row_script("enrollment", "enroll_id") }}
+{{ feed_script("enrollments", page.next_cursor is none) }}
     </script>
 </body>
 </html>
 """
 
-SQL_SCHEMA = """CREATE DATABASE IF NOT EXISTS student_management;
-USE student_management;
+GRADES_HTML = """<!DOCTYPE html>
+<html lang=\"en\">
+<head>
+    <meta charset=\"UTF-8\">
+    <meta name=\"viewport\" content=\"width=device-width, initial-scale=1.0\">
+    <title>Grade Sheet - {{ course.course_name }}</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 0; padding: 0; background-color: #f5f5f5; }
+        .header { background-color: #333; color: white; padding: 20px; text-align: center; }
+        .container { max-width: 1200px; margin: 20px auto; padding: 0 20px; }
+        .form-actions { text-align: center; margin-top: 20px; }
+        .btn { background-color: #007bff; color: white; padding: 10px 30px; border: none; border-radius: 4px; cursor: pointer; margin: 0 10px; }
+        .btn:hover { background-color: #0056b3; }
+        .table-section { background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+        table { width: 100%; border-collapse: collapse; margin-top: 20px; }
+        th, td { padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }
+        th { background-color: #f8f9fa; font-weight: bold; }
+        tr:hover { background-color: #f5f5f5; }
+        td input { width: 100px; padding: 6px; border: 1px solid #ddd; border-radius: 4px; }
+        tr.invalid input { border-color: #dc3545; }
+        .error { color: #dc3545; }
+        .notice { padding: 10px 15px; border-radius: 4px; margin-bottom: 20px; }
+        .notice.saved { background-color: #d4edda; color: #155724; }
+        .notice.failed { background-color: #f8d7da; color: #721c24; }
+        .back-link { display: inline-block; margin-bottom: 20px; color: #007bff; text-decoration: none; }
+        .back-link:hover { text-decoration: underline; }
+    </style>
+</head>
+<body>
+    <div class=\"header\">
+        <h1>Grade Sheet</h1>
+    </div>
+
+    <div class=\"container\">
+        <a href=\"/courses\" class=\"back-link\">← Back to Courses</a>
+
+        <div class=\"table-section\">
+            <h2>{{ course.course_name }} ({{ course.credits }} credits)</h2>
+            {% if errors %}
+            <div class=\"notice failed\">{{ errors|length }} invalid marks; nothing was saved.</div>
+            {% elif saved is not none %}
+            <div class=\"notice saved\">Saved {{ saved }} changed marks.</div>
+            {% endif %}
+            <form method=\"POST\">
+                <table>
+                    <thead>
+                        <tr>
+                            <th>Enrollment</th>
+                            <th>Student</th>
+                            <th>Email</th>
+                            <th>Marks (0-100)</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                        {% for row in rows %}
+                        {% set field = \"marks-\" ~ row.enroll_id %}
+                        {% set error = errors.get(row.enroll_id|string) %}
+                        <tr{% if error %} class=\"invalid\"{% endif %}>
+                            <td>{{ row.enroll_id }}</td>
+                            <td>{{ row.student_name }}</td>
+                            <td>{{ row.email }}</td>
+                            <td>
+                                <input type=\"number\" name=\"{{ field }}\" min=\"0\" max=\"100\" value=\"{{ submitted.get(field, row.marks if row.marks is not none else '') }}\">
+                                {% if error %}<span class=\"error\">{{ error }}</span>{% endif %}
+                            </td>
+                        </tr>
+                        {% endfor %}
+                    </tbody>
+                </table>
+                <div class=\"form-actions\">
+                    <button type=\"submit\" class=\"btn\">Save Marks</button>
+                </div>
+            </form>
+        </div>
+    </div>
+</body>
+</html>
+"""
 
-CREATE TABLE IF NOT EXISTS student (
+STUDENT_DDL = """CREATE TABLE IF NOT EXISTS student (
     student_id INT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
     age INT,
@@ -544,17 +942,17 @@ CREATE TABLE IF NOT EXISTS student (
     department VARCHAR(100),
     email VARCHAR(150) UNIQUE,
     phone VARCHAR(20)
-);
+)"""
 
-CREATE TABLE IF NOT EXISTS course (
+COURSE_DDL = """CREATE TABLE IF NOT EXISTS course (
     course_id INT AUTO_INCREMENT PRIMARY KEY,
     course_name VARCHAR(150) NOT NULL,
     credits INT NOT NULL DEFAULT 0,
     department VARCHAR(100),
     description TEXT
-);
+)"""
 
-CREATE TABLE IF NOT EXISTS enrollment (
+ENROLLMENT_DDL = """CREATE TABLE IF NOT EXISTS enrollment (
     enroll_id INT AUTO_INCREMENT PRIMARY KEY,
     student_id INT NOT NULL,
     course_id INT NOT NULL,
@@ -562,263 +960,5698 @@ CREATE TABLE IF NOT EXISTS enrollment (
     enrolled_on DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (student_id) REFERENCES student(student_id) ON DELETE CASCADE,
     FOREIGN KEY (course_id) REFERENCES course(course_id) ON DELETE CASCADE
-);
-"""
+)"""
+
+SQLITE_STUDENT_DDL = """CREATE TABLE IF NOT EXISTS student (
+    student_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL COLLATE NOCASE,
+    age INT,
+    gender TEXT NOT NULL CHECK (gender IN ('Male', 'Female', 'Other')),
+    department VARCHAR(100),
+    email VARCHAR(150) UNIQUE,
+    phone VARCHAR(20)
+)"""
+
+SQLITE_COURSE_DDL = """CREATE TABLE IF NOT EXISTS course (
+    course_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    course_name VARCHAR(150) NOT NULL COLLATE NOCASE,
+    credits INT NOT NULL DEFAULT 0,
+    department VARCHAR(100),
+    description TEXT
+)"""
+
+SQLITE_ENROLLMENT_DDL = """CREATE TABLE IF NOT EXISTS enrollment (
+    enroll_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id INT NOT NULL,
+    course_id INT NOT NULL,
+    marks INT,
+    enrolled_on DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (student_id) REFERENCES student(student_id) ON DELETE CASCADE,
+    FOREIGN KEY (course_id) REFERENCES course(course_id) ON DELETE CASCADE
+)"""
 
-def ensure_assets() -> None:
-    TEMPLATES_DIR.mkdir(exist_ok=True)
-    files: Dict[str, str] = {
-        "index.html": INDEX_HTML,
-        "students.html": STUDENTS_HTML,
-        "courses.html": COURSES_HTML,
-        "enrollments.html": ENROLLMENTS_HTML,
+COURSE_STATS_DDL = """CREATE TABLE IF NOT EXISTS course_stats (
+    course_id INT PRIMARY KEY,
+    enrolled INT NOT NULL DEFAULT 0,
+    graded INT NOT NULL DEFAULT 0,
+    marks_sum BIGINT NOT NULL DEFAULT 0,
+    marks_sq_sum BIGINT NOT NULL DEFAULT 0,
+    FOREIGN KEY (course_id) REFERENCES course(course_id) ON DELETE CASCADE
+)"""
+
+COURSE_MARKS_DDL = """CREATE TABLE IF NOT EXISTS course_marks (
+    course_id INT NOT NULL,
+    marks INT NOT NULL,
+    students INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (course_id, marks),
+    FOREIGN KEY (course_id) REFERENCES course(course_id) ON DELETE CASCADE
+)"""
+
+STUDENT_STATS_DDL = """CREATE TABLE IF NOT EXISTS student_stats (
+    student_id INT PRIMARY KEY,
+    enrolled INT NOT NULL DEFAULT 0,
+    graded INT NOT NULL DEFAULT 0,
+    credits INT NOT NULL DEFAULT 0,
+    weighted_marks BIGINT NOT NULL DEFAULT 0,
+    grade_points BIGINT NOT NULL DEFAULT 0,
+    FOREIGN KEY (student_id) REFERENCES student(student_id) ON DELETE CASCADE
+)"""
+
+GRADE_POINTS = ((90, 4), (80, 3), (70, 2), (60, 1))
+
+
+def grade_points(marks: int) -> int:
+    for threshold, points in GRADE_POINTS:
+        if marks >= threshold:
+            return points
+    return 0
+
+
+GRADE_POINTS_SQL = (
+    "CASE "
+    + " ".join(f"WHEN e.marks >= {low} THEN {points}" for low, points in GRADE_POINTS)
+    + " ELSE 0 END"
+)
+
+ANALYTICS_REBUILD = [
+    "DELETE FROM course_marks",
+    "DELETE FROM course_stats",
+    "DELETE FROM student_stats",
+    """INSERT INTO course_stats (course_id, enrolled, graded, marks_sum, marks_sq_sum)
+    SELECT e.course_id, COUNT(*), COUNT(e.marks), COALESCE(SUM(e.marks), 0),
+        COALESCE(SUM(e.marks * e.marks), 0)
+    FROM enrollment e
+    GROUP BY e.course_id""",
+    """INSERT INTO course_marks (course_id, marks, students)
+    SELECT e.course_id, e.marks, COUNT(*)
+    FROM enrollment e
+    WHERE e.marks IS NOT NULL
+    GROUP BY e.course_id, e.marks""",
+    f"""INSERT INTO student_stats
+        (student_id, enrolled, graded, credits, weighted_marks, grade_points)
+    SELECT e.student_id, COUNT(*), COUNT(e.marks),
+        COALESCE(SUM(CASE WHEN e.marks IS NULL THEN 0 ELSE c.credits END), 0),
+        COALESCE(SUM(e.marks * c.credits), 0),
+        COALESCE(SUM({GRADE_POINTS_SQL} * c.credits), 0)
+    FROM enrollment e
+    JOIN course c ON c.course_id = e.course_id
+    GROUP BY e.student_id""",
+]
+
+MIGRATIONS_DDL = """CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    applied_on DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+)"""
+
+
+def add_index(
+    table: str, name: str, columns: str, unique: bool = False
+) -> Dict[str, str]:
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    return {
+        "mysql": f"ALTER TABLE {table} ADD {kind} {name} ({columns}), "
+        "ALGORITHM=INPLACE, LOCK=NONE",
+        "sqlite": f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({columns})",
     }
-    for name, content in files.items():
-        target = TEMPLATES_DIR / name
-        target.write_text(content, encoding="utf-8")
-    SCHEMA_FILE.write_text(SQL_SCHEMA, encoding="utf-8")
 
 
-def get_connection():
-    conn = mysql.connector.connect(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME,
-        auth_plugin="mysql_native_password",
+SEARCH_FIELDS: Dict[str, Tuple[Tuple[str, float], ...]] = {
+    "student": (("name", 10.0), ("email", 4.0), ("department", 1.0)),
+    "course": (("course_name", 10.0), ("description", 1.0)),
+}
+
+
+def fulltext_index(table: str, key: str) -> List[Dict[str, str]]:
+    fields = [column for column, _ in SEARCH_FIELDS[table]]
+    columns = ", ".join(fields)
+    fts = f"{table}_fts"
+    new_values = ", ".join(f"new.{column}" for column in fields)
+    old_values = ", ".join(f"old.{column}" for column in fields)
+    insert = f"INSERT INTO {fts} (rowid, {columns}) VALUES (new.{key}, {new_values});"
+    delete = (
+        f"INSERT INTO {fts} ({fts}, rowid, {columns}) "
+        f"VALUES ('delete', old.{key}, {old_values});"
     )
-    return conn
+    trigger = f"CREATE TRIGGER IF NOT EXISTS {fts}_%s AFTER %s ON {table} BEGIN %s END"
+    return [
+        {
+            "mysql": f"ALTER TABLE {table} ADD FULLTEXT INDEX ft_{table} ({columns})",
+            "sqlite": f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, "
+            f"content='{table}', content_rowid='{key}', prefix='2 3')",
+        },
+        {"sqlite": trigger % ("insert", "INSERT", insert)},
+        {"sqlite": trigger % ("delete", "DELETE", delete)},
+        {"sqlite": trigger % ("update", "UPDATE", f"{delete} {insert}")},
+        {"sqlite": f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')"},
+    ]
 
 
-def create_database_if_needed() -> None:
-    connection = mysql.connector.connect(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        auth_plugin="mysql_native_password",
+def _duplicate_enrollments(cursor) -> Optional[str]:
+    cursor.execute(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM enrollment "
+        "GROUP BY student_id, course_id HAVING COUNT(*) > 1) AS duplicates"
     )
-    cursor = connection.cursor()
-    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_NAME}")
-    connection.commit()
-    cursor.close()
-    connection.close()
+    (duplicates,) = cursor.fetchone()
+    if duplicates:
+        return (
+            f"{duplicates} duplicate (student_id, course_id) enrollment groups; "
+            "list them with SELECT student_id, course_id FROM enrollment "
+            "GROUP BY student_id, course_id HAVING COUNT(*) > 1"
+        )
+    return None
 
 
-def create_tables() -> None:
-    create_database_if_needed()
-    conn = get_connection()
-    cursor = conn.cursor()
-    statements = [
-        """CREATE TABLE IF NOT EXISTS student (
-                student_id INT AUTO_INCREMENT PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                age INT,
-                gender ENUM('Male', 'Female', 'Other') NOT NULL,
-                department VARCHAR(100),
-                email VARCHAR(150) UNIQUE,
-                phone VARCHAR(20)
-            )""",
-        """CREATE TABLE IF NOT EXISTS course (
-                course_id INT AUTO_INCREMENT PRIMARY KEY,
-                course_name VARCHAR(150) NOT NULL,
-                credits INT NOT NULL DEFAULT 0,
-                department VARCHAR(100),
-                description TEXT
-            )""",
-        """CREATE TABLE IF NOT EXISTS enrollment (
-                enroll_id INT AUTO_INCREMENT PRIMARY KEY,
-                student_id INT NOT NULL,
-                course_id INT NOT NULL,
-                marks INT,
-                enrolled_on DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (student_id) REFERENCES student(student_id) ON DELETE CASCADE,
-                FOREIGN KEY (course_id) REFERENCES course(course_id) ON DELETE CASCADE
-            )""",
+@dataclass
+class Migration:
+    version: int
+    name: str
+    statements: List[Dict[str, str]]
+    precheck: Optional[Callable[[Any], Optional[str]]] = None
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "base tables",
+        [
+            {"mysql": STUDENT_DDL, "sqlite": SQLITE_STUDENT_DDL},
+            {"mysql": COURSE_DDL, "sqlite": SQLITE_COURSE_DDL},
+            {"mysql": ENROLLMENT_DDL, "sqlite": SQLITE_ENROLLMENT_DDL},
+            {
+                "sqlite": "CREATE INDEX IF NOT EXISTS idx_enrollment_course "
+                "ON enrollment (course_id)"
+            },
+        ],
+    ),
+    Migration(
+        2,
+        "name and department indexes",
+        [
+            add_index("student", "idx_student_name", "name"),
+            add_index("student", "idx_student_department", "department"),
+            add_index("course", "idx_course_name", "course_name"),
+            add_index("course", "idx_course_department", "department"),
+        ],
+    ),
+    Migration(
+        3,
+        "unique enrollment per student and course",
+        [
+            add_index(
+                "enrollment",
+                "uq_enrollment_student_course",
+                "student_id, course_id",
+                unique=True,
+            )
+        ],
+        precheck=_duplicate_enrollments,
+    ),
+    Migration(
+        4,
+        "grade analytics aggregates",
+        [
+            {"mysql": COURSE_STATS_DDL, "sqlite": COURSE_STATS_DDL},
+            {"mysql": COURSE_MARKS_DDL, "sqlite": COURSE_MARKS_DDL},
+            {"mysql": STUDENT_STATS_DDL, "sqlite": STUDENT_STATS_DDL},
+        ]
+        + [{"mysql": sql, "sqlite": sql} for sql in ANALYTICS_REBUILD],
+    ),
+    Migration(
+        5,
+        "full-text search indexes",
+        fulltext_index("student", "student_id") + fulltext_index("course", "course_id"),
+    ),
+]
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def render_schema() -> str:
+    parts = [
+        f"CREATE DATABASE IF NOT EXISTS {DB_NAME}",
+        f"USE {DB_NAME}",
+        MIGRATIONS_DDL,
     ]
-    for stmt in statements:
-        cursor.execute(stmt)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    for migration in MIGRATIONS:
+        parts.extend(
+            statement["mysql"]
+            for statement in migration.statements
+            if "mysql" in statement
+        )
+        parts.append(
+            "INSERT IGNORE INTO schema_migrations (version, name) "
+            f"VALUES ({migration.version}, '{migration.name}')"
+        )
+    return ";\n\n".join(parts) + ";\n"
 
 
-app = Flask(__name__)
+SQL_SCHEMA = render_schema()
 
+TEMPLATES: Dict[str, str] = {
+    "index.html": INDEX_HTML,
+    "rows.html": ROWS_HTML,
+    "students.html": STUDENTS_HTML,
+    "courses.html": COURSES_HTML,
+    "enrollments.html": ENROLLMENTS_HTML,
+    "grades.html": GRADES_HTML,
+}
 
-@app.route("/")
-def index():
-    return render_template("index.html")
 
+def export_assets(
+    templates_dir: Path = TEMPLATES_DIR, schema_file: Path = SCHEMA_FILE
+) -> None:
+    templates_dir.mkdir(parents=True, exist_ok=True)
+    for name, content in TEMPLATES.items():
+        target = templates_dir / name
+        target.write_text(content, encoding="utf-8")
+    schema_file.write_text(SQL_SCHEMA, encoding="utf-8")
 
-@app.route("/students", methods=["GET", "POST"])
-def students():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    if request.method == "POST":
-        action = request.form["action"]
-        if action == "Add":
-            cursor.execute(
-                """
-                INSERT INTO student (name, age, gender, department, email, phone)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    request.form["name"],
-                    request.form.get("age"),
-                    request.form["gender"],
-                    request.form.get("department"),
-                    request.form.get("email"),
-                    request.form.get("phone"),
-                ),
-            )
-        elif action == "Update":
-            cursor.execute(
-                """
-                UPDATE student
-                SET name=%s, age=%s, gender=%s, department=%s, email=%s, phone=%s
-                WHERE student_id=%s
-                """,
-                (
-                    request.form["name"],
-                    request.form.get("age"),
-                    request.form["gender"],
-                    request.form.get("department"),
-                    request.form.get("email"),
-                    request.form.get("phone"),
-                    request.form["student_id"],
-                ),
-            )
-        elif action == "Delete":
-            cursor.execute(
-                "DELETE FROM student WHERE student_id=%s",
-                (request.form["student_id"],),
-            )
-        conn.commit()
-    cursor.execute("SELECT * FROM student")
-    students_data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return render_template("students.html", students=students_data)
 
+def template_bytecode_cache() -> Optional[FileSystemBytecodeCache]:
+    pattern = "student_management_%s.cache"
+    if not TEMPLATE_CACHE_DIR:
+        # Jinja's own per-user directory, created 0700 and checked for ownership
+        try:
+            return FileSystemBytecodeCache(pattern=pattern)
+        except (OSError, RuntimeError):
+            return None
+    # cached bytecode is executed, so only a directory no one else can write to
+    # is trusted
+    try:
+        os.makedirs(TEMPLATE_CACHE_DIR, mode=0o700, exist_ok=True)
+        info = os.lstat(TEMPLATE_CACHE_DIR)
+    except OSError:
+        return None
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    ):
+        return None
+    return FileSystemBytecodeCache(TEMPLATE_CACHE_DIR, pattern)
 
-@app.route("/courses", methods=["GET", "POST"])
-def courses():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    if request.method == "POST":
-        action = request.form["action"]
-        if action == "Add":
-            cursor.execute(
-                """
-                INSERT INTO course (course_name, credits, department, description)
-                VALUES (%s, %s, %s, %s)
-                """,
-                (
-                    request.form["course_name"],
-                    request.form.get("credits", 0),
-                    request.form.get("department"),
-                    request.form.get("description"),
-                ),
-            )
-        elif action == "Update":
-            cursor.execute(
-                """
-                UPDATE course
-                SET course_name=%s, credits=%s, department=%s, description=%s
-                WHERE course_id=%s
-                """,
-                (
-                    request.form["course_name"],
-                    request.form.get("credits", 0),
-                    request.form.get("department"),
-                    request.form.get("description"),
-                    request.form["course_id"],
-                ),
-            )
-        elif action == "Delete":
-            cursor.execute(
-                "DELETE FROM course WHERE course_id=%s",
-                (request.form["course_id"],),
-            )
-        conn.commit()
-    cursor.execute("SELECT * FROM course")
-    courses_data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return render_template("courses.html", courses=courses_data)
 
+def precompile_templates() -> None:
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
 
-@app.route("/enrollments", methods=["GET", "POST"])
-def enrollments():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM student")
-    students_list = cursor.fetchall()
-    cursor.execute("SELECT * FROM course")
-    courses_list = cursor.fetchall()
-    if request.method == "POST":
-        action = request.form["action"]
-        if action == "Add":
-            cursor.execute(
-                """
-                INSERT INTO enrollment (student_id, course_id, marks, enrolled_on)
-                VALUES (%s, %s, %s, NOW())
-                """,
-                (
-                    request.form["student_id"],
-                    request.form["course_id"],
-                    request.form.get("marks"),
-                ),
-            )
-        elif action == "Update":
-            cursor.execute(
-                """
-                UPDATE enrollment
-                SET marks=%s
-                WHERE enroll_id=%s
-                """,
-                (
-                    request.form.get("marks"),
-                    request.form["enroll_id"],
-                ),
+
+class Backend(ABC):
+    name = ""
+    Error: Tuple[type, ...] = ()
+    parallel_reads = False
+    lock_rows = ""
+    prepares = False
+    statement_cache = 0
+
+    @abstractmethod
+    def connect(self):
+        ...
+
+    def connect_for_migration(self):
+        return self.connect()
+
+    @abstractmethod
+    def cursor(self, conn, dictionary: bool = False, stream: bool = False):
+        ...
+
+    def sql(self, text: str) -> str:
+        return text
+
+    @abstractmethod
+    def ping(self, conn) -> None:
+        ...
+
+    @abstractmethod
+    def upsert_add(
+        self, table: str, keys: Tuple[str, ...], columns: Tuple[str, ...]
+    ) -> str:
+        ...
+
+    def reset(self, conn) -> bool:
+        if conn.in_transaction:
+            conn.rollback()
+        return True
+
+    @abstractmethod
+    def schema_version(self, cursor) -> int:
+        ...
+
+    def lock(self, cursor) -> None:
+        pass
+
+    def unlock(self, cursor) -> None:
+        pass
+
+    def ignorable_ddl_error(self, exc: Exception) -> bool:
+        return False
+
+    @abstractmethod
+    def explain(self, cursor, sql: str, params: Tuple, min_rows: int = 0) -> List[str]:
+        ...
+
+    @abstractmethod
+    def query_plan(self, cursor, sql: str, params: Tuple) -> List[str]:
+        ...
+
+    @abstractmethod
+    def search(
+        self, table: str, key: str, words: List[str], limit: int
+    ) -> Tuple[str, Tuple]:
+        ...
+
+    def error_message(self, exc: Exception) -> str:
+        return str(exc)
+
+    @abstractmethod
+    def replica(self, address: str) -> "Backend":
+        ...
+
+    @abstractmethod
+    def replica_lag(self, conn) -> Optional[float]:
+        ...
+
+    def statement(self, conn, sql: str) -> Tuple[Any, str]:
+        # without server-side prepares the driver's own statement cache is used
+        return self.cursor(conn), sql
+
+    def server_time(self, conn) -> Optional[float]:
+        return None
+
+
+class MySQLBackend(Backend):
+    name = "mysql"
+    parallel_reads = True
+    lock_rows = " FOR UPDATE"
+
+    def __init__(
+        self,
+        host: str = DB_HOST,
+        port: Optional[int] = None,
+        statement_cache: int = STATEMENT_CACHE_SIZE,
+    ) -> None:
+        if mysql is None:
+            raise RuntimeError(
+                "The MySQL backend requires mysql-connector-python: "
+                "pip install mysql-connector-python"
             )
-        elif action == "Delete":
+        self.Error = (mysql.connector.Error,)
+        self.host = host
+        self.port = port
+        self.statement_cache = statement_cache
+        self._statements: "weakref.WeakKeyDictionary[Any, OrderedDict]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @property
+    def prepares(self) -> bool:
+        return self.statement_cache > 0
+
+    def connect(self, database: bool = True):
+        options = dict(
+            host=self.host,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            auth_plugin="mysql_native_password",
+            # rowcount counts matched rows, so an update that changes nothing
+            # is not mistaken for a missing row
+            client_flags=[ClientFlag.FOUND_ROWS],
+        )
+        if self.port:
+            options["port"] = self.port
+        if database:
+            options["database"] = DB_NAME
+        return mysql.connector.connect(**options)
+
+    def connect_for_migration(self):
+        try:
+            return self.connect()
+        except mysql.connector.Error as exc:
+            if exc.errno != errorcode.ER_BAD_DB_ERROR:
+                raise
+        self.create_database()
+        return self.connect()
+
+    def create_database(self) -> None:
+        connection = self.connect(database=False)
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_NAME}")
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+    def cursor(self, conn, dictionary: bool = False, stream: bool = False):
+        return conn.cursor(dictionary=dictionary, buffered=not stream)
+
+    def ping(self, conn) -> None:
+        conn.ping(reconnect=False)
+
+    def upsert_add(
+        self, table: str, keys: Tuple[str, ...], columns: Tuple[str, ...]
+    ) -> str:
+        names = (*keys, *columns)
+        increments = ", ".join(
+            f"{column} = {column} + VALUES({column})" for column in columns
+        )
+        return (
+            f"INSERT INTO {table} ({', '.join(names)}) "
+            f"VALUES ({', '.join(['%s'] * len(names))}) "
+            f"ON DUPLICATE KEY UPDATE {increments}"
+        )
+
+    def reset(self, conn) -> bool:
+        if conn.unread_result:
+            return False
+        return super().reset(conn)
+
+    def replica(self, address: str) -> "MySQLBackend":
+        host, _, port = address.partition(":")
+        return MySQLBackend(host, int(port) if port else None, self.statement_cache)
+
+    def replica_lag(self, conn) -> Optional[float]:
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error as exc:
+                if exc.errno != errorcode.ER_PARSE_ERROR:
+                    raise
+                cursor.execute("SHOW SLAVE STATUS")
+            status = cursor.fetchone()
+        finally:
+            cursor.close()
+        if status is None:
+            return 0.0
+        lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+        # Whole seconds, so a reported 0 can still be up to a second behind.
+        return None if lag is None else float(lag) + 1
+
+    def statement(self, conn, sql: str) -> Tuple[Any, str]:
+        # One prepared cursor per statement text, kept for the connection's
+        # life. The connector re-prepares unless it is handed the very string
+        # object it prepared, so the cached text is returned with the cursor.
+        statements = self._statements.get(conn)
+        if statements is None:
+            statements = self._statements[conn] = OrderedDict()
+        entry = statements.get(sql)
+        if entry is not None:
+            statements.move_to_end(sql)
+            return entry
+        if len(statements) >= self.statement_cache:
+            _, (evicted, _) = statements.popitem(last=False)
+            evicted.close()
+        entry = statements[sql] = (conn.cursor(prepared=True), sql)
+        return entry
+
+    def server_time(self, conn) -> Optional[float]:
+        cursor = conn.cursor(buffered=True)
+        try:
             cursor.execute(
-                "DELETE FROM enrollment WHERE enroll_id=%s",
-                (request.form["enroll_id"],),
+                "SELECT SUM(SUM_TIMER_WAIT) FROM performance_schema."
+                "events_statements_summary_by_thread_by_event_name "
+                "WHERE THREAD_ID = PS_CURRENT_THREAD_ID()"
             )
-        conn.commit()
-    cursor.execute(
-        """
-        SELECT e.enroll_id, s.name AS student_name, c.course_name, e.marks, e.enrolled_on
-        FROM enrollment e
-        JOIN student s ON e.student_id = s.student_id
-        JOIN course c ON e.course_id = c.course_id
-        """
-    )
-    enrollments_data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return render_template(
-        "enrollments.html",
-        enrollments=enrollments_data,
-        students=students_list,
-        courses=courses_list,
+            (picoseconds,) = cursor.fetchone()
+        except mysql.connector.Error:
+            return None
+        finally:
+            cursor.close()
+        return None if picoseconds is None else float(picoseconds) / 1e12
+
+    def schema_version(self, cursor) -> int:
+        try:
+            cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        except mysql.connector.Error as exc:
+            if exc.errno != errorcode.ER_NO_SUCH_TABLE:
+                raise
+            return 0
+        (version,) = cursor.fetchone()
+        return version or 0
+
+    def lock(self, cursor) -> None:
+        cursor.execute("SELECT GET_LOCK('student_management_migrate', 60)")
+        cursor.fetchone()
+
+    def unlock(self, cursor) -> None:
+        cursor.execute("SELECT RELEASE_LOCK('student_management_migrate')")
+        cursor.fetchone()
+
+    def ignorable_ddl_error(self, exc: Exception) -> bool:
+        return getattr(exc, "errno", None) == errorcode.ER_DUP_KEYNAME
+
+    def explain(self, cursor, sql: str, params: Tuple, min_rows: int = 0) -> List[str]:
+        cursor.execute(f"EXPLAIN {sql}", params)
+        problems = []
+        for row in cursor.fetchall():
+            table = row.get("table")
+            rows = row.get("rows") or 0
+            extra = row.get("Extra") or ""
+            if row.get("type") == "ALL" and rows >= min_rows:
+                problems.append(f"full table scan on {table} (~{rows} rows)")
+            if "Using filesort" in extra and rows >= min_rows:
+                problems.append(f"filesort on {table} (~{rows} rows)")
+            if "Using temporary" in extra:
+                problems.append(f"temporary table for {table}")
+        return problems
+
+    def query_plan(self, cursor, sql: str, params: Tuple) -> List[str]:
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return [
+            " ".join(f"{name}={value}" for name, value in row.items() if value)
+            for row in cursor.fetchall()
+        ]
+
+    def search(
+        self, table: str, key: str, words: List[str], limit: int
+    ) -> Tuple[str, Tuple]:
+        fields = ", ".join([key] + [column for column, *_ in TABLE_COLUMNS[table]])
+        columns = ", ".join(column for column, _ in SEARCH_FIELDS[table])
+        match = f"MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)"
+        # each word must match as a prefix; an exact match also scores the bare term
+        terms = " ".join(f"+({word} {word}*)" for word in words)
+        return (
+            f"SELECT {fields}, {match} AS score FROM {table} WHERE {match} "
+            f"ORDER BY score DESC, {key} LIMIT %s",
+            (terms, terms, limit),
+        )
+
+    def error_message(self, exc: Exception) -> str:
+        return getattr(exc, "msg", None) or str(exc)
+
+
+def _dict_row(cursor, row) -> Dict[str, Any]:
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteBackend(Backend):
+    name = "sqlite"
+    Error = (sqlite3.Error,)
+    PRAGMAS = (
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        "foreign_keys=ON",
+        "busy_timeout=5000",
+        "cache_size=-65536",
+        "temp_store=MEMORY",
+        "mmap_size=268435456",
     )
 
+    def __init__(
+        self,
+        path: str = SQLITE_PATH,
+        read_only: bool = False,
+        statement_cache: int = STATEMENT_CACHE_SIZE,
+    ) -> None:
+        self.path = path
+        self.read_only = read_only
+        self.statement_cache = statement_cache
+        sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+        sqlite3.register_converter(
+            "DATETIME", lambda value: datetime.fromisoformat(value.decode())
+        )
 
-def print_summary() -> None:
-    banner = "=" * 40
-    print(banner)
-    print(FEATURES_TEXT)
-    print(SETUP_TEXT)
-    print("Templates + SQL written to:", TEMPLATES_DIR)
-    print("Schema file:", SCHEMA_FILE)
-    print(banner)
+    def connect(self):
+        if self.read_only:
+            target = f"{Path(self.path).resolve().as_uri()}?mode=ro"
+        else:
+            target = self.path
+        conn = sqlite3.connect(
+            target,
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            uri=self.read_only,
+            cached_statements=self.statement_cache,
+        )
+        # journal_mode is a write; a read-only handle inherits the file's mode.
+        for pragma in self.PRAGMAS[1:] if self.read_only else self.PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn
 
+    def connect_for_migration(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        return self.connect()
 
-if __name__ == "__main__":
-    ensure_assets()
-    create_tables()
-    print_summary()
-    app.run(debug=True)
+    def cursor(self, conn, dictionary: bool = False, stream: bool = False):
+        cursor = conn.cursor()
+        if dictionary:
+            cursor.row_factory = _dict_row
+        return cursor
+
+    def sql(self, text: str) -> str:
+        return text.replace("%s", "?")
+
+    def ping(self, conn) -> None:
+        conn.execute("SELECT 1")
+
+    def upsert_add(
+        self, table: str, keys: Tuple[str, ...], columns: Tuple[str, ...]
+    ) -> str:
+        names = (*keys, *columns)
+        increments = ", ".join(
+            f"{column} = {column} + excluded.{column}" for column in columns
+        )
+        return (
+            f"INSERT INTO {table} ({', '.join(names)}) "
+            f"VALUES ({', '.join(['%s'] * len(names))}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {increments}"
+        )
+
+    def schema_version(self, cursor) -> int:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+            "AND name = 'schema_migrations'"
+        )
+        if cursor.fetchone() is None:
+            return 0
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        (version,) = cursor.fetchone()
+        return version or 0
+
+    def explain(self, cursor, sql: str, params: Tuple, min_rows: int = 0) -> List[str]:
+        cursor.execute(f"EXPLAIN QUERY PLAN {self.sql(sql)}", params)
+        bounded = " LIMIT " in sql.upper()
+        problems = []
+        for row in cursor.fetchall():
+            detail = row["detail"] if isinstance(row, dict) else row[-1]
+            if detail.startswith("SCAN ") and not bounded:
+                problems.append(f"full scan: {detail}")
+            if "TEMP B-TREE" in detail:
+                problems.append(f"sort without index: {detail}")
+        return problems
+
+    def query_plan(self, cursor, sql: str, params: Tuple) -> List[str]:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row["detail"] for row in cursor.fetchall()]
+
+    def search(
+        self, table: str, key: str, words: List[str], limit: int
+    ) -> Tuple[str, Tuple]:
+        fts = f"{table}_fts"
+        fields = ", ".join(
+            f"t.{column}" for column in [key] + [c for c, *_ in TABLE_COLUMNS[table]]
+        )
+        weights = ", ".join(str(weight) for _, weight in SEARCH_FIELDS[table])
+        terms = " AND ".join(f'("{word}" OR "{word}"*)' for word in words)
+        # bm25() is lower-is-better; negate it so both backends rank descending.
+        # The exact term is OR-ed in so whole-word matches outrank prefix ones.
+        # Every match is scored, but only the top `limit` rowids are kept (a
+        # bounded sort) before joining the base table.
+        ranked = (
+            f"SELECT rowid, bm25({fts}, {weights}) AS rank FROM {fts} "
+            f"WHERE {fts} MATCH %s ORDER BY rank, rowid LIMIT %s"
+        )
+        return (
+            f"SELECT {fields}, -f.rank AS score FROM ({ranked}) f "
+            f"JOIN {table} t ON t.{key} = f.rowid ORDER BY score DESC, t.{key}",
+            (terms, limit),
+        )
+
+    def replica(self, address: str) -> "SQLiteBackend":
+        return SQLiteBackend(address, True, self.statement_cache)
+
+    def replica_lag(self, conn) -> Optional[float]:
+        # A replica here is a file kept in sync outside the app (a LiteFS mount,
+        # a restored Litestream copy), which reports no lag of its own; with
+        # the lag unknown the replica is never chosen.
+        return None
+
+
+BACKENDS = {"mysql": MySQLBackend, "sqlite": SQLiteBackend}
+
+_backend: Optional[Backend] = None
+
+
+def get_backend() -> Backend:
+    global _backend
+    if _backend is None:
+        if DB_BACKEND not in BACKENDS:
+            raise RuntimeError(
+                f"DB_BACKEND must be one of {', '.join(BACKENDS)}, got {DB_BACKEND!r}"
+            )
+        _backend = BACKENDS[DB_BACKEND]()
+    return _backend
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+METRIC_HELP = {
+    "sms_http_request_duration_seconds": (
+        "histogram",
+        "Time spent in the app per request, up to the response headers",
+    ),
+    "sms_db_query_duration_seconds": (
+        "histogram",
+        "Statement execute time by normalized SQL",
+    ),
+    "sms_db_fetch_seconds_total": ("counter", "Time spent fetching result rows"),
+    "sms_db_rows_fetched_total": ("counter", "Result rows fetched"),
+    "sms_db_slow_queries_total": ("counter", "Statements slower than SLOW_QUERY_MS"),
+    "sms_db_checkout_duration_seconds": (
+        "histogram",
+        "Time to check a connection out of the pool, including waits",
+    ),
+    "sms_db_connect_duration_seconds": (
+        "histogram",
+        "Time to open a new database connection",
+    ),
+    "sms_template_render_duration_seconds": ("histogram", "Template render time"),
+    "sms_group_commit_batches_total": (
+        "counter",
+        "Transactions committed for single marks edits",
+    ),
+    "sms_group_commit_writes_total": (
+        "counter",
+        "Single marks edits applied by those transactions",
+    ),
+    "sms_feed_events_total": ("counter", "Change feed events published"),
+}
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s|\?")
+_SQL_LISTS = re.compile(r"\(\?(?:, \?)+\)")
+_SQL_ROWS = re.compile(r"\(\?\)(?:, \(\?\))+")
+_SQL_CASE_ARMS = re.compile(r"(?:WHEN \? THEN \? )+")
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize_sql(sql: str) -> str:
+    sql = _SQL_LITERALS.sub("?", " ".join(sql.split()))
+    sql = _SQL_ROWS.sub("(?)", _SQL_LISTS.sub("(?)", sql))
+    return _SQL_CASE_ARMS.sub("WHEN ? THEN ? ", sql)
+
+
+def _label_value(value: Any) -> str:
+    text = str(value)
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: Iterable[str]) -> str:
+    pairs = list(pairs)
+    return f"{{{','.join(pairs)}}}" if pairs else ""
+
+
+class Metrics:
+    def __init__(self, directory: Optional[str] = METRICS_DIR) -> None:
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.histograms: Dict[Tuple, List[Any]] = {}
+        self.counters: Dict[Tuple, float] = {}
+        self.queries: Dict[str, str] = {}
+        self.labels: set = set()
+        self.version = 0
+        self.flushed = -1
+        self.flusher: Optional[threading.Thread] = None
+
+    def query_label(self, sql: str) -> str:
+        label = self.queries.get(sql)
+        if label is None:
+            label = normalize_sql(sql)
+            if label not in self.labels:
+                if len(self.labels) >= METRICS_MAX_QUERIES:
+                    return "other"
+                self.labels.add(label)
+            if len(self.queries) >= METRICS_MAX_QUERIES:
+                # raw statements vary with IN lists and CASE arms; only the
+                # number of distinct labels is capped
+                self.queries.clear()
+            self.queries[sql] = label
+        return label
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+            entry[0][bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+            entry[1] += value
+            self.version += 1
+
+    def inc(self, name: str, amount: float = 1, **labels: Any) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self.version += 1
+
+    def snapshot(self) -> Tuple[Dict, Dict]:
+        with self.lock:
+            histograms = {
+                key: [list(counts), total]
+                for key, (counts, total) in self.histograms.items()
+            }
+            return histograms, dict(self.counters)
+
+    def start_flusher(self) -> None:
+        if self.directory and self.flusher is None:
+            self.flusher = threading.Thread(
+                target=self._flush_loop, name="metrics-flush", daemon=True
+            )
+            self.flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(METRICS_FLUSH)
+            if self.version != self.flushed:
+                self.flush()
+
+    def flush(self) -> None:
+        if not self.directory:
+            return
+        self.flushed = self.version
+        path = os.path.join(self.directory, f"{os.getpid()}.metrics")
+        try:
+            with open(f"{path}.tmp", "wb") as handle:
+                pickle.dump(self.snapshot(), handle, pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.tmp", path)
+        except OSError:
+            pass
+
+    def collect(self) -> Tuple[Dict, Dict]:
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        histograms: Dict[Tuple, List[Any]] = {}
+        counters: Dict[Tuple, float] = {}
+        # every worker writes its own snapshot; a dead worker's file is kept
+        # so counters stay monotonic across restarts
+        for path in Path(self.directory).glob("*.metrics"):
+            try:
+                with open(path, "rb") as handle:
+                    worker_histograms, worker_counters = pickle.load(handle)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            for key, (counts, total) in worker_histograms.items():
+                entry = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+            for key, value in worker_counters.items():
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+    def render(self) -> str:
+        histograms, counters = self.collect()
+        lines: List[str] = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            series = histograms if kind == "histogram" else counters
+            keys = sorted(key for key in series if key[0] == name)
+            if not keys:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in keys:
+                labels = [f'{label}="{_label_value(value)}"' for label, value in key[1]]
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {series[key]}")
+                    continue
+                counts, total = series[key]
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                    cumulative += count
+                    bucket = _labels(labels + [f'le="{bound}"'])
+                    lines.append(f"{name}_bucket{bucket} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def reset_metrics_flusher() -> None:
+    metrics.flusher = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_metrics_flusher)
+
+
+class RequestTimings:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.phases: Dict[str, List[float]] = {}
+        self.slow: List[List[Any]] = []
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self.lock:
+            entry = self.phases.setdefault(phase, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def server_timing(self) -> str:
+        parts = []
+        for phase in ("connect", "db", "fetch", "render"):
+            if phase in self.phases:
+                count, seconds = self.phases[phase]
+                part = f"{phase};dur={seconds * 1000:.2f}"
+                if phase == "db":
+                    part += f';desc="{int(count)} queries"'
+                parts.append(part)
+        elapsed = time.perf_counter() - self.started
+        parts.append(f"app;dur={elapsed * 1000:.2f}")
+        return ", ".join(parts)
+
+
+class TimedCursor:
+    def __init__(
+        self, cursor, timings: RequestTimings, pool: Optional["ConnectionPool"] = None
+    ) -> None:
+        self._cursor = cursor
+        self._timings = timings
+        self._pool = pool
+        self._query = ""
+        self._statement: List[Any] = []
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _charge(self, elapsed: float) -> None:
+        # a statement is slow on its execute plus fetch time; it is reported
+        # once, and its logged duration keeps growing while rows are fetched
+        statement = self._statement
+        statement[2] += elapsed
+        if statement[3] or statement[2] * 1000 < SLOW_QUERY_MS:
+            return
+        statement[3] = True
+        metrics.inc("sms_db_slow_queries_total", query=self._query)
+        with self._timings.lock:
+            self._timings.slow.append(statement)
+
+    def _execute(self, method: Callable, sql: str, params: Any) -> Any:
+        self._query = metrics.query_label(sql)
+        self._statement = [sql, params, 0.0, False, self._pool]
+        started = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._timings.add("db", elapsed)
+            metrics.observe("sms_db_query_duration_seconds", elapsed, query=self._query)
+            self._charge(elapsed)
+
+    def execute(self, sql: str, params: Any = ()) -> Any:
+        return self._execute(self._cursor.execute, sql, params)
+
+    def executemany(self, sql: str, rows: Any) -> Any:
+        return self._execute(self._cursor.executemany, sql, rows)
+
+    def _fetch(self, method: Callable, *args: Any) -> Any:
+        started = time.perf_counter()
+        result = method(*args)
+        elapsed = time.perf_counter() - started
+        self._timings.add("fetch", elapsed)
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        metrics.inc("sms_db_fetch_seconds_total", elapsed, query=self._query)
+        metrics.inc("sms_db_rows_fetched_total", rows, query=self._query)
+        if self._statement:
+            self._charge(elapsed)
+        return result
+
+    def fetchone(self) -> Any:
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size: int) -> Any:
+        return self._fetch(self._cursor.fetchmany, size)
+
+    def fetchall(self) -> Any:
+        return self._fetch(self._cursor.fetchall)
+
+
+def request_timings() -> Optional[RequestTimings]:
+    return g.get("timings") if INSTRUMENTATION else None
+
+
+def start_timings() -> None:
+    if INSTRUMENTATION:
+        g.timings = RequestTimings()
+
+
+def record_timings(response: Response) -> Response:
+    timings = g.get("timings")
+    if timings is None:
+        return response
+    endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+    metrics.observe(
+        "sms_http_request_duration_seconds",
+        time.perf_counter() - timings.started,
+        method=request.method,
+        endpoint=endpoint,
+        status=response.status_code,
+    )
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = timings.server_timing()
+    metrics.start_flusher()
+    return response
+
+
+def _template_started(sender, template, context, **extra) -> None:
+    if "timings" in g:
+        g.template_started = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra) -> None:
+    started = g.pop("template_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    g.timings.add("render", elapsed)
+    metrics.observe(
+        "sms_template_render_duration_seconds", elapsed, template=template.name
+    )
+
+
+_explained: Dict[str, float] = {}
+
+
+def explain(backend: "Backend", conn, sql: str, params: Any) -> List[str]:
+    cursor = backend.cursor(conn, dictionary=True, stream=False)
+    try:
+        return backend.query_plan(cursor, sql, params)
+    except backend.Error as exc:
+        return [f"EXPLAIN failed: {backend.error_message(exc)}"]
+    finally:
+        cursor.close()
+
+
+def log_slow_queries(repo: "Repository", slow: List[List[Any]]) -> None:
+    now = time.monotonic()
+    for sql, params, elapsed, _, pool in slow[:SLOW_QUERY_LOG_LIMIT]:
+        query = metrics.query_label(sql)
+        message = f"slow query {elapsed * 1000:.1f} ms: {query}"
+        if now - _explained.get(query, -SLOW_QUERY_EXPLAIN_INTERVAL) >= (
+            SLOW_QUERY_EXPLAIN_INTERVAL
+        ):
+            _explained[query] = now
+            if isinstance(params, list):
+                params = params[0] if params else ()
+            # explain on the server that ran the query: a replica's plan can
+            # differ from the primary's (other indexes, other statistics)
+            if pool is None or pool is _pool:
+                plan = explain(repo.backend, repo.conn, sql, params)
+            else:
+                try:
+                    conn = pool.acquire()
+                except PoolTimeout as exc:
+                    plan = [f"EXPLAIN skipped: {exc}"]
+                else:
+                    try:
+                        plan = explain(pool.backend, conn, sql, params)
+                    finally:
+                        pool.release(conn)
+            message += "".join(f"\n    {line}" for line in plan)
+        app.logger.warning(message)
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        backend: Backend,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        timeout: float = POOL_TIMEOUT,
+        recycle: float = POOL_RECYCLE,
+    ) -> None:
+        self.backend = backend
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle: List[Tuple[object, float]] = []
+        self._created_at: Dict[int, float] = {}
+        self._in_use = 0
+        self._lock = threading.Condition()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _open(self):
+        started = time.perf_counter()
+        conn = self.backend.connect()
+        if INSTRUMENTATION:
+            metrics.observe(
+                "sms_db_connect_duration_seconds", time.perf_counter() - started
+            )
+        with self._lock:
+            self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn) -> None:
+        with self._lock:
+            self._created_at.pop(id(conn), None)
+            self._discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, idle_since: float) -> bool:
+        now = time.monotonic()
+        created = self._created_at.get(id(conn), 0.0)
+        if self.recycle and now - created > self.recycle:
+            return False
+        if now - idle_since < POOL_PING_INTERVAL:
+            return True
+        try:
+            self.backend.ping(conn)
+        except Exception:
+            return False
+        return True
+
+    def fill(self) -> None:
+        while True:
+            with self._lock:
+                if len(self._idle) + self._in_use >= self.min_size:
+                    return
+                self._in_use += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._in_use -= 1
+                self._idle.append((conn, time.monotonic()))
+                self._lock.notify()
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            # The lock only guards the bookkeeping: a slot is taken here and
+            # the ping, close or connect happens after it is released.
+            with self._lock:
+                while not self._idle and self._in_use >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            "No database connection available after "
+                            f"{self.timeout:.1f}s "
+                            f"({self._in_use}/{self.max_size} in use)"
+                        )
+                    self._lock.wait(remaining)
+                self._in_use += 1
+                idle = self._idle.pop() if self._idle else None
+            if idle is None:
+                break
+            conn, idle_since = idle
+            if self._healthy(conn, idle_since):
+                return self._checked_out(conn, started)
+            self._discard(conn)
+            with self._lock:
+                self._in_use -= 1
+        try:
+            conn = self._open()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        return self._checked_out(conn, started)
+
+    def _checked_out(self, conn, started: float):
+        waited = time.monotonic() - started
+        with self._lock:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn, discard: bool = False) -> None:
+        if not discard:
+            try:
+                discard = not self.backend.reset(conn)
+            except Exception:
+                discard = True
+        with self._lock:
+            self._in_use -= 1
+            if not discard:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+        if discard:
+            self._discard(conn)
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_avg_ms": round(self._wait_total / self._checkouts * 1000, 3)
+                if self._checkouts
+                else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(get_backend())
+                _pool.fill()
+    return _pool
+
+
+class Replica:
+    def __init__(self, address: str, pool: ConnectionPool) -> None:
+        self.address = address
+        self.pool = pool
+        self.lag: Optional[float] = None
+        self.synced = 0.0
+        self.checked = float("-inf")
+        self.error: Optional[str] = None
+
+    def refresh(self) -> None:
+        checked = time.time()
+        try:
+            conn = self.pool.acquire()
+        except Exception as exc:
+            self.lag, self.error = None, str(exc)
+        else:
+            try:
+                self.lag, self.error = self.pool.backend.replica_lag(conn), None
+            except Exception as exc:
+                self.lag, self.error = None, str(exc)
+            self.pool.release(conn, discard=self.error is not None)
+        if self.lag is not None:
+            self.synced = checked - self.lag
+        self.checked = checked
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "address": self.address,
+            "lag": self.lag,
+            "checked_ago": round(time.time() - self.checked, 3),
+            "error": self.error,
+            **self.pool.stats(),
+        }
+
+
+class ReplicaSet:
+    def __init__(
+        self,
+        replicas: List[Replica],
+        max_lag: float = REPLICA_MAX_LAG,
+        interval: float = REPLICA_LAG_INTERVAL,
+    ) -> None:
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.interval = interval
+        self.checkers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start_checkers(self) -> None:
+        with self._lock:
+            if self.checkers:
+                return
+            for replica in self.replicas:
+                checker = threading.Thread(
+                    target=self._check_loop,
+                    args=(replica,),
+                    name=f"replica-lag-{replica.address}",
+                    daemon=True,
+                )
+                checker.start()
+                self.checkers.append(checker)
+
+    def _check_loop(self, replica: Replica) -> None:
+        # each replica is checked on its own thread, so a slow or unreachable
+        # one never holds up a request or the checks of the others
+        while True:
+            replica.refresh()
+            if self._stopped.wait(self.interval):
+                return
+
+    def close(self) -> None:
+        self._stopped.set()
+
+    def choose(self, since: float) -> Optional[Replica]:
+        # A replica qualifies when its last lag check is recent, shows it had
+        # applied every commit up to `since` (the newest write the reader must
+        # see) and is within REPLICA_MAX_LAG; the least busy of those serves
+        # the read.
+        if not self.checkers:
+            self.start_checkers()
+        eligible = []
+        for replica in self.replicas:
+            if time.time() - replica.checked > 2 * self.interval:
+                continue
+            lag = replica.lag
+            if lag is not None and lag <= self.max_lag and replica.synced > since:
+                eligible.append(replica)
+        if not eligible:
+            return None
+        return min(eligible, key=lambda replica: replica.pool.in_use)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [replica.stats() for replica in self.replicas]
+
+
+_replicas: Optional[ReplicaSet] = None
+
+
+def get_replicas() -> Optional[ReplicaSet]:
+    global _replicas
+    if _replicas is None and DB_REPLICAS:
+        with _pool_lock:
+            if _replicas is None:
+                backend = get_backend()
+                _replicas = ReplicaSet(
+                    [
+                        Replica(address, ConnectionPool(backend.replica(address)))
+                        for address in DB_REPLICAS
+                    ]
+                )
+    return _replicas
+
+
+def reset_pool() -> None:
+    global _pool, _pool_lock, _replicas
+    if _replicas is not None:
+        _replicas.close()
+    _pool = None
+    _replicas = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_pool)
+
+
+def checkout(pool: ConnectionPool, timings: Optional[RequestTimings]):
+    started = time.perf_counter()
+    conn = pool.acquire()
+    if timings is not None:
+        elapsed = time.perf_counter() - started
+        timings.add("connect", elapsed)
+        metrics.observe("sms_db_checkout_duration_seconds", elapsed)
+    return conn
+
+
+def get_connection():
+    if "db" not in g:
+        g.db = checkout(get_pool(), request_timings())
+    return g.db
+
+
+def get_repository() -> "Repository":
+    if "repo" not in g:
+        g.repo = Repository(get_backend(), timings=request_timings())
+    return g.repo
+
+
+def last_write() -> float:
+    try:
+        return float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return 0.0
+
+
+def checkout_replica(pool: ConnectionPool):
+    conn = checkout(pool, request_timings())
+    g.setdefault("replica_db", []).append((pool, conn))
+    return conn
+
+
+def get_read_repository(*tables: str) -> "Repository":
+    replicas = get_replicas()
+    # CLI commands such as export run in an app context only and read the primary
+    if (
+        replicas is None
+        or not has_request_context()
+        or request.method not in ("GET", "HEAD")
+    ):
+        return get_repository()
+    # Results are cached under the current table versions, so a replica must
+    # already hold the last write to these tables, and this client's own.
+    since = max(table_versions.modified(*tables) or 0.0, last_write())
+    replica = replicas.choose(since)
+    if replica is None:
+        return get_repository()
+    repos = g.setdefault("replica_repos", {})
+    if replica.address not in repos:
+        repos[replica.address] = Repository(
+            replica.pool.backend,
+            acquire=functools.partial(checkout_replica, replica.pool),
+            timings=request_timings(),
+            pool=replica.pool,
+        )
+    return repos[replica.address]
+
+
+def remember_write(response: Response) -> Response:
+    if (
+        DB_REPLICAS
+        and request.method in ("POST", "PUT", "PATCH", "DELETE")
+        and response.status_code < 400
+    ):
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            f"{time.time():.3f}",
+            max_age=math.ceil(REPLICA_MAX_LAG + REPLICA_LAG_INTERVAL),
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+def release_connection(error: Optional[BaseException] = None) -> None:
+    timings = g.pop("timings", None)
+    repo = g.pop("repo", None)
+    g.pop("replica_repos", None)
+    if timings is not None and timings.slow and error is None:
+        log_slow_queries(repo or Repository(get_backend()), timings.slow)
+    conn = g.pop("db", None)
+    if conn is not None:
+        get_pool().release(conn, discard=isinstance(error, get_backend().Error))
+    for pool, replica_conn in g.pop("replica_db", []):
+        pool.release(replica_conn, discard=isinstance(error, pool.backend.Error))
+
+
+class MigrationError(Exception):
+    pass
+
+
+def apply_migration(backend: Backend, cursor, migration: Migration) -> None:
+    if migration.precheck is not None:
+        reason = migration.precheck(cursor)
+        if reason:
+            raise MigrationError(
+                f"migration {migration.version} ({migration.name}) blocked: {reason}"
+            )
+    for statement in migration.statements:
+        if backend.name not in statement:
+            continue
+        try:
+            cursor.execute(statement[backend.name])
+        except backend.Error as exc:
+            if not backend.ignorable_ddl_error(exc):
+                raise
+    cursor.execute(
+        backend.sql("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)"),
+        (migration.version, migration.name),
+    )
+
+
+def migrate(target: int = SCHEMA_VERSION) -> int:
+    backend = get_backend()
+    conn = backend.connect_for_migration()
+    cursor = conn.cursor()
+    try:
+        current = backend.schema_version(cursor)
+        if current >= target:
+            return current
+        backend.lock(cursor)
+        try:
+            cursor.execute(MIGRATIONS_DDL)
+            current = backend.schema_version(cursor)
+            for migration in MIGRATIONS:
+                if current < migration.version <= target:
+                    apply_migration(backend, cursor, migration)
+                    conn.commit()
+                    current = migration.version
+                    print(f"Applied migration {migration.version}: {migration.name}")
+        finally:
+            backend.unlock(cursor)
+        return current
+    finally:
+        cursor.close()
+        conn.close()
+
+
+STUDENT_LIST_SQL = "SELECT * FROM student"
+COURSE_LIST_SQL = "SELECT * FROM course"
+ENROLLMENT_LIST_SQL = """
+    SELECT e.enroll_id, s.name AS student_name, c.course_name, e.marks, e.enrolled_on
+    FROM enrollment e
+    JOIN student s ON e.student_id = s.student_id
+    JOIN course c ON e.course_id = c.course_id
+"""
+
+LISTINGS: Dict[str, Tuple[str, str, str]] = {
+    "students": (STUDENT_LIST_SQL, "student_id", "student_id"),
+    "courses": (COURSE_LIST_SQL, "course_id", "course_id"),
+    "enrollments": (ENROLLMENT_LIST_SQL, "e.enroll_id", "enroll_id"),
+}
+
+TABLE_KEYS = {"student": "student_id", "course": "course_id", "enrollment": "enroll_id"}
+TABLE_INVALIDATES = {
+    "student": ("student", "enrollment"),
+    "course": ("course", "enrollment"),
+    "enrollment": ("enrollment",),
+}
+
+LOOKUP_SQL = {
+    "student": "SELECT student_id AS id, name FROM student",
+    "course": "SELECT course_id AS id, course_name AS name FROM course",
+}
+LOOKUP_NAME_COLUMN = {"student": "name", "course": "course_name"}
+
+GENDERS = ("Male", "Female", "Other")
+
+TABLE_COLUMNS: Dict[str, List[Tuple[str, str, Any, bool]]] = {
+    "student": [
+        ("name", "varchar", 100, True),
+        ("age", "int", None, False),
+        ("gender", "enum", GENDERS, True),
+        ("department", "varchar", 100, False),
+        ("email", "varchar", 150, False),
+        ("phone", "varchar", 20, False),
+    ],
+    "course": [
+        ("course_name", "varchar", 150, True),
+        ("credits", "int", 0, False),
+        ("department", "varchar", 100, False),
+        ("description", "text", None, False),
+    ],
+    "enrollment": [
+        ("student_id", "int", None, True),
+        ("course_id", "int", None, True),
+        ("marks", "int", None, False),
+        ("enrolled_on", "datetime", None, False),
+    ],
+}
+
+INT_RANGES = {"marks": (0, 100)}
+
+ENTITY_TABLES = {
+    "students": "student",
+    "courses": "course",
+    "enrollments": "enrollment",
+}
+SEARCH_ENTITIES = ("students", "courses")
+
+
+@dataclass
+class Page:
+    rows: Iterable[Dict[str, Any]]
+    size: int
+    next_cursor: Optional[int] = None
+    prev_cursor: Optional[int] = None
+
+
+def _int_arg(name: str) -> Optional[int]:
+    value = request.args.get(name, "")
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def page_args() -> Tuple[Optional[int], Optional[int], int]:
+    size = _int_arg("size") or PAGE_SIZE
+    size = max(1, min(size, MAX_PAGE_SIZE))
+    return _int_arg("after"), _int_arg("before"), size
+
+
+def _like_prefix(text: str) -> str:
+    escaped = text.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    return escaped + "%"
+
+
+def validate_value(column: str, kind: str, spec: Any, required: bool, value: Any):
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == "":
+        if required:
+            raise ValueError(f"{column} is required")
+        if kind == "int" and spec is not None:
+            return spec
+        if kind == "datetime":
+            return datetime.now().replace(microsecond=0)
+        return None
+    if kind == "int":
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{column} must be an integer, got {value!r}")
+        low, high = INT_RANGES.get(column, (value, value))
+        if not low <= value <= high:
+            raise ValueError(f"{column} must be between {low} and {high}, got {value}")
+        return value
+    if kind == "enum":
+        if value not in spec:
+            raise ValueError(f"{column} must be one of {', '.join(spec)}")
+        return value
+    if kind == "datetime":
+        try:
+            return datetime.fromisoformat(str(value))
+        except ValueError:
+            raise ValueError(f"{column} must be an ISO date/time, got {value!r}")
+    value = str(value)
+    if kind == "varchar" and len(value) > spec:
+        raise ValueError(f"{column} is longer than {spec} characters")
+    return value
+
+
+def _check_fields(table: str, raw: Dict[str, Any], allowed: Iterable[str]) -> None:
+    unknown = sorted(set(raw) - set(allowed))
+    if unknown:
+        raise ValueError(f"unknown field(s) for {table}: {', '.join(unknown)}")
+
+
+def parse_marks(value: Any) -> Optional[int]:
+    return validate_value("marks", "int", None, False, value)
+
+
+def validate_row(table: str, raw: Dict[str, Any], strict: bool = False) -> Tuple:
+    if strict:
+        _check_fields(table, raw, [column for column, *_ in TABLE_COLUMNS[table]])
+    return tuple(
+        validate_value(*spec, raw.get(spec[0])) for spec in TABLE_COLUMNS[table]
+    )
+
+
+def validate_changes(table: str, raw: Dict[str, Any]) -> Dict[str, Any]:
+    specs = {spec[0]: spec for spec in TABLE_COLUMNS[table]}
+    _check_fields(table, raw, [TABLE_KEYS[table], *specs])
+    return {
+        column: validate_value(*specs[column], value)
+        for column, value in raw.items()
+        if column in specs
+    }
+
+
+API_FILTERS = {
+    "student": ("name", "department", "email"),
+    "course": ("course_name", "department"),
+    "enrollment": ("student_id", "course_id"),
+}
+
+
+def api_fields(table: str, requested: Optional[str]) -> List[str]:
+    key = TABLE_KEYS[table]
+    allowed = [key] + [column for column, *_ in TABLE_COLUMNS[table]]
+    if not requested:
+        return allowed
+    fields = [field.strip() for field in requested.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"unknown field(s) for {table}: {', '.join(unknown)}")
+    return [key] + [field for field in fields if field != key]
+
+
+def api_filters(table: str, args) -> List[Tuple[str, str, Any]]:
+    kinds = {column: kind for column, kind, *_ in TABLE_COLUMNS[table]}
+    filters = []
+    for column in API_FILTERS[table]:
+        value = args.get(column)
+        if value is None:
+            continue
+        if kinds[column] == "int":
+            try:
+                filters.append((column, "=", int(value)))
+            except ValueError:
+                raise ValueError(f"{column} must be an integer, got {value!r}")
+        elif value.endswith("*"):
+            filters.append((column, "LIKE", _like_prefix(value[:-1])))
+        else:
+            filters.append((column, "=", value))
+    return filters
+
+
+def select_sql(
+    table: str,
+    fields: List[str],
+    filters: List[Tuple[str, str, Any]],
+    after: Optional[int],
+    limit: int,
+) -> Tuple[str, Tuple]:
+    key = TABLE_KEYS[table]
+    clauses = [
+        f"{column} LIKE %s ESCAPE '!'" if op == "LIKE" else f"{column} = %s"
+        for column, op, _ in filters
+    ]
+    params = [value for *_, value in filters]
+    if after is not None:
+        clauses.append(f"{key} > %s")
+        params.append(after)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return (
+        f"SELECT {', '.join(fields)} FROM {table}{where} ORDER BY {key} LIMIT %s",
+        (*params, limit),
+    )
+
+
+def api_row(row: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    values = {}
+    for field in fields:
+        value = row[field]
+        values[field] = value.isoformat() if isinstance(value, datetime) else value
+    return values
+
+
+def read_records(stream, fmt: str) -> Iterator[Dict[str, Any]]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        yield from csv.DictReader(text)
+        return
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            record = ValueError(f"invalid JSON: {exc}")
+        yield record if isinstance(record, (dict, ValueError)) else ValueError(
+            "each line must be a JSON object"
+        )
+
+
+ENROLLMENT_FACTS_SQL = """
+    SELECT e.student_id, e.course_id, e.marks, c.credits
+    FROM enrollment e
+    JOIN course c ON c.course_id = e.course_id
+"""
+MARKS_FACTS_SQL = """
+    SELECT e.enroll_id, e.student_id, e.course_id, e.marks, c.credits
+    FROM enrollment e
+    JOIN course c ON c.course_id = e.course_id
+"""
+GRADE_SHEET_SQL = """
+    SELECT e.enroll_id, e.student_id, s.name AS student_name, s.email, e.marks
+    FROM enrollment e
+    JOIN student s ON s.student_id = e.student_id
+    WHERE e.course_id = %s
+    ORDER BY s.name, e.enroll_id
+"""
+
+
+class StatsDelta:
+    COURSE_COLUMNS = ("enrolled", "graded", "marks_sum", "marks_sq_sum")
+    STUDENT_COLUMNS = (
+        "enrolled",
+        "graded",
+        "credits",
+        "weighted_marks",
+        "grade_points",
+    )
+
+    def __init__(self) -> None:
+        self.courses: Dict[int, List[int]] = {}
+        self.marks: Dict[Tuple[int, int], int] = {}
+        self.students: Dict[int, List[int]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.courses or self.students)
+
+    def add(
+        self, student_id: int, course_id: int, marks: Any, credits: int, sign: int = 1
+    ) -> None:
+        course = self.courses.setdefault(course_id, [0] * len(self.COURSE_COLUMNS))
+        student = self.students.setdefault(
+            student_id, [0] * len(self.STUDENT_COLUMNS)
+        )
+        course[0] += sign
+        student[0] += sign
+        if marks is None or marks == "":
+            return
+        marks = int(marks)
+        course[1] += sign
+        course[2] += sign * marks
+        course[3] += sign * marks * marks
+        self.marks[(course_id, marks)] = self.marks.get((course_id, marks), 0) + sign
+        student[1] += sign
+        student[2] += sign * credits
+        student[3] += sign * marks * credits
+        student[4] += sign * grade_points(marks) * credits
+
+    def forget(self, table: str, row_id: int) -> None:
+        if table == "student":
+            self.students.pop(row_id, None)
+        elif table == "course":
+            self.courses.pop(row_id, None)
+            for key in [key for key in self.marks if key[0] == row_id]:
+                del self.marks[key]
+
+    def statements(self, backend: "Backend") -> Iterator[Tuple[str, List[Tuple]]]:
+        groups = [
+            ("course_stats", ("course_id",), self.COURSE_COLUMNS, self.courses),
+            ("student_stats", ("student_id",), self.STUDENT_COLUMNS, self.students),
+        ]
+        for table, keys, columns, deltas in groups:
+            rows = [(key, *values) for key, values in deltas.items() if any(values)]
+            if rows:
+                yield backend.upsert_add(table, keys, columns), rows
+        rows = [(*key, count) for key, count in self.marks.items() if count]
+        if rows:
+            yield backend.upsert_add(
+                "course_marks", ("course_id", "marks"), ("students",)
+            ), rows
+
+
+class Repository:
+    def __init__(
+        self,
+        backend: Backend,
+        conn=None,
+        acquire: Optional[Callable] = None,
+        timings: Optional[RequestTimings] = None,
+        pool: Optional[ConnectionPool] = None,
+    ) -> None:
+        self.backend = backend
+        self._conn = conn
+        self._acquire = acquire or get_connection
+        self.timings = timings
+        self.pool = pool
+        self.stats = StatsDelta()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = self._acquire()
+        return self._conn
+
+    def cursor(self, dictionary: bool = True, stream: bool = False):
+        cursor = self.backend.cursor(self.conn, dictionary=dictionary, stream=stream)
+        if self.timings is None:
+            return cursor
+        return TimedCursor(cursor, self.timings, self.pool)
+
+    def execute(self, cursor, sql: str, params: Tuple = ()):
+        cursor.execute(self.backend.sql(sql), params)
+        return cursor
+
+    def prepared(self, sql: str, params: Tuple = ()):
+        cursor, sql = self.backend.statement(self.conn, self.backend.sql(sql))
+        if self.timings is not None:
+            cursor = TimedCursor(cursor, self.timings, self.pool)
+        cursor.execute(sql, params)
+        return cursor
+
+    def fetch_all(
+        self, sql: str, params: Tuple = (), prepared: bool = False
+    ) -> List[Dict[str, Any]]:
+        if prepared and self.backend.prepares:
+            cursor = self.prepared(sql, params)
+            return [_dict_row(cursor, row) for row in cursor.fetchall()]
+        cursor = self.cursor()
+        try:
+            return self.execute(cursor, sql, params).fetchall()
+        finally:
+            cursor.close()
+
+    def run(
+        self, sql: str, params: Tuple = (), prepared: bool = False
+    ) -> Tuple[int, Optional[int]]:
+        if prepared and self.backend.prepares:
+            cursor = self.prepared(sql, params)
+            return cursor.rowcount, cursor.lastrowid
+        cursor = self.cursor(dictionary=False)
+        try:
+            self.execute(cursor, sql, params)
+            return cursor.rowcount, cursor.lastrowid
+        finally:
+            cursor.close()
+
+    def commit(self) -> None:
+        if self.stats:
+            cursor = self.cursor(dictionary=False)
+            try:
+                for sql, rows in self.stats.statements(self.backend):
+                    cursor.executemany(self.backend.sql(sql), rows)
+            finally:
+                cursor.close()
+            self.stats = StatsDelta()
+        self.conn.commit()
+
+    def rollback(self) -> None:
+        self.stats = StatsDelta()
+        self.conn.rollback()
+
+    def enrollment_facts(self, column: str, value: Any) -> List[Tuple]:
+        sql = f"{ENROLLMENT_FACTS_SQL} WHERE e.{column} = %s{self.backend.lock_rows}"
+        if self.backend.prepares:
+            return self.prepared(sql, (value,)).fetchall()
+        cursor = self.cursor(dictionary=False)
+        try:
+            return self.execute(cursor, sql, (value,)).fetchall()
+        finally:
+            cursor.close()
+
+    def track(self, facts: Iterable[Tuple], sign: int = 1) -> None:
+        for student_id, course_id, marks, credits in facts:
+            self.stats.add(student_id, course_id, marks, credits, sign)
+
+    def course_credits(self, course_ids: Iterable[int]) -> Dict[int, int]:
+        course_ids = sorted(set(course_ids))
+        placeholders = ", ".join(["%s"] * len(course_ids))
+        cursor = self.cursor(dictionary=False)
+        try:
+            self.execute(
+                cursor,
+                f"SELECT course_id, credits FROM course "
+                f"WHERE course_id IN ({placeholders})",
+                tuple(course_ids),
+            )
+            return dict(cursor.fetchall())
+        finally:
+            cursor.close()
+
+    def track_imported(self, rows: List[Tuple]) -> None:
+        credits = self.course_credits(row[1] for row in rows)
+        for student_id, course_id, marks, *_ in rows:
+            self.stats.add(student_id, course_id, marks, credits[course_id])
+
+    def page(
+        self,
+        listing: str,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        size: int = PAGE_SIZE,
+    ) -> Page:
+        sql, key, column = LISTINGS[listing]
+        if before is not None:
+            rows = self.fetch_all(
+                f"{sql} WHERE {key} < %s ORDER BY {key} DESC LIMIT %s",
+                (before, size + 1),
+                prepared=True,
+            )
+            has_more = len(rows) > size
+            rows = rows[:size][::-1]
+            return Page(
+                rows,
+                size,
+                next_cursor=rows[-1][column] if rows else None,
+                prev_cursor=rows[0][column] if rows and has_more else None,
+            )
+        if after is not None:
+            rows = self.fetch_all(
+                f"{sql} WHERE {key} > %s ORDER BY {key} LIMIT %s",
+                (after, size + 1),
+                prepared=True,
+            )
+        else:
+            rows = self.fetch_all(
+                f"{sql} ORDER BY {key} LIMIT %s", (size + 1,), prepared=True
+            )
+        has_more = len(rows) > size
+        rows = rows[:size]
+        return Page(
+            rows,
+            size,
+            next_cursor=rows[-1][column] if rows and has_more else None,
+            prev_cursor=rows[0][column] if rows and after is not None else None,
+        )
+
+    def exists(self, table: str, row_id: Any) -> bool:
+        key = TABLE_KEYS[table]
+        sql = f"SELECT 1 FROM {table} WHERE {key} = %s"
+        return bool(self.fetch_all(sql, (row_id,), prepared=True))
+
+    def listing_row(self, listing: str, row_id: Any) -> Optional[Dict[str, Any]]:
+        sql, key, _ = LISTINGS[listing]
+        rows = self.fetch_all(f"{sql} WHERE {key} = %s", (row_id,), prepared=True)
+        return rows[0] if rows else None
+
+    def batches(
+        self, sql: str, params: Tuple = (), chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> Iterator[Tuple[List[str], List[Tuple]]]:
+        cursor = self.cursor(dictionary=False, stream=True)
+        try:
+            self.execute(cursor, sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchmany(chunk_size)
+            yield columns, rows
+            while rows:
+                rows = cursor.fetchmany(chunk_size)
+                if rows:
+                    yield columns, rows
+        finally:
+            try:
+                cursor.close()
+            except self.backend.Error:
+                pass
+
+    def stream(self, listing: str) -> Iterator[Dict[str, Any]]:
+        sql, key, _ = LISTINGS[listing]
+        for columns, rows in self.batches(f"{sql} ORDER BY {key}"):
+            for row in rows:
+                yield dict(zip(columns, row))
+
+    def select(
+        self,
+        table: str,
+        fields: List[str],
+        filters: List[Tuple[str, str, Any]],
+        after: Optional[int] = None,
+        limit: int = PAGE_SIZE,
+    ) -> List[Dict[str, Any]]:
+        return self.fetch_all(*select_sql(table, fields, filters, after, limit))
+
+    def insert(self, table: str, values: Dict[str, Any]) -> Optional[int]:
+        columns = ", ".join(values)
+        placeholders = ", ".join(["%s"] * len(values))
+        _, row_id = self.run(
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+            tuple(values.values()),
+            prepared=True,
+        )
+        if table == "enrollment":
+            self.track(self.enrollment_facts("enroll_id", row_id))
+        return row_id
+
+    def update(self, table: str, row_id: Any, values: Dict[str, Any]) -> int:
+        key = TABLE_KEYS[table]
+        tracked = table == "enrollment" or (table == "course" and "credits" in values)
+        if tracked:
+            self.track(self.enrollment_facts(key, row_id), sign=-1)
+        assignments = ", ".join(f"{column}=%s" for column in values)
+        count, _ = self.run(
+            f"UPDATE {table} SET {assignments} WHERE {key}=%s",
+            (*values.values(), row_id),
+            prepared=True,
+        )
+        if tracked:
+            self.track(self.enrollment_facts(key, row_id))
+        return count
+
+    def delete(self, table: str, row_id: Any) -> int:
+        key = TABLE_KEYS[table]
+        self.track(self.enrollment_facts(key, row_id), sign=-1)
+        if table != "enrollment":
+            self.stats.forget(table, int(row_id))
+        count, _ = self.run(
+            f"DELETE FROM {table} WHERE {key}=%s", (row_id,), prepared=True
+        )
+        return count
+
+    def set_marks(
+        self, marks: Dict[int, Optional[int]], course_id: Optional[int] = None
+    ) -> Tuple[set, int]:
+        found, changed = set(), 0
+        ids = list(marks)
+        cursor = self.cursor(dictionary=False)
+        try:
+            for start in range(0, len(ids), MARKS_BATCH_SIZE):
+                chunk = ids[start : start + MARKS_BATCH_SIZE]
+                where = f"e.enroll_id IN ({', '.join(['%s'] * len(chunk))})"
+                if course_id is not None:
+                    where += " AND e.course_id = %s"
+                    chunk = chunk + [course_id]
+                self.execute(
+                    cursor,
+                    f"{MARKS_FACTS_SQL} WHERE {where}{self.backend.lock_rows}",
+                    tuple(chunk),
+                )
+                updates = []
+                for enroll_id, student_id, course, old, credits in cursor.fetchall():
+                    found.add(enroll_id)
+                    new = marks[enroll_id]
+                    if new == old:
+                        continue
+                    self.stats.add(student_id, course, old, credits, sign=-1)
+                    self.stats.add(student_id, course, new, credits)
+                    updates.append((enroll_id, new))
+                if not updates:
+                    continue
+                cases = " ".join(["WHEN %s THEN %s"] * len(updates))
+                placeholders = ", ".join(["%s"] * len(updates))
+                self.execute(
+                    cursor,
+                    f"UPDATE enrollment SET marks = CASE enroll_id {cases} END "
+                    f"WHERE enroll_id IN ({placeholders})",
+                    (
+                        *itertools.chain.from_iterable(updates),
+                        *(enroll_id for enroll_id, _ in updates),
+                    ),
+                )
+                changed += len(updates)
+        finally:
+            cursor.close()
+        return found, changed
+
+    def lookup_options(self, table: str, limit: int) -> List[Dict[str, Any]]:
+        return self.fetch_all(
+            f"{LOOKUP_SQL[table]} ORDER BY {LOOKUP_NAME_COLUMN[table]} LIMIT %s",
+            (limit,),
+            prepared=True,
+        )
+
+    def typeahead(self, table: str, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        column = LOOKUP_NAME_COLUMN[table]
+        return self.fetch_all(
+            f"{LOOKUP_SQL[table]} WHERE {column} LIKE %s ESCAPE '!' "
+            f"ORDER BY {column} LIMIT %s",
+            (_like_prefix(prefix), limit),
+            prepared=True,
+        )
+
+    def search(self, table: str, words: List[str], limit: int) -> List[Dict[str, Any]]:
+        sql, params = self.backend.search(table, TABLE_KEYS[table], words, limit)
+        rows = self.fetch_all(sql, params)
+        for row in rows:
+            row["score"] = round(float(row["score"]), 3)
+        return rows
+
+    def bulk_insert(self, table: str, records: Iterable[Any]) -> Dict[str, Any]:
+        columns = [column for column, *_ in TABLE_COLUMNS[table]]
+        sql = self.backend.sql(
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        cursor = self.cursor(dictionary=False)
+        started = time.perf_counter()
+        inserted = 0
+        errors: List[Dict[str, Any]] = []
+        error_count = 0
+
+        def record_error(row_number: int, message: str) -> None:
+            nonlocal error_count
+            error_count += 1
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append({"row": row_number, "error": message})
+
+        def flush(batch: List[Tuple[int, Tuple]]) -> None:
+            nonlocal inserted
+            if not batch:
+                return
+            try:
+                cursor.executemany(sql, [values for _, values in batch])
+                if table == "enrollment":
+                    self.track_imported([values for _, values in batch])
+                self.commit()
+                inserted += len(batch)
+                return
+            except self.backend.Error:
+                self.rollback()
+            for row_number, values in batch:
+                try:
+                    cursor.execute(sql, values)
+                    inserted += 1
+                except self.backend.Error as exc:
+                    record_error(row_number, self.backend.error_message(exc))
+                    continue
+                if table == "enrollment":
+                    self.track_imported([values])
+            self.commit()
+
+        batch: List[Tuple[int, Tuple]] = []
+        row_number = 0
+        for row_number, record in enumerate(records, start=1):
+            if isinstance(record, ValueError):
+                record_error(row_number, str(record))
+                continue
+            try:
+                batch.append((row_number, validate_row(table, record)))
+            except ValueError as exc:
+                record_error(row_number, str(exc))
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        flush(batch)
+        cursor.close()
+        elapsed = time.perf_counter() - started
+        return {
+            "table": table,
+            "rows": row_number,
+            "inserted": inserted,
+            "failed": error_count,
+            "errors": errors,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(row_number / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def explain(self, sql: str, params: Tuple, min_rows: int = 0) -> List[str]:
+        cursor = self.cursor()
+        try:
+            return self.backend.explain(
+                cursor, self.backend.sql(sql), params, min_rows
+            )
+        finally:
+            cursor.close()
+
+
+VERSIONED_TABLES = ("student", "course", "enrollment")
+
+LISTING_TABLES: Dict[str, Tuple[str, ...]] = {
+    "students": ("student",),
+    "courses": ("course",),
+    "enrollments": ("enrollment", "student", "course"),
+}
+
+
+class TableVersions:
+    SLOT = struct.Struct("Qd")
+
+    def __init__(self, tables: Tuple[str, ...] = VERSIONED_TABLES) -> None:
+        self.scope = os.urandom(8).hex()
+        self.offsets = {
+            table: index * self.SLOT.size for index, table in enumerate(tables)
+        }
+        self._shared = mmap.mmap(-1, self.SLOT.size * len(tables))
+        for offset in self.offsets.values():
+            self.SLOT.pack_into(self._shared, offset, 0, time.time())
+
+    def bump(self, *tables: str) -> None:
+        for table in tables:
+            stamp = int.from_bytes(os.urandom(8), "little")
+            self.SLOT.pack_into(self._shared, self.offsets[table], stamp, time.time())
+
+    def get(self, *tables: str) -> Tuple[int, ...]:
+        return tuple(
+            self.SLOT.unpack_from(self._shared, self.offsets[table])[0]
+            for table in tables
+        )
+
+    def modified(self, *tables: str) -> Optional[float]:
+        return max(
+            self.SLOT.unpack_from(self._shared, self.offsets[table])[1]
+            for table in tables
+        )
+
+
+class RedisTableVersions:
+    scope = "redis"
+
+    def __init__(self, client) -> None:
+        self.client = client
+
+    def bump(self, *tables: str) -> None:
+        now = time.time()
+        pipeline = self.client.pipeline(transaction=False)
+        for table in tables:
+            pipeline.incr(f"{REDIS_PREFIX}version:{table}")
+            pipeline.set(f"{REDIS_PREFIX}modified:{table}", now)
+        pipeline.execute()
+
+    def get(self, *tables: str) -> Tuple[int, ...]:
+        keys = [f"{REDIS_PREFIX}version:{table}" for table in tables]
+        values = self.client.mget(keys)
+        return tuple(int(value or 0) for value in values)
+
+    def modified(self, *tables: str) -> Optional[float]:
+        keys = [f"{REDIS_PREFIX}modified:{table}" for table in tables]
+        values = self.client.mget(keys)
+        if None in values:
+            return None
+        return max(float(value) for value in values)
+
+
+def redis_client():
+    if not REDIS_URL:
+        return None
+    try:
+        import redis
+    except ImportError:
+        print("Warning: REDIS_URL is set but redis is not installed; cache is local")
+        return None
+    return redis.Redis.from_url(REDIS_URL)
+
+
+_MISSING = object()
+
+
+class ResultCache:
+    def __init__(
+        self,
+        versions,
+        shared=None,
+        ttl: float = CACHE_TTL,
+        max_bytes: int = CACHE_MAX_BYTES,
+    ) -> None:
+        self.versions = versions
+        self.shared = shared
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._evictions = 0
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, namespace: str, outcome: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(
+                namespace, {"hits": 0, "shared_hits": 0, "misses": 0}
+            )
+            counts[outcome] += 1
+
+    def _local_get(self, key: Tuple, versions: Tuple[int, ...]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] == versions and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[3]
+            del self._entries[key]
+            self._bytes -= entry[2]
+            return _MISSING
+
+    def _local_put(
+        self, key: Tuple, versions: Tuple[int, ...], ttl: float, size: int, value: Any
+    ) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (versions, time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self._evictions += 1
+
+    def _shared_key(self, key: Tuple, versions: Tuple[int, ...]) -> str:
+        digest = hashlib.sha1(repr((key, versions)).encode("utf-8")).hexdigest()
+        return f"{REDIS_PREFIX}result:{digest}"
+
+    def get_or_load(
+        self,
+        key: Tuple,
+        tables: Tuple[str, ...],
+        loader: Callable[[], Any],
+        ttl: Optional[float] = None,
+    ) -> Any:
+        if self.max_bytes <= 0:
+            return loader()
+        ttl = self.ttl if ttl is None else ttl
+        namespace = key[0]
+        try:
+            versions = self.versions.get(*tables)
+        except Exception:
+            return loader()
+        value = self._local_get(key, versions)
+        if value is not _MISSING:
+            self._count(namespace, "hits")
+            return value
+        payload = None
+        if self.shared is not None:
+            try:
+                payload = self.shared.get(self._shared_key(key, versions))
+            except Exception:
+                payload = None
+        if payload is not None:
+            value = pickle.loads(payload)
+            self._count(namespace, "shared_hits")
+        else:
+            value = loader()
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            self._count(namespace, "misses")
+            if self.shared is not None:
+                try:
+                    self.shared.setex(
+                        self._shared_key(key, versions), max(1, int(ttl)), payload
+                    )
+                except Exception:
+                    pass
+        self._local_put(key, versions, ttl, len(payload), value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            namespaces = {}
+            totals = {"hits": 0, "shared_hits": 0, "misses": 0}
+            for namespace, counts in sorted(self._counts.items()):
+                lookups = sum(counts.values())
+                namespaces[namespace] = {
+                    **counts,
+                    "hit_ratio": round((lookups - counts["misses"]) / lookups, 4),
+                }
+                for outcome, count in counts.items():
+                    totals[outcome] += count
+            lookups = sum(totals.values())
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "shared": self.shared is not None,
+                "evictions": self._evictions,
+                **totals,
+                "hit_ratio": round((lookups - totals["misses"]) / lookups, 4)
+                if lookups
+                else 0.0,
+                "namespaces": namespaces,
+            }
+
+
+_redis = redis_client()
+table_versions = RedisTableVersions(_redis) if _redis else TableVersions()
+result_cache = ResultCache(table_versions, shared=_redis)
+
+
+def bump_version(*tables: str) -> None:
+    table_versions.bump(*tables)
+
+
+@dataclass
+class PendingMarks:
+    enroll_id: int
+    marks: Optional[int]
+    done: bool = False
+    found: bool = False
+    error: Optional[Exception] = None
+    row: Optional[str] = None
+
+
+class GroupCommitter:
+    def __init__(
+        self, delay: float = GROUP_COMMIT_DELAY, max_batch: int = GROUP_COMMIT_MAX
+    ) -> None:
+        self.delay = delay
+        self.max_batch = max_batch
+        self._queue: List[PendingMarks] = []
+        self._flushing = False
+        self._ready = threading.Condition()
+
+    def submit(
+        self, repo: Repository, enroll_id: int, marks: Optional[int]
+    ) -> PendingMarks:
+        pending = PendingMarks(enroll_id, marks)
+        with self._ready:
+            self._queue.append(pending)
+        while True:
+            with self._ready:
+                while self._flushing and not pending.done:
+                    self._ready.wait()
+                if pending.done:
+                    break
+                self._flushing = True
+            try:
+                if self.delay:
+                    time.sleep(self.delay)
+                with self._ready:
+                    batch = self._queue[: self.max_batch]
+                    del self._queue[: self.max_batch]
+                self._flush(repo, batch)
+            finally:
+                with self._ready:
+                    self._flushing = False
+                    self._ready.notify_all()
+        if pending.error is not None:
+            raise pending.error
+        return pending
+
+    def _flush(self, repo: Repository, batch: List[PendingMarks]) -> None:
+        marks = {pending.enroll_id: pending.marks for pending in batch}
+        try:
+            found, _ = repo.set_marks(marks)
+            repo.commit()
+        except Exception as exc:
+            try:
+                repo.rollback()
+            except repo.backend.Error:
+                pass
+            for pending in batch:
+                pending.error = exc
+                pending.done = True
+            return
+        if found:
+            bump_version("enrollment")
+        if INSTRUMENTATION:
+            metrics.inc("sms_group_commit_batches_total")
+            metrics.inc("sms_group_commit_writes_total", len(batch))
+        for pending in batch:
+            pending.found = pending.enroll_id in found
+        try:
+            if CHANGE_FEED:
+                # the rendered row also answers each submitter's fragment request
+                for pending in batch:
+                    if pending.found:
+                        pending.row = publish_row(
+                            repo, "enrollments", "update", pending.enroll_id
+                        )
+        finally:
+            for pending in batch:
+                pending.done = True
+
+
+grade_committer = GroupCommitter()
+
+
+class FeedRing:
+    HEADER = struct.Struct("Q")
+    SLOT = struct.Struct("QI")
+
+    def __init__(
+        self, slots: int = FEED_SLOTS, slot_size: int = FEED_SLOT_SIZE
+    ) -> None:
+        self.slots = slots
+        self.slot_size = slot_size
+        self._shared = mmap.mmap(-1, self.HEADER.size + slots * slot_size)
+        self.HEADER.pack_into(self._shared, 0, 1)
+        self._lock = threading.Lock()
+        # lockf() locks are held per process, so forked workers exclude each
+        # other through this file, and a worker that dies mid-write lets go.
+        self._lockfile = tempfile.TemporaryFile() if fcntl else None
+
+    def _offset(self, seq: int) -> int:
+        return self.HEADER.size + (seq % self.slots) * self.slot_size
+
+    def latest(self) -> int:
+        return self.HEADER.unpack_from(self._shared, 0)[0] - 1
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        payload = json.dumps(event).encode("utf-8")
+        if len(payload) > self.slot_size - self.SLOT.size:
+            payload = json.dumps({"listing": event["listing"], "action": "stale"})
+            payload = payload.encode("utf-8")
+        with self._lock:
+            if self._lockfile is not None:
+                fcntl.lockf(self._lockfile, fcntl.LOCK_EX)
+            try:
+                seq = self.latest() + 1
+                offset = self._offset(seq)
+                start = offset + self.SLOT.size
+                self.SLOT.pack_into(self._shared, offset, 0, 0)
+                self._shared[start : start + len(payload)] = payload
+                self.SLOT.pack_into(self._shared, offset, seq, len(payload))
+                self.HEADER.pack_into(self._shared, 0, seq + 1)
+            finally:
+                if self._lockfile is not None:
+                    fcntl.lockf(self._lockfile, fcntl.LOCK_UN)
+
+    def read(self, seq: int) -> Optional[Dict[str, Any]]:
+        offset = self._offset(seq)
+        found, length = self.SLOT.unpack_from(self._shared, offset)
+        start = offset + self.SLOT.size
+        payload = bytes(self._shared[start : start + length])
+        # the slot is zeroed while it is rewritten; a changed seq means it was
+        # reused, by a writer that lapped this reader, while being copied
+        if found != seq or self.SLOT.unpack_from(self._shared, offset)[0] != seq:
+            return None
+        return {**json.loads(payload), "seq": seq}
+
+    def listen(self, deliver: Callable[[Optional[Dict]], None], after: int) -> None:
+        while True:
+            time.sleep(FEED_POLL)
+            latest = self.latest()
+            first = max(after + 1, latest - self.slots + 1)
+            if first > after + 1:
+                deliver(None)
+            for seq in range(first, latest + 1):
+                deliver(self.read(seq))
+            after = latest
+
+
+class RedisFeed:
+    def __init__(self, client) -> None:
+        self.client = client
+        self.channel = f"{REDIS_PREFIX}changes"
+
+    def latest(self) -> int:
+        return int(self.client.get(f"{self.channel}:seq") or 0)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        seq = self.client.incr(f"{self.channel}:seq")
+        self.client.publish(self.channel, json.dumps({**event, "seq": seq}))
+
+    def listen(self, deliver: Callable[[Optional[Dict]], None], after: int) -> None:
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    deliver(json.loads(message["data"]))
+            except Exception:
+                deliver(None)
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+
+class FeedFull(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, listings: Iterable[str]) -> None:
+        self.listings = frozenset(listings)
+        self.events: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(
+            FEED_QUEUE_SIZE
+        )
+        self.reset = False
+        self.closed = False
+
+    def offer(self, event: Optional[Dict[str, Any]]) -> None:
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.reset = True
+
+
+class ChangeFeed:
+    def __init__(
+        self,
+        transport,
+        max_subscribers: int = FEED_MAX_SUBSCRIBERS,
+        history: int = FEED_HISTORY,
+    ) -> None:
+        self.transport = transport
+        self.max_subscribers = max_subscribers
+        self.lock = threading.Lock()
+        self.subscribers: List[Subscription] = []
+        self.pump: Optional[threading.Thread] = None
+        self.history: deque = deque(maxlen=history)
+        # events after `floor` up to `latest` are all in history (or were
+        # never for a listing anyone here follows)
+        self.floor: Optional[int] = None
+        self.latest = 0
+
+    def publish(
+        self,
+        listing: str,
+        action: str,
+        row_id: Optional[int] = None,
+        row: Optional[str] = None,
+    ) -> None:
+        try:
+            self.transport.publish(
+                {"listing": listing, "action": action, "id": row_id, "row": row}
+            )
+        except Exception:
+            # the write is already committed; followers reload on the next reset
+            return
+        if INSTRUMENTATION:
+            metrics.inc("sms_feed_events_total", listing=listing)
+
+    def subscribe(
+        self, listings: Iterable[str], last_id: Optional[int]
+    ) -> Subscription:
+        subscription = Subscription(listings)
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                raise FeedFull(
+                    f"at most {self.max_subscribers} change feed clients per worker"
+                )
+            if self.pump is None:
+                self.pump = threading.Thread(
+                    target=self._pump, name="change-feed", daemon=True
+                )
+                self.pump.start()
+            if last_id is not None:
+                if self.floor is None or not self.floor <= last_id <= self.latest:
+                    subscription.reset = True
+                for event in self.history:
+                    if (
+                        event["seq"] > last_id
+                        and event["listing"] in subscription.listings
+                    ):
+                        subscription.offer(event)
+            self.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    def close(self) -> None:
+        with self.lock:
+            for subscription in self.subscribers:
+                subscription.closed = True
+                subscription.offer(None)
+
+    def _pump(self) -> None:
+        try:
+            after = self.transport.latest()
+        except Exception:
+            after = None
+        with self.lock:
+            self.floor = after
+            self.latest = after or 0
+        self.transport.listen(self._deliver, after or 0)
+
+    def _deliver(self, event: Optional[Dict[str, Any]]) -> None:
+        with self.lock:
+            if event is None:
+                self.history.clear()
+                self.floor = None
+                for subscription in self.subscribers:
+                    subscription.reset = True
+                    subscription.offer(None)
+                return
+            if self.floor is None:
+                self.floor = event["seq"] - 1
+            elif len(self.history) == self.history.maxlen:
+                self.floor = self.history[0]["seq"]
+            self.history.append(event)
+            self.latest = event["seq"]
+            for subscription in self.subscribers:
+                if event["listing"] in subscription.listings:
+                    subscription.offer(event)
+
+
+change_feed = ChangeFeed(RedisFeed(_redis) if _redis else FeedRing())
+
+
+def reset_change_feed() -> None:
+    change_feed.lock = threading.Lock()
+    change_feed.subscribers = []
+    change_feed.pump = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_change_feed)
+
+
+def feed_stream(subscription: Subscription) -> Iterator[str]:
+    try:
+        yield f"retry: {FEED_RETRY_MS}\n\n"
+        while not subscription.closed:
+            if subscription.reset:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            try:
+                event = subscription.events.get(timeout=FEED_KEEPALIVE)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if event is not None:
+                yield f"id: {event['seq']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        change_feed.unsubscribe(subscription)
+
+
+def cached_page(
+    repo: Repository,
+    listing: str,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    size: int = PAGE_SIZE,
+) -> Page:
+    return result_cache.get_or_load(
+        (listing, after, before, size),
+        LISTING_TABLES[listing],
+        lambda: repo.page(listing, after, before, size),
+    )
+
+
+def cached_lookup(repo: Repository, table: str) -> Tuple[List[Dict[str, Any]], bool]:
+    def load() -> Tuple[List[Dict[str, Any]], bool]:
+        rows = repo.lookup_options(table, LOOKUP_INLINE_LIMIT + 1)
+        truncated = len(rows) > LOOKUP_INLINE_LIMIT
+        return ([] if truncated else rows), truncated
+
+    return result_cache.get_or_load(("lookup", table), (table,), load, ttl=LOOKUP_TTL)
+
+
+def search_words(query: str) -> List[str]:
+    words = [word for word in re.findall(r"\w+", query.lower()) if len(word) > 1]
+    return words[:SEARCH_MAX_WORDS]
+
+
+def cached_search(
+    repo: Repository, table: str, query: str, limit: int
+) -> List[Dict[str, Any]]:
+    words = search_words(query)
+    if not words:
+        return []
+    return result_cache.get_or_load(
+        ("search", table, " ".join(words), limit),
+        (table,),
+        lambda: repo.search(table, words, limit),
+    )
+
+
+_fanout: Optional[ThreadPoolExecutor] = None
+_fanout_lock = threading.Lock()
+
+
+def get_fanout() -> ThreadPoolExecutor:
+    global _fanout
+    if _fanout is None:
+        with _fanout_lock:
+            if _fanout is None:
+                _fanout = ThreadPoolExecutor(
+                    FANOUT_WORKERS, thread_name_prefix="fanout"
+                )
+    return _fanout
+
+
+def reset_fanout() -> None:
+    global _fanout, _fanout_lock
+    _fanout = None
+    _fanout_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_fanout)
+
+
+def run_detached(
+    task: Callable[[Repository], Any],
+    timings: Optional[RequestTimings] = None,
+    pool: Optional[ConnectionPool] = None,
+) -> Any:
+    pool = pool or get_pool()
+    backend = pool.backend
+    acquired: List[Any] = []
+
+    def acquire():
+        acquired.append(checkout(pool, timings))
+        return acquired[-1]
+
+    discard = False
+    try:
+        return task(Repository(backend, acquire=acquire, timings=timings, pool=pool))
+    except backend.Error:
+        discard = True
+        raise
+    finally:
+        for conn in acquired:
+            pool.release(conn, discard=discard)
+
+
+def fan_out(repo: Repository, *tasks: Callable[[Repository], Any]) -> List[Any]:
+    if FANOUT_WORKERS <= 0 or len(tasks) < 2 or not repo.backend.parallel_reads:
+        return [task(repo) for task in tasks]
+    futures = [
+        get_fanout().submit(run_detached, task, repo.timings, repo.pool)
+        for task in tasks[1:]
+    ]
+    results = [tasks[0](repo)]
+    results.extend(future.result() for future in futures)
+    return results
+
+
+TEMPLATE_DIGEST = hashlib.sha1(
+    "".join(TEMPLATES[name] for name in sorted(TEMPLATES)).encode("utf-8")
+).hexdigest()[:12]
+
+
+def listing_validators(listing: str) -> Tuple[str, Optional[datetime]]:
+    tables = LISTING_TABLES[listing]
+    state = (
+        table_versions.scope,
+        TEMPLATE_DIGEST,
+        listing,
+        table_versions.get(*tables),
+        request.query_string,
+    )
+    etag = hashlib.sha1(repr(state).encode("utf-8")).hexdigest()[:24]
+    modified = table_versions.modified(*tables)
+    # A second-resolution Last-Modified is only safe once no later write can
+    # land in the same second, so it is withheld right after a write.
+    if modified is None or int(modified) >= int(time.time()):
+        return etag, None
+    return etag, datetime.fromtimestamp(int(modified), timezone.utc)
+
+
+def conditional(listing: str) -> Callable:
+    def decorator(view: Callable) -> Callable:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            try:
+                etag, last_modified = listing_validators(listing)
+            except Exception:
+                return view(*args, **kwargs)
+            if request.if_none_match:
+                fresh = request.if_none_match.contains_weak(etag)
+            elif last_modified and request.if_modified_since:
+                fresh = request.if_modified_since >= last_modified
+            else:
+                fresh = False
+            if fresh:
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _encoder(encoding: str) -> Tuple[Callable, Callable, Callable]:
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush,
+    )
+
+
+def _compressed_stream(response: Response, encoding: str) -> Iterator[bytes]:
+    compress, flush, finish = _encoder(encoding)
+    try:
+        for chunk in response.iter_encoded():
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        response.close()
+
+
+def choose_encoding() -> Optional[str]:
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response: Response) -> Response:
+    if (
+        COMPRESS_MIN_SIZE <= 0
+        or response.status_code != 200
+        or response.mimetype not in COMPRESS_MIMETYPES
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        streamed = Response(
+            _compressed_stream(response, encoding),
+            status=response.status,
+            headers=response.headers,
+        )
+        streamed.headers.pop("Content-Length", None)
+        streamed.headers["Content-Encoding"] = encoding
+        return streamed
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    compress, _, finish = _encoder(encoding)
+    response.set_data(compress(data) + finish())
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+EXPORTS: Dict[str, Tuple[str, List[Tuple[str, str]]]] = {
+    "students": (
+        "SELECT student_id, name, age, gender, department, email, phone "
+        "FROM student ORDER BY student_id",
+        [("student_id", "int")]
+        + [(column, kind) for column, kind, *_ in TABLE_COLUMNS["student"]],
+    ),
+    "courses": (
+        "SELECT course_id, course_name, credits, department, description "
+        "FROM course ORDER BY course_id",
+        [("course_id", "int")]
+        + [(column, kind) for column, kind, *_ in TABLE_COLUMNS["course"]],
+    ),
+    "enrollments": (
+        f"{ENROLLMENT_LIST_SQL} ORDER BY e.enroll_id",
+        [
+            ("enroll_id", "int"),
+            ("student_name", "varchar"),
+            ("course_name", "varchar"),
+            ("marks", "int"),
+            ("enrolled_on", "datetime"),
+        ],
+    ),
+}
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def _csv_chunks(batches) -> Iterator[bytes]:
+    header_written = False
+    for columns, rows in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(batches) -> Iterator[bytes]:
+    for columns, rows in batches:
+        lines = [json.dumps(dict(zip(columns, row)), default=str) for row in rows]
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_chunks(batches, kinds: List[Tuple[str, str]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {
+        "int": pa.int64(),
+        "datetime": pa.timestamp("s"),
+    }
+    schema = pa.schema(
+        [(column, arrow_types.get(kind, pa.string())) for column, kind in kinds]
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for _, rows in batches:
+            if not rows:
+                continue
+            arrays = [
+                pa.array(values, type=field.type)
+                for values, field in zip(zip(*rows), schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(listing: str, fmt: str, gzip: bool = False) -> Iterator[bytes]:
+    if listing not in EXPORTS:
+        raise ExportError(f"unknown listing '{listing}'")
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    sql, kinds = EXPORTS[listing]
+    batches = get_read_repository(*LISTING_TABLES[listing]).batches(sql)
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export requires pyarrow: pip install pyarrow")
+        chunks = _parquet_chunks(batches, kinds)
+    elif fmt == "csv":
+        chunks = _csv_chunks(batches)
+    else:
+        chunks = _ndjson_chunks(batches)
+    return _gzip_chunks(chunks) if gzip else chunks
+
+
+def wants_stream(route: str) -> bool:
+    if request.method != "GET":
+        return False
+    flag = request.args.get("stream")
+    if flag is not None:
+        return flag == "1"
+    return route in STREAM_ROUTES
+
+
+def stream_page(listing: str) -> Page:
+    repo = get_read_repository(*LISTING_TABLES[listing])
+    return Page(repo.stream(listing), size=0)
+
+
+def stream_listing(template_name: str, **context) -> Response:
+    template = app.jinja_env.get_template(template_name)
+    app.update_template_context(context)
+    stream = template.stream(**context)
+    stream.enable_buffering(STREAM_BUFFER)
+    return Response(stream_with_context(stream), mimetype="text/html")
+
+
+app = Flask(__name__, template_folder=None)
+app.jinja_loader = DictLoader(TEMPLATES)
+app.jinja_options = {**app.jinja_options, "bytecode_cache": template_bytecode_cache()}
+app.teardown_appcontext(release_connection)
+app.before_request(start_timings)
+app.after_request(record_timings)
+app.after_request(remember_write)
+app.after_request(compress_response)
+before_render_template.connect(_template_started, app)
+template_rendered.connect(_template_rendered, app)
+
+
+@app.route("/")
+def index():
+    return render_template("index.html")
+
+
+@app.route("/health/pool")
+def pool_health():
+    stats: Dict[str, Any] = get_pool().stats()
+    replicas = get_replicas()
+    if replicas is not None:
+        stats["replicas"] = replicas.stats()
+    return jsonify(stats)
+
+
+@app.route("/metrics")
+def metrics_view():
+    return Response(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.route("/health/cache")
+def cache_health():
+    return jsonify(result_cache.stats())
+
+
+@app.route("/events")
+def events():
+    if not CHANGE_FEED:
+        return api_error("the change feed is disabled", 404)
+    listings = request.args.get("listings", ",".join(LISTINGS)).split(",")
+    unknown = [listing for listing in listings if listing not in LISTINGS]
+    if unknown:
+        return api_error(f"listings must be among {', '.join(LISTINGS)}")
+    try:
+        last_id: Optional[int] = int(request.headers["Last-Event-ID"])
+    except (KeyError, ValueError):
+        last_id = None
+    try:
+        subscription = change_feed.subscribe(listings, last_id)
+    except FeedFull as exc:
+        body, status = api_error(str(exc), 503)
+        body.headers["Retry-After"] = "30"
+        return body, status
+    return Response(
+        feed_stream(subscription),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/lookup/<kind>")
+def lookup(kind: str):
+    table = {"students": "student", "courses": "course"}.get(kind)
+    if table is None:
+        return jsonify({"error": f"unknown lookup '{kind}'"}), 404
+    limit = max(1, min(_int_arg("limit") or TYPEAHEAD_LIMIT, 100))
+    prefix = request.args.get("q", "").strip()
+    repo = get_read_repository(table)
+    options = result_cache.get_or_load(
+        ("typeahead", table, prefix, limit),
+        (table,),
+        lambda: repo.typeahead(table, prefix, limit),
+    )
+    return jsonify(options)
+
+
+@app.route("/search")
+def search():
+    query = request.args.get("q", "")
+    kinds = request.args.get("type")
+    entities = kinds.split(",") if kinds else ["students", "courses"]
+    unknown = [entity for entity in entities if entity not in SEARCH_ENTITIES]
+    if unknown:
+        return api_error(f"type must be one of {', '.join(SEARCH_ENTITIES)}")
+    limit = max(1, min(_int_arg("limit") or SEARCH_LIMIT, MAX_PAGE_SIZE))
+    body: Dict[str, Any] = {"query": query}
+    for entity in entities:
+        table = ENTITY_TABLES[entity]
+        body[entity] = cached_search(get_read_repository(table), table, query, limit)
+    return jsonify(body)
+
+
+def form_values(table: str) -> Dict[str, Any]:
+    columns = [column for column, *_ in TABLE_COLUMNS[table]]
+    return dict(zip(columns, validate_row(table, request.form)))
+
+
+FORM_ACTIONS = ("Add", "Update", "Delete")
+
+
+def form_action() -> str:
+    action = request.form.get("action")
+    if action not in FORM_ACTIONS:
+        raise ValueError(f"action must be one of {', '.join(FORM_ACTIONS)}")
+    return action
+
+
+def form_row_id(name: str, action: str) -> Optional[int]:
+    if action == "Add":
+        return None
+    value = request.form.get(name, "").strip()
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+
+
+def wants_fragment() -> bool:
+    accepted = request.accept_mimetypes.best_match(("text/html", "application/json"))
+    return accepted == "application/json"
+
+
+def render_row(listing: str, row: Dict[str, Any]) -> str:
+    macro = get_template_attribute("rows.html", f"{ENTITY_TABLES[listing]}_row")
+    return str(macro(row))
+
+
+def publish_row(
+    repo: Repository, listing: str, action: str, row_id: int
+) -> Optional[str]:
+    row = None
+    if action != "delete":
+        found = repo.listing_row(listing, row_id)
+        row = render_row(listing, found) if found else None
+    change_feed.publish(listing, action, row_id, row)
+    return row
+
+
+def publish_stale(*tables: str) -> None:
+    if not CHANGE_FEED:
+        return
+    for listing, depends_on in LISTING_TABLES.items():
+        if set(depends_on) & set(tables):
+            change_feed.publish(listing, "stale")
+
+
+def written(
+    repo: Repository,
+    listing: str,
+    action: str,
+    row_id: Any,
+    row: Optional[str] = None,
+) -> Response:
+    fragment = wants_fragment()
+    if CHANGE_FEED and row is None:
+        row = publish_row(repo, listing, action.lower(), int(row_id))
+        if listing != "enrollments" and action != "Add":
+            # enrollment rows show student and course names
+            change_feed.publish("enrollments", "stale")
+    elif fragment and row is None and action != "Delete":
+        found = repo.listing_row(listing, row_id)
+        row = render_row(listing, found) if found else None
+    if not fragment:
+        return redirect(request.full_path.rstrip("?"), code=303)
+    return jsonify({"action": action.lower(), "id": int(row_id), "row": row})
+
+
+@app.route("/students", methods=["GET", "POST"])
+@conditional("students")
+def students():
+    repo = get_repository()
+    if request.method == "POST":
+        try:
+            action = form_action()
+            student_id = form_row_id("student_id", action)
+            values = form_values("student") if action != "Delete" else {}
+        except ValueError as exc:
+            return api_error(str(exc))
+        try:
+            if action == "Add":
+                student_id = repo.insert("student", values)
+            elif action == "Update":
+                if not repo.update("student", student_id, values):
+                    raise LookupError(f"student {student_id} not found")
+            elif not repo.delete("student", student_id):
+                raise LookupError(f"student {student_id} not found")
+            repo.commit()
+        except LookupError as exc:
+            repo.rollback()
+            return api_error(str(exc), 404)
+        except repo.backend.Error as exc:
+            repo.rollback()
+            return api_error(repo.backend.error_message(exc), 409)
+        bump_version("student", "enrollment")
+        return written(repo, "students", action, student_id)
+    repo = get_read_repository(*LISTING_TABLES["students"])
+    query = request.args.get("q", "").strip()
+    if query:
+        rows = cached_search(repo, "student", query, MAX_PAGE_SIZE)
+        page = Page(rows, size=0)
+        return render_template("students.html", students=rows, page=page, query=query)
+    if wants_stream("students"):
+        page = stream_page("students")
+        return stream_listing("students.html", students=page.rows, page=page)
+    page = cached_page(repo, "students", *page_args())
+    return render_template("students.html", students=page.rows, page=page)
+
+
+@app.route("/courses", methods=["GET", "POST"])
+@conditional("courses")
+def courses():
+    repo = get_repository()
+    if request.method == "POST":
+        try:
+            action = form_action()
+            course_id = form_row_id("course_id", action)
+            values = form_values("course") if action != "Delete" else {}
+        except ValueError as exc:
+            return api_error(str(exc))
+        try:
+            if action == "Add":
+                course_id = repo.insert("course", values)
+            elif action == "Update":
+                if not repo.update("course", course_id, values):
+                    raise LookupError(f"course {course_id} not found")
+            elif not repo.delete("course", course_id):
+                raise LookupError(f"course {course_id} not found")
+            repo.commit()
+        except LookupError as exc:
+            repo.rollback()
+            return api_error(str(exc), 404)
+        except repo.backend.Error as exc:
+            repo.rollback()
+            return api_error(repo.backend.error_message(exc), 409)
+        bump_version("course", "enrollment")
+        return written(repo, "courses", action, course_id)
+    repo = get_read_repository(*LISTING_TABLES["courses"])
+    query = request.args.get("q", "").strip()
+    if query:
+        rows = cached_search(repo, "course", query, MAX_PAGE_SIZE)
+        page = Page(rows, size=0)
+        return render_template("courses.html", courses=rows, page=page, query=query)
+    if wants_stream("courses"):
+        page = stream_page("courses")
+        return stream_listing("courses.html", courses=page.rows, page=page)
+    page = cached_page(repo, "courses", *page_args())
+    return render_template("courses.html", courses=page.rows, page=page)
+
+
+@app.route("/enrollments", methods=["GET", "POST"])
+@conditional("enrollments")
+def enrollments():
+    repo = get_repository()
+    if request.method == "POST":
+        try:
+            action = form_action()
+            enroll_id = form_row_id("enroll_id", action)
+            values = form_values("enrollment") if action == "Add" else {}
+            marks = parse_marks(request.form.get("marks"))
+        except ValueError as exc:
+            return api_error(str(exc))
+        try:
+            if action == "Add":
+                enroll_id = repo.insert("enrollment", values)
+            elif action == "Update":
+                pending = grade_committer.submit(repo, enroll_id, marks)
+                if not pending.found:
+                    return api_error(f"enrollment {enroll_id} not found", 404)
+                return written(repo, "enrollments", action, enroll_id, pending.row)
+            elif not repo.delete("enrollment", enroll_id):
+                raise LookupError(f"enrollment {enroll_id} not found")
+            repo.commit()
+        except LookupError as exc:
+            repo.rollback()
+            return api_error(str(exc), 404)
+        except repo.backend.Error as exc:
+            repo.rollback()
+            return api_error(repo.backend.error_message(exc), 409)
+        bump_version("enrollment")
+        return written(repo, "enrollments", action, enroll_id)
+    repo = get_read_repository(*LISTING_TABLES["enrollments"])
+    streamed = wants_stream("enrollments")
+    args = page_args()
+    tasks = [
+        lambda task_repo: cached_lookup(task_repo, "student"),
+        lambda task_repo: cached_lookup(task_repo, "course"),
+    ]
+    if not streamed:
+        tasks.append(lambda task_repo: cached_page(task_repo, "enrollments", *args))
+    results = fan_out(repo, *tasks)
+    (students_list, students_typeahead), (courses_list, courses_typeahead) = results[:2]
+    lookups = dict(
+        students=students_list,
+        students_typeahead=students_typeahead,
+        courses=courses_list,
+        courses_typeahead=courses_typeahead,
+    )
+    if streamed:
+        page = stream_page("enrollments")
+        return stream_listing(
+            "enrollments.html",
+            enrollments=page.rows,
+            page=page,
+            **lookups,
+        )
+    page = results[2]
+    return render_template(
+        "enrollments.html",
+        enrollments=page.rows,
+        page=page,
+        **lookups,
+    )
+
+
+def grade_sheet_marks() -> Tuple[Dict[int, Optional[int]], List[Dict[str, Any]]]:
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        items = payload.get("marks") if isinstance(payload, dict) else None
+        if not isinstance(items, dict):
+            raise ValueError('body must be {"marks": {"<enroll_id>": <marks>, ...}}')
+        pairs = list(items.items())
+    else:
+        pairs = [
+            (name[len("marks-") :], value)
+            for name, value in request.form.items()
+            if name.startswith("marks-")
+        ]
+    marks: Dict[int, Optional[int]] = {}
+    errors = []
+    for enroll_id, value in pairs:
+        try:
+            enroll_id = int(enroll_id)
+        except ValueError:
+            errors.append({"enroll_id": enroll_id, "error": "not an enrollment id"})
+            continue
+        try:
+            marks[enroll_id] = parse_marks(value)
+        except ValueError as exc:
+            errors.append({"enroll_id": enroll_id, "error": str(exc)})
+    return marks, errors
+
+
+@app.route("/courses/<int:course_id>/grades", methods=["GET", "POST"])
+def grade_sheet(course_id: int):
+    repo = get_repository()
+    course = repo.listing_row("courses", course_id)
+    if course is None:
+        return api_error(f"course {course_id} not found", 404)
+    errors: List[Dict[str, Any]] = []
+    if request.method == "POST":
+        try:
+            marks, errors = grade_sheet_marks()
+        except ValueError as exc:
+            return api_error(str(exc))
+        if not errors:
+            found, changed = repo.set_marks(marks, course_id)
+            errors = [
+                {"enroll_id": enroll_id, "error": "not enrolled in this course"}
+                for enroll_id in marks
+                if enroll_id not in found
+            ]
+        if errors:
+            repo.rollback()
+            if request.is_json:
+                return jsonify({"error": "nothing was saved", "errors": errors}), 400
+        else:
+            repo.commit()
+            if changed:
+                bump_version("enrollment")
+                publish_stale("enrollment")
+            if request.is_json:
+                return jsonify({"updated": changed, "unchanged": len(marks) - changed})
+            return redirect(f"{request.path}?saved={changed}", code=303)
+    rows = result_cache.get_or_load(
+        ("grades", course_id),
+        ("enrollment", "student"),
+        lambda: repo.fetch_all(GRADE_SHEET_SQL, (course_id,)),
+    )
+    body = render_template(
+        "grades.html",
+        course=course,
+        rows=rows,
+        errors={str(error["enroll_id"]): error["error"] for error in errors},
+        submitted=request.form if errors else {},
+        saved=_int_arg("saved"),
+    )
+    return body, 400 if errors else 200
+
+
+@app.route("/import/<entity>", methods=["POST"])
+def bulk_import(entity: str):
+    table = ENTITY_TABLES.get(entity)
+    if table is None:
+        return jsonify({"error": f"unknown entity '{entity}'"}), 404
+    upload = request.files.get("file")
+    filename = (upload.filename or "").lower() if upload else ""
+    fmt = request.args.get("format")
+    if fmt is None:
+        is_csv = filename.endswith(".csv") or request.mimetype == "text/csv"
+        fmt = "csv" if is_csv else "ndjson"
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    stream = upload.stream if upload else request.stream
+    report = get_repository().bulk_insert(table, read_records(stream, fmt))
+    if report["inserted"]:
+        bump_version(*TABLE_INVALIDATES[table])
+        publish_stale(table)
+    return jsonify(report)
+
+
+@app.route("/export/<listing>.<fmt>")
+def export(listing: str, fmt: str):
+    gzip = request.args.get("gzip") == "1"
+    try:
+        chunks = export_stream(listing, fmt, gzip)
+    except ExportError as exc:
+        return jsonify({"error": str(exc)}), 400
+    filename = f"{listing}.{fmt}" + (".gz" if gzip else "")
+    return Response(
+        stream_with_context(chunks),
+        mimetype="application/gzip" if gzip else EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def api_entity(entity: str) -> Tuple[Optional[str], Any]:
+    table = ENTITY_TABLES.get(entity)
+    if table is None:
+        return None, (jsonify({"error": f"unknown entity '{entity}'"}), 404)
+    return table, None
+
+
+def api_error(message: str, status: int = 400, index: Optional[int] = None):
+    body: Dict[str, Any] = {"error": message}
+    if index is not None:
+        body["index"] = index
+    return jsonify(body), status
+
+
+def api_items(table: str, require_key: bool = False) -> List[Any]:
+    payload = request.get_json(silent=True)
+    items = payload if isinstance(payload, list) else [payload]
+    if not items or not all(isinstance(item, dict) for item in items):
+        raise ValueError("body must be a JSON object or a non-empty array of objects")
+    if len(items) > API_MAX_BATCH:
+        raise ValueError(f"at most {API_MAX_BATCH} items per request")
+    if require_key:
+        key = TABLE_KEYS[table]
+        for index, item in enumerate(items):
+            value = item.get(key)
+            if value in (None, ""):
+                raise ValueError(f"item {index}: {key} is required")
+            if isinstance(value, str) and value.strip().isdigit():
+                value = int(value)
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                raise ValueError(
+                    f"item {index}: {key} must be a positive integer, "
+                    f"got {item[key]!r}"
+                )
+            item[key] = value
+    return items
+
+
+@app.route("/api/v1/<entity>", methods=["GET"])
+def api_list(entity: str):
+    table, error = api_entity(entity)
+    if error:
+        return error
+    try:
+        fields = api_fields(table, request.args.get("fields"))
+        filters = api_filters(table, request.args)
+    except ValueError as exc:
+        return api_error(str(exc))
+    after = _int_arg("after")
+    limit = max(1, min(_int_arg("limit") or PAGE_SIZE, MAX_PAGE_SIZE))
+    repo = get_read_repository(table)
+    rows = result_cache.get_or_load(
+        ("api", table, tuple(fields), tuple(filters), after, limit),
+        (table,),
+        lambda: repo.select(table, fields, filters, after, limit + 1),
+    )
+    key = TABLE_KEYS[table]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify(
+        {
+            "data": [api_row(row, fields) for row in rows],
+            "next": rows[-1][key] if rows and has_more else None,
+        }
+    )
+
+
+@app.route("/api/v1/<entity>/<int:row_id>", methods=["GET"])
+def api_get(entity: str, row_id: int):
+    table, error = api_entity(entity)
+    if error:
+        return error
+    try:
+        fields = api_fields(table, request.args.get("fields"))
+    except ValueError as exc:
+        return api_error(str(exc))
+    rows = get_read_repository(table).select(
+        table, fields, [(TABLE_KEYS[table], "=", row_id)], None, 1
+    )
+    if not rows:
+        return api_error(f"{entity} {row_id} not found", 404)
+    return jsonify(api_row(rows[0], fields))
+
+
+@app.route("/api/v1/<entity>", methods=["POST", "PATCH", "DELETE"])
+def api_write(entity: str):
+    table, error = api_entity(entity)
+    if error:
+        return error
+    key = TABLE_KEYS[table]
+    columns = [column for column, *_ in TABLE_COLUMNS[table]]
+    try:
+        if request.method == "DELETE":
+            payload = request.get_json(silent=True)
+            ids = payload.get("ids") if isinstance(payload, dict) else payload
+            if not isinstance(ids, list) or not ids:
+                raise ValueError('body must be {"ids": [...]} or a non-empty array')
+            if len(ids) > API_MAX_BATCH:
+                raise ValueError(f"at most {API_MAX_BATCH} items per request")
+            items = [int(row_id) for row_id in ids]
+        else:
+            items = api_items(table, require_key=request.method == "PATCH")
+    except (TypeError, ValueError) as exc:
+        return api_error(str(exc))
+    repo = get_repository()
+    result: Dict[str, Any] = {}
+    index = 0
+    try:
+        if request.method == "POST":
+            created = []
+            for index, item in enumerate(items):
+                values = dict(zip(columns, validate_row(table, item, strict=True)))
+                created.append(repo.insert(table, values))
+            result, status = {"created": created}, 201
+        elif request.method == "PATCH":
+            updated = 0
+            for index, item in enumerate(items):
+                changes = validate_changes(table, item)
+                if changes:
+                    found = repo.update(table, item[key], changes)
+                else:
+                    found = repo.exists(table, item[key])
+                if not found:
+                    raise LookupError(f"{entity} {item[key]} not found")
+                updated += 1
+            result, status = {"updated": updated}, 200
+        else:
+            deleted = sum(repo.delete(table, row_id) for row_id in items)
+            result, status = {"deleted": deleted}, 200
+        repo.commit()
+    except ValueError as exc:
+        repo.rollback()
+        return api_error(str(exc), 400, index)
+    except LookupError as exc:
+        repo.rollback()
+        return api_error(str(exc), 404, index)
+    except repo.backend.Error as exc:
+        repo.rollback()
+        return api_error(repo.backend.error_message(exc), 409, index)
+    bump_version(*TABLE_INVALIDATES[table])
+    publish_stale(table)
+    return jsonify(result), status
+
+
+ANALYTICS_TABLES = ("enrollment", "course", "student")
+
+COURSE_STATS_SQL = """
+    SELECT c.course_id, c.course_name, c.credits,
+        COALESCE(s.enrolled, 0) AS enrolled, COALESCE(s.graded, 0) AS graded,
+        COALESCE(s.marks_sum, 0) AS marks_sum,
+        COALESCE(s.marks_sq_sum, 0) AS marks_sq_sum
+    FROM course c
+    LEFT JOIN course_stats s ON s.course_id = c.course_id
+"""
+STUDENT_STATS_SQL = """
+    SELECT s.student_id, s.name, s.department,
+        COALESCE(t.enrolled, 0) AS enrolled, COALESCE(t.graded, 0) AS graded,
+        COALESCE(t.credits, 0) AS credits,
+        COALESCE(t.weighted_marks, 0) AS weighted_marks,
+        COALESCE(t.grade_points, 0) AS grade_points
+    FROM student s
+    LEFT JOIN student_stats t ON t.student_id = s.student_id
+"""
+
+
+def percentile(histogram: List[Tuple[int, int]], fraction: float) -> Optional[int]:
+    total = sum(count for _, count in histogram)
+    if not total:
+        return None
+    rank = max(1, math.ceil(fraction * total))
+    seen = 0
+    for marks, count in histogram:
+        seen += count
+        if seen >= rank:
+            return marks
+    return histogram[-1][0]
+
+
+def course_report(row: Dict[str, Any], histogram: List[Tuple[int, int]]) -> Dict:
+    graded = row["graded"]
+    report = {
+        "course_id": row["course_id"],
+        "course_name": row["course_name"],
+        "credits": row["credits"],
+        "enrolled": row["enrolled"],
+        "graded": graded,
+        "average": None,
+        "stddev": None,
+        "pass_rate": None,
+        "min": histogram[0][0] if histogram else None,
+        "max": histogram[-1][0] if histogram else None,
+        "percentiles": {
+            f"p{int(fraction * 100)}": percentile(histogram, fraction)
+            for fraction in (0.25, 0.5, 0.75, 0.9)
+        },
+    }
+    if graded:
+        mean = row["marks_sum"] / graded
+        variance = max(row["marks_sq_sum"] / graded - mean * mean, 0.0)
+        passed = sum(count for marks, count in histogram if marks >= PASS_MARK)
+        report.update(
+            average=round(mean, 2),
+            stddev=round(math.sqrt(variance), 2),
+            pass_rate=round(passed / graded, 4),
+        )
+    return report
+
+
+def student_report(row: Dict[str, Any]) -> Dict:
+    credits = row["credits"]
+    return {
+        "student_id": row["student_id"],
+        "name": row["name"],
+        "department": row["department"],
+        "enrolled": row["enrolled"],
+        "graded": row["graded"],
+        "credits": credits,
+        "weighted_average": round(row["weighted_marks"] / credits, 2)
+        if credits
+        else None,
+        "gpa": round(row["grade_points"] / credits, 2) if credits else None,
+    }
+
+
+def course_reports(repo: Repository, course_id: Optional[int] = None) -> List[Dict]:
+    where = " WHERE c.course_id = %s" if course_id is not None else ""
+    params = (course_id,) if course_id is not None else ()
+    rows = repo.fetch_all(f"{COURSE_STATS_SQL}{where} ORDER BY c.course_id", params)
+    histograms: Dict[int, List[Tuple[int, int]]] = {}
+    where = " AND course_id = %s" if course_id is not None else ""
+    for bucket in repo.fetch_all(
+        "SELECT course_id, marks, students FROM course_marks "
+        f"WHERE students > 0{where} ORDER BY course_id, marks",
+        params,
+    ):
+        histograms.setdefault(bucket["course_id"], []).append(
+            (bucket["marks"], bucket["students"])
+        )
+    return [course_report(row, histograms.get(row["course_id"], [])) for row in rows]
+
+
+def analytics_summary(repo: Repository) -> Dict[str, Any]:
+    (totals,) = repo.fetch_all(
+        "SELECT COUNT(*) AS courses, COALESCE(SUM(enrolled), 0) AS enrolled, "
+        "COALESCE(SUM(graded), 0) AS graded, COALESCE(SUM(marks_sum), 0) AS marks_sum "
+        "FROM course_stats"
+    )
+    histogram = [
+        (row["marks"], int(row["students"]))
+        for row in repo.fetch_all(
+            "SELECT marks, SUM(students) AS students FROM course_marks "
+            "WHERE students > 0 GROUP BY marks ORDER BY marks"
+        )
+    ]
+    graded = int(totals["graded"])
+    passed = sum(count for marks, count in histogram if marks >= PASS_MARK)
+    return {
+        "courses_with_enrollments": totals["courses"],
+        "enrollments": int(totals["enrolled"]),
+        "graded": graded,
+        "average": round(int(totals["marks_sum"]) / graded, 2) if graded else None,
+        "pass_mark": PASS_MARK,
+        "pass_rate": round(passed / graded, 4) if graded else None,
+        "median": percentile(histogram, 0.5),
+    }
+
+
+@app.route("/analytics/summary")
+def analytics_summary_view():
+    repo = get_read_repository(*ANALYTICS_TABLES)
+    return jsonify(
+        result_cache.get_or_load(
+            ("analytics", "summary"), ANALYTICS_TABLES, lambda: analytics_summary(repo)
+        )
+    )
+
+
+@app.route("/analytics/courses")
+@app.route("/analytics/courses/<int:course_id>")
+def analytics_courses(course_id: Optional[int] = None):
+    repo = get_read_repository(*ANALYTICS_TABLES)
+    reports = result_cache.get_or_load(
+        ("analytics", "courses", course_id),
+        ANALYTICS_TABLES,
+        lambda: course_reports(repo, course_id),
+    )
+    if course_id is None:
+        return jsonify({"data": reports})
+    if not reports:
+        return api_error(f"course {course_id} not found", 404)
+    return jsonify(reports[0])
+
+
+@app.route("/analytics/students")
+@app.route("/analytics/students/<int:student_id>")
+def analytics_students(student_id: Optional[int] = None):
+    repo = get_read_repository(*ANALYTICS_TABLES)
+    if student_id is not None:
+        rows = repo.fetch_all(
+            f"{STUDENT_STATS_SQL} WHERE s.student_id = %s", (student_id,)
+        )
+        if not rows:
+            return api_error(f"student {student_id} not found", 404)
+        return jsonify(student_report(rows[0]))
+    after = _int_arg("after") or 0
+    limit = max(1, min(_int_arg("limit") or PAGE_SIZE, MAX_PAGE_SIZE))
+    rows = result_cache.get_or_load(
+        ("analytics", "students", after, limit),
+        ANALYTICS_TABLES,
+        lambda: repo.fetch_all(
+            f"{STUDENT_STATS_SQL} WHERE s.student_id > %s "
+            "ORDER BY s.student_id LIMIT %s",
+            (after, limit + 1),
+        ),
+    )
+    return jsonify(
+        {
+            "data": [student_report(row) for row in rows[:limit]],
+            "next": rows[limit - 1]["student_id"] if len(rows) > limit else None,
+        }
+    )
+
+
+REPORT_COLUMNS_SQL = """
+    SELECT enroll_id, student_id, course_id, COALESCE(marks, 0), marks IS NOT NULL
+    FROM enrollment
+"""
+REPORT_FORMATS = {"json": "application/json", "csv": "text/csv"}
+
+
+class ReportError(Exception):
+    pass
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ReportError("Reports require numpy: pip install numpy")
+    return numpy
+
+
+@dataclass
+class EnrollmentFrame:
+    enroll_id: Any
+    student_id: Any
+    course_id: Any
+    marks: Any
+    graded: Any
+    department: Any
+    departments: List[str]
+    course_names: Dict[int, str]
+    memo: Dict[Tuple, Any] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.enroll_id)
+
+    def memoized(self, key: Tuple, compute: Callable[[], Any]) -> Any:
+        if key not in self.memo:
+            self.memo[key] = compute()
+        return self.memo[key]
+
+
+def _int_columns(
+    repo: Repository, sql: str, dtypes: List[Any], chunk_size: int
+) -> List[Any]:
+    np = _numpy()
+    columns: List[List[Any]] = [[] for _ in dtypes]
+    for _, rows in repo.batches(sql, chunk_size=chunk_size):
+        if not rows:
+            continue
+        values = np.fromiter(
+            itertools.chain.from_iterable(rows), np.int64, len(rows) * len(dtypes)
+        ).reshape(-1, len(dtypes))
+        for index, dtype in enumerate(dtypes):
+            columns[index].append(values[:, index].astype(dtype))
+    return [
+        np.concatenate(chunks) if chunks else np.empty(0, dtype)
+        for chunks, dtype in zip(columns, dtypes)
+    ]
+
+
+def load_enrollment_frame(
+    repo: Repository, chunk_size: int = REPORT_CHUNK_ROWS
+) -> EnrollmentFrame:
+    np = _numpy()
+    enroll_id, student_id, course_id, marks, graded = _int_columns(
+        repo, REPORT_COLUMNS_SQL, [np.int32] * 4 + [bool], chunk_size
+    )
+    student_ids, codes, departments = [], [], {}
+    for _, rows in repo.batches(
+        "SELECT student_id, COALESCE(department, '') FROM student "
+        "ORDER BY student_id",
+        chunk_size=chunk_size,
+    ):
+        student_ids.append(np.fromiter((row[0] for row in rows), np.int64, len(rows)))
+        codes.append(
+            np.fromiter(
+                (departments.setdefault(row[1], len(departments)) for row in rows),
+                np.int32,
+                len(rows),
+            )
+        )
+    student_ids = np.concatenate(student_ids) if student_ids else np.empty(0, int)
+    codes = np.concatenate(codes) if codes else np.empty(0, np.int32)
+    position = np.minimum(
+        np.searchsorted(student_ids, student_id), max(len(student_ids) - 1, 0)
+    )
+    # enrollments whose student was deleted between the two reads are dropped
+    known = student_ids[position] == student_id if len(student_ids) else False
+    if not np.all(known):
+        enroll_id, student_id, course_id, marks, graded, position = (
+            column[known]
+            for column in (enroll_id, student_id, course_id, marks, graded, position)
+        )
+    course_names = {
+        row["course_id"]: row["course_name"]
+        for row in repo.fetch_all("SELECT course_id, course_name FROM course")
+    }
+    return EnrollmentFrame(
+        enroll_id=enroll_id,
+        student_id=student_id,
+        course_id=course_id,
+        marks=marks,
+        graded=graded,
+        department=codes[position],
+        departments=list(departments),
+        course_names=course_names,
+    )
+
+
+class FrameCache:
+    def __init__(self, ttl: float = REPORT_TTL) -> None:
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entry: Optional[Tuple[Tuple, float, EnrollmentFrame]] = None
+
+    def get(self, repo: Repository) -> EnrollmentFrame:
+        versions = table_versions.get(*ANALYTICS_TABLES)
+        with self.lock:
+            entry = self.entry
+            if entry and entry[0] == versions and entry[1] > time.monotonic():
+                return entry[2]
+            self.entry = None
+            frame = load_enrollment_frame(repo)
+            if self.ttl > 0:
+                self.entry = (versions, time.monotonic() + self.ttl, frame)
+            return frame
+
+
+frame_cache = FrameCache()
+
+
+def _course_filter(frame: EnrollmentFrame, course_id: Optional[int]) -> Any:
+    mask = frame.graded
+    if course_id is not None:
+        if course_id not in frame.course_names:
+            raise ReportError(f"course {course_id} not found")
+        mask = mask & (frame.course_id == course_id)
+    return mask
+
+
+def _group_stats(keys: Any, values: Any) -> Tuple[Any, Any, Any, Any]:
+    np = _numpy()
+    groups, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(groups))
+    sums = np.bincount(inverse, weights=values, minlength=len(groups))
+    squares = np.bincount(inverse, weights=values * values, minlength=len(groups))
+    means = sums / np.maximum(counts, 1)
+    stddevs = np.sqrt(np.maximum(squares / np.maximum(counts, 1) - means**2, 0))
+    return groups, inverse, means, stddevs
+
+
+def report_histogram(
+    frame: EnrollmentFrame, width: int = 10, course_id: Optional[int] = None
+) -> Dict[str, Any]:
+    np = _numpy()
+    if not 1 <= width <= 100:
+        raise ReportError("width must be between 1 and 100")
+    mask = _course_filter(frame, course_id)
+    bins = -(-100 // width)
+    index = np.clip(frame.marks[mask] // width, 0, bins - 1)
+    counts = np.bincount(index, minlength=bins)
+    return {
+        "course_id": course_id,
+        "width": width,
+        "graded": int(mask.sum()),
+        "columns": ["from", "to", "students"],
+        "data": [
+            {
+                "from": bucket * width,
+                "to": 100 if bucket == bins - 1 else bucket * width + width - 1,
+                "students": int(count),
+            }
+            for bucket, count in enumerate(counts)
+        ],
+    }
+
+
+def report_crosstab(frame: EnrollmentFrame) -> Dict[str, Any]:
+    np = _numpy()
+    courses, course_index = np.unique(frame.course_id, return_inverse=True)
+    cells = frame.department.astype(np.int64) * len(courses) + course_index
+    size = len(frame.departments) * len(courses)
+    enrolled = np.bincount(cells, minlength=size)
+    graded = np.bincount(cells, weights=frame.graded, minlength=size)
+    marks = np.bincount(cells, weights=frame.marks * frame.graded, minlength=size)
+    rows = []
+    for cell in np.flatnonzero(enrolled):
+        department, course = divmod(int(cell), len(courses))
+        course_id = int(courses[course])
+        rows.append(
+            {
+                "department": frame.departments[department],
+                "course_id": course_id,
+                "course_name": frame.course_names.get(course_id),
+                "enrolled": int(enrolled[cell]),
+                "graded": int(graded[cell]),
+                "average": round(float(marks[cell] / graded[cell]), 2)
+                if graded[cell]
+                else None,
+            }
+        )
+    return {
+        "columns": [
+            "department", "course_id", "course_name", "enrolled", "graded", "average"
+        ],
+        "data": rows,
+    }
+
+
+def report_zscores(
+    frame: EnrollmentFrame, course_id: Optional[int] = None
+) -> Dict[str, Any]:
+    np = _numpy()
+    mask = _course_filter(frame, course_id)
+    marks = frame.marks[mask].astype(np.float64)
+    _, inverse, means, stddevs = _group_stats(frame.course_id[mask], marks)
+    spread = stddevs[inverse]
+    zscores = np.divide(
+        marks - means[inverse], spread, out=np.zeros_like(marks), where=spread > 0
+    )
+    return {
+        "columns": ["enroll_id", "student_id", "course_id", "marks", "zscore"],
+        "arrays": [
+            frame.enroll_id[mask],
+            frame.student_id[mask],
+            frame.course_id[mask],
+            frame.marks[mask],
+            np.round(zscores, 3),
+        ],
+    }
+
+
+def report_ranking(
+    frame: EnrollmentFrame, course_id: Optional[int] = None
+) -> Dict[str, Any]:
+    np = _numpy()
+    mask = _course_filter(frame, course_id)
+    if course_id is None:
+        students, inverse = np.unique(frame.student_id[mask], return_inverse=True)
+        graded = np.bincount(inverse, minlength=len(students))
+        scores = np.bincount(
+            inverse, weights=frame.marks[mask], minlength=len(students)
+        ) / np.maximum(graded, 1)
+        scores = np.round(scores, 2)
+    else:
+        students = frame.student_id[mask]
+        graded = np.ones(len(students), dtype=np.int64)
+        scores = frame.marks[mask]
+    order = np.argsort(-scores, kind="stable")
+    ordered = -scores[order]
+    ranks = np.searchsorted(ordered, ordered, side="left") + 1
+    percentile = np.round(100 * (1 - (ranks - 1) / max(len(ranks), 1)), 2)
+    return {
+        "columns": ["rank", "student_id", "graded", "score", "percentile"],
+        "arrays": [ranks, students[order], graded[order], scores[order], percentile],
+    }
+
+
+REPORTS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "histogram": report_histogram,
+    "crosstab": report_crosstab,
+    "zscores": report_zscores,
+    "ranking": report_ranking,
+}
+
+
+def run_report(frame: EnrollmentFrame, name: str, **params) -> Dict[str, Any]:
+    if name not in REPORTS:
+        raise ReportError(f"report must be one of {', '.join(REPORTS)}")
+    key = (name, *sorted(params.items()))
+    return frame.memoized(key, lambda: REPORTS[name](frame, **params))
+
+
+def report_chunks(
+    report: Dict[str, Any], offset: int = 0, limit: Optional[int] = None
+) -> Iterator[List[Tuple]]:
+    columns = report["columns"]
+    if "data" in report:
+        rows = report["data"][offset:][:limit]
+        yield [tuple(row[column] for column in columns) for row in rows]
+        return
+    total = len(report["arrays"][0])
+    stop = total if limit is None else min(offset + limit, total)
+    for start in range(offset, stop, REPORT_CHUNK_ROWS):
+        end = min(start + REPORT_CHUNK_ROWS, stop)
+        yield list(zip(*(array[start:end].tolist() for array in report["arrays"])))
+
+
+def report_total(report: Dict[str, Any]) -> int:
+    return len(report["data"]) if "data" in report else len(report["arrays"][0])
+
+
+def report_json(
+    report: Dict[str, Any], offset: int = 0, limit: Optional[int] = None
+) -> Dict[str, Any]:
+    total = report_total(report)
+    body = {
+        key: value for key, value in report.items() if key not in ("data", "arrays")
+    }
+    body["total"] = total
+    body["data"] = [
+        dict(zip(report["columns"], row))
+        for rows in report_chunks(report, offset, limit)
+        for row in rows
+    ]
+    if limit is not None:
+        body["next_offset"] = offset + limit if offset + limit < total else None
+    return body
+
+
+def report_csv(report: Dict[str, Any]) -> Iterator[bytes]:
+    return _csv_chunks((report["columns"], rows) for rows in report_chunks(report))
+
+
+def report_params(name: str, course_id: Optional[int], width: Optional[int]) -> Dict:
+    params: Dict[str, Any] = {}
+    if name in ("histogram", "zscores", "ranking"):
+        params["course_id"] = course_id
+    if name == "histogram":
+        params["width"] = width or 10
+    return params
+
+
+@app.route("/reports/<name>.<fmt>")
+def report_view(name: str, fmt: str):
+    if fmt not in REPORT_FORMATS:
+        return api_error(f"format must be one of {', '.join(REPORT_FORMATS)}")
+    course_id = _int_arg("course_id")
+    if course_id is None and request.args.get("course_id"):
+        return api_error("course_id must be an integer")
+    params = report_params(name, course_id, _int_arg("width"))
+    try:
+        repo = get_read_repository(*ANALYTICS_TABLES)
+        result = run_report(frame_cache.get(repo), name, **params)
+    except ReportError as exc:
+        return api_error(str(exc), 404 if str(exc).endswith("not found") else 400)
+    if fmt == "csv":
+        return Response(
+            stream_with_context(report_csv(result)),
+            mimetype=REPORT_FORMATS["csv"],
+            headers={"Content-Disposition": f'attachment; filename="{name}.csv"'},
+        )
+    offset = max(_int_arg("offset") or 0, 0)
+    limit = max(1, min(_int_arg("limit") or MAX_PAGE_SIZE, API_MAX_BATCH))
+    return jsonify(report_json(result, offset, limit))
+
+
+SEED_FIRST_NAMES = tuple(
+    "Aarav Amelia Chen Daniel Diego Elena Fatima Grace Hiro Ibrahim Isla James "
+    "Kavya Liam Lucia Maya Mohammed Noah Olivia Priya Rafael Sara Tomas Yusuf".split()
+)
+SEED_LAST_NAMES = tuple(
+    "Ahmed Brown Costa Garcia Ivanova Jensen Khan Kim Lopez Mensah Muller "
+    "Nakamura Novak Okafor Patel Rossi Schmidt Silva Singh Smith Tanaka Wang "
+    "Wilson Zhang".split()
+)
+SEED_DEPARTMENTS = (
+    "Biology",
+    "Chemistry",
+    "Computer Science",
+    "Economics",
+    "History",
+    "Literature",
+    "Mathematics",
+    "Physics",
+)
+SEED_SUBJECTS = tuple(
+    "Algebra Algorithms Databases Ecology Genetics Macroeconomics Mechanics "
+    "Networks Optics Poetry Statistics Thermodynamics".split()
+)
+SEED_LEVELS = ("Introduction to", "Foundations of", "Advanced", "Topics in")
+SEED_TERM_START = datetime(2024, 9, 2, 9, 0)
+SEED_UNGRADED = 0.1
+
+
+def seed_students(rng: random.Random, ids: range) -> Iterator[Tuple]:
+    for student_id in ids:
+        first = rng.choice(SEED_FIRST_NAMES)
+        last = rng.choice(SEED_LAST_NAMES)
+        yield (
+            student_id,
+            f"{first} {last}",
+            rng.randint(17, 30),
+            rng.choice(GENDERS),
+            rng.choice(SEED_DEPARTMENTS),
+            f"{first.lower()}.{last.lower()}{student_id}@example.edu",
+            f"555-{rng.randrange(10000):04d}",
+        )
+
+
+def seed_courses(rng: random.Random, ids: range) -> Iterator[Tuple]:
+    for course_id in ids:
+        department = rng.choice(SEED_DEPARTMENTS)
+        subject = rng.choice(SEED_SUBJECTS)
+        yield (
+            course_id,
+            f"{rng.choice(SEED_LEVELS)} {subject} {course_id}",
+            rng.choice((2, 3, 4)),
+            department,
+            f"{subject} for {department} students.",
+        )
+
+
+def seed_enrollments(
+    rng: random.Random, first_id: int, students: range, courses: range, per_student: int
+) -> Iterator[Tuple]:
+    enroll_id = first_id
+    per_student = min(per_student, len(courses))
+    for student_id in students:
+        for course_id in rng.sample(courses, per_student):
+            marks = None
+            if rng.random() >= SEED_UNGRADED:
+                mean = 50 + course_id % 7 * 4
+                marks = max(0, min(100, round(rng.gauss(mean, 15))))
+            enrolled_on = SEED_TERM_START + timedelta(minutes=rng.randrange(20160))
+            yield enroll_id, student_id, course_id, marks, enrolled_on
+            enroll_id += 1
+
+
+def last_key(repo: Repository, table: str) -> int:
+    key = TABLE_KEYS[table]
+    rows = repo.fetch_all(f"SELECT COALESCE(MAX({key}), 0) AS last FROM {table}")
+    return int(rows[0]["last"])
+
+
+def seed_rows(
+    repo: Repository, table: str, rows: Iterable[Tuple], batch_size: int
+) -> int:
+    columns = [TABLE_KEYS[table]] + [column for column, *_ in TABLE_COLUMNS[table]]
+    sql = repo.backend.sql(
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+    rows = iter(rows)
+    inserted = 0
+    cursor = repo.cursor(dictionary=False)
+    try:
+        batch = list(itertools.islice(rows, batch_size))
+        while batch:
+            cursor.executemany(sql, batch)
+            repo.commit()
+            inserted += len(batch)
+            batch = list(itertools.islice(rows, batch_size))
+    finally:
+        cursor.close()
+    return inserted
+
+
+def rebuild_analytics(repo: Repository) -> None:
+    cursor = repo.cursor(dictionary=False)
+    for sql in ANALYTICS_REBUILD:
+        repo.execute(cursor, sql)
+    cursor.close()
+    repo.commit()
+
+
+@dataclass
+class BenchData:
+    rows: Dict[str, int]
+    keys: Dict[str, Tuple[int, int]]
+
+    def pick(self, rng: random.Random, table: str) -> int:
+        return rng.randint(*self.keys[table])
+
+
+def bench_data(repo: Repository) -> BenchData:
+    rows, keys = {}, {}
+    for table in VERSIONED_TABLES:
+        key = TABLE_KEYS[table]
+        found = repo.fetch_all(
+            f"SELECT COUNT(*) AS count, MIN({key}) AS low, MAX({key}) AS high "
+            f"FROM {table}"
+        )[0]
+        rows[table] = int(found["count"])
+        keys[table] = (int(found["low"] or 0), int(found["high"] or 0))
+    return BenchData(rows, keys)
+
+
+BenchRequest = Tuple[str, str, Optional[Dict[str, Any]], Any]
+
+
+def bench_listing(listing: str, table: str) -> Callable[..., BenchRequest]:
+    def build(rng: random.Random, data: BenchData) -> BenchRequest:
+        return "GET", f"/{listing}?after={data.pick(rng, table) - 1}", None, None
+
+    return build
+
+
+def bench_search(rng: random.Random, data: BenchData) -> BenchRequest:
+    return "GET", f"/search?q={rng.choice(SEED_LAST_NAMES)}", None, None
+
+
+def bench_api_student(rng: random.Random, data: BenchData) -> BenchRequest:
+    return "GET", f"/api/v1/students/{data.pick(rng, 'student')}", None, None
+
+
+def bench_course_analytics(rng: random.Random, data: BenchData) -> BenchRequest:
+    return "GET", f"/analytics/courses/{data.pick(rng, 'course')}", None, None
+
+
+def bench_add_student(rng: random.Random, data: BenchData) -> BenchRequest:
+    form = {
+        "action": "Add",
+        "name": f"{rng.choice(SEED_FIRST_NAMES)} {rng.choice(SEED_LAST_NAMES)}",
+        "age": str(rng.randint(17, 30)),
+        "gender": rng.choice(GENDERS),
+        "department": rng.choice(SEED_DEPARTMENTS),
+    }
+    return "POST", "/students", form, None
+
+
+def bench_update_marks(rng: random.Random, data: BenchData) -> BenchRequest:
+    form = {
+        "action": "Update",
+        "enroll_id": str(data.pick(rng, "enrollment")),
+        "marks": str(rng.randint(0, 100)),
+    }
+    return "POST", "/enrollments", form, None
+
+
+def bench_api_marks(rng: random.Random, data: BenchData) -> BenchRequest:
+    items = [
+        {"enroll_id": data.pick(rng, "enrollment"), "marks": rng.randint(0, 100)}
+        for _ in range(10)
+    ]
+    return "PATCH", "/api/v1/enrollments", None, items
+
+
+BENCH_OPERATIONS: Dict[str, Callable[..., BenchRequest]] = {
+    "students": bench_listing("students", "student"),
+    "courses": bench_listing("courses", "course"),
+    "enrollments": bench_listing("enrollments", "enrollment"),
+    "search": bench_search,
+    "api_student": bench_api_student,
+    "course_analytics": bench_course_analytics,
+    "add_student": bench_add_student,
+    "update_marks": bench_update_marks,
+    "api_marks": bench_api_marks,
+}
+
+BENCH_READS = {
+    "students": 25,
+    "courses": 10,
+    "enrollments": 25,
+    "search": 15,
+    "api_student": 15,
+    "course_analytics": 10,
+}
+BENCH_MIXES: Dict[str, Dict[str, int]] = {
+    "read": BENCH_READS,
+    "mixed": {
+        **{name: weight * 8 // 10 for name, weight in BENCH_READS.items()},
+        "add_student": 5,
+        "update_marks": 10,
+        "api_marks": 5,
+    },
+    "write": {"add_student": 30, "update_marks": 40, "api_marks": 30},
+}
+BENCH_METRICS = {"p50_ms": 0.5, "p95_ms": 0.95, "p99_ms": 0.99}
+BENCH_MIN_TAIL = 5
+BENCH_ROWS_DRIFT = 0.1
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    if text in BENCH_MIXES:
+        return BENCH_MIXES[text]
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in BENCH_OPERATIONS or not weight.isdigit():
+            raise ValueError(
+                f"mix must be one of {', '.join(BENCH_MIXES)} or name=weight pairs "
+                f"over {', '.join(BENCH_OPERATIONS)}"
+            )
+        weights[name] = int(weight)
+    if not any(weights.values()):
+        raise ValueError("mix needs at least one positive weight")
+    return weights
+
+
+class LocalBenchClient:
+    def __init__(self) -> None:
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, form: Optional[Dict], body: Any) -> int:
+        response = self.client.open(path, method=method, data=form, json=body)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+class HttpBenchClient:
+    def __init__(self, url: str) -> None:
+        parts = urllib.parse.urlsplit(url)
+        self.prefix = parts.path.rstrip("/")
+        self.conn = http.client.HTTPConnection(
+            parts.hostname or "127.0.0.1", parts.port or 80, timeout=30
+        )
+
+    def request(self, method: str, path: str, form: Optional[Dict], body: Any) -> int:
+        headers, payload = {}, None
+        if form is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            payload = urllib.parse.urlencode(form)
+        elif body is not None:
+            headers["Content-Type"] = "application/json"
+            payload = json.dumps(body)
+        try:
+            self.conn.request(method, self.prefix + path, payload, headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            raise
+        return response.status
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _megabytes(size: Optional[int]) -> Optional[float]:
+    return None if size is None else round(size / 2**20, 1)
+
+
+def latency_summary(samples: List[float]) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def quantile(fraction: float) -> float:
+        index = min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": quantile(0.5),
+        "p95_ms": quantile(0.95),
+        "p99_ms": quantile(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def bench_phase(
+    make_client: Callable[[], Any],
+    weights: Dict[str, int],
+    data: BenchData,
+    total: int,
+    concurrency: int,
+    seed: int,
+) -> Tuple[Dict[str, List[float]], Dict[str, int], float]:
+    names = [name for name, weight in weights.items() if weight > 0]
+    cum_weights = list(itertools.accumulate(weights[name] for name in names))
+    issued = itertools.count()
+    results: List[Tuple[Dict[str, List[float]], Dict[str, int]]] = []
+
+    def worker(index: int) -> None:
+        rng = random.Random(seed * 1000 + index)
+        client = make_client()
+        samples: Dict[str, List[float]] = {name: [] for name in names}
+        errors = dict.fromkeys(names, 0)
+        while next(issued) < total:
+            name = rng.choices(names, cum_weights=cum_weights)[0]
+            method, path, form, body = BENCH_OPERATIONS[name](rng, data)
+            started = time.perf_counter()
+            try:
+                status = client.request(method, path, form, body)
+            except Exception as exc:
+                app.logger.warning("bench %s %s failed: %s", method, path, exc)
+                status = 0
+            samples[name].append(time.perf_counter() - started)
+            if not 200 <= status < 400:
+                errors[name] += 1
+        results.append((samples, errors))
+
+    threads = [
+        threading.Thread(target=worker, args=(index,)) for index in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    samples = {name: [] for name in names}
+    errors = dict.fromkeys(names, 0)
+    for worker_samples, worker_errors in results:
+        for name in names:
+            samples[name].extend(worker_samples[name])
+            errors[name] += worker_errors[name]
+    return samples, errors, elapsed
+
+
+def run_benchmark(
+    make_client: Callable[[], Any],
+    weights: Dict[str, int],
+    data: BenchData,
+    requests: int,
+    concurrency: int,
+    warmup: int = 0,
+    seed: int = 1,
+    local: bool = True,
+) -> Dict[str, Any]:
+    if warmup:
+        bench_phase(make_client, weights, data, warmup, concurrency, seed + 1)
+    rss_start = rss_bytes()
+    samples, errors, elapsed = bench_phase(
+        make_client, weights, data, requests, concurrency, seed
+    )
+    operations = {
+        name: {**latency_summary(samples[name]), "errors": errors[name]}
+        for name in samples
+    }
+    return {
+        "throughput_rps": round(requests / elapsed, 1),
+        "seconds": round(elapsed, 3),
+        "errors": sum(errors.values()),
+        "overall": latency_summary(list(itertools.chain(*samples.values()))),
+        "operations": operations,
+        "memory": {
+            "rss_start_mb": _megabytes(rss_start) if local else None,
+            "rss_end_mb": _megabytes(rss_bytes()) if local else None,
+            "peak_rss_mb": _megabytes(peak_rss_bytes()) if local else None,
+        },
+    }
+
+
+def format_benchmark(result: Dict[str, Any]) -> List[str]:
+    lines = [
+        f"{'operation':<18}{'count':>8}{'mean ms':>10}{'p50 ms':>10}"
+        f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    ]
+    rows = list(result["operations"].items())
+    rows.append(("overall", {**result["overall"], "errors": result["errors"]}))
+    for name, stats in rows:
+        if not stats["count"]:
+            continue
+        lines.append(
+            f"{name:<18}{stats['count']:>8}{stats['mean_ms']:>10.2f}"
+            f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+            f"{stats['p99_ms']:>10.2f}{stats['errors']:>8}"
+        )
+    config = result["config"]
+    memory = result["memory"]
+    summary = (
+        f"{result['throughput_rps']} req/s over {result['seconds']}s "
+        f"({config['concurrency']} clients, {config['target']})"
+    )
+    if memory["peak_rss_mb"] is not None:
+        summary += (
+            f"; RSS {memory['rss_start_mb']} -> {memory['rss_end_mb']} MB, "
+            f"peak {memory['peak_rss_mb']} MB"
+        )
+    lines.append(summary)
+    return lines
+
+
+def compare_benchmarks(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    tolerance: float,
+    min_ms: float,
+) -> Tuple[List[str], int]:
+    lines = []
+    if baseline["config"] != current["config"]:
+        lines.append(
+            f"warning: benchmark settings differ from the baseline: "
+            f"{baseline['config']} vs {current['config']}"
+        )
+    drifted = [
+        table
+        for table, count in current["rows"].items()
+        if abs(count - baseline["rows"].get(table, 0)) > count * BENCH_ROWS_DRIFT
+    ]
+    if drifted:
+        lines.append(
+            f"warning: {', '.join(drifted)} row counts differ from the baseline: "
+            f"{baseline['rows']} vs {current['rows']}"
+        )
+    regressions = 0
+    for name, stats in current["operations"].items():
+        base = baseline["operations"].get(name)
+        if not stats["count"] or not base or not base.get("count"):
+            continue
+        changes = []
+        for metric, fraction in BENCH_METRICS.items():
+            old, new = base[metric], stats[metric]
+            samples = min(stats["count"], base["count"])
+            if samples * (1 - fraction) < BENCH_MIN_TAIL:
+                mark = "~"
+            elif new > old * (1 + tolerance) and new - old >= min_ms:
+                mark = "!"
+                regressions += 1
+            else:
+                mark = " "
+            change = (new - old) / old if old else 0.0
+            changes.append(f"{metric[:3]} {change:+7.1%}{mark}")
+        lines.append(f"{name:<18}{'  '.join(changes)}")
+    old, new = baseline["throughput_rps"], current["throughput_rps"]
+    if old and new:
+        slower = new < old * (1 - tolerance)
+        regressions += slower
+        lines.append(
+            f"throughput {new} vs {old} req/s ({(new - old) / old:+.1%})"
+            f"{' !' if slower else ''}"
+        )
+    old, new = baseline["memory"]["peak_rss_mb"], current["memory"]["peak_rss_mb"]
+    if old and new:
+        bigger = new > old * (1 + tolerance)
+        regressions += bigger
+        lines.append(
+            f"peak RSS {new} vs {old} MB ({(new - old) / old:+.1%})"
+            f"{' !' if bigger else ''}"
+        )
+    lines.append(
+        f"{regressions} regression(s) beyond {tolerance:.0%} "
+        f"(! regressed, ~ too few samples to judge)"
+    )
+    return lines, regressions
+
+
+StatementOperation = Callable[[Repository, random.Random, BenchData], Any]
+
+STATEMENT_BENCH: Dict[str, StatementOperation] = {
+    "student_row": lambda repo, rng, data: repo.listing_row(
+        "students", data.pick(rng, "student")
+    ),
+    "course_row": lambda repo, rng, data: repo.listing_row(
+        "courses", data.pick(rng, "course")
+    ),
+    "enrollment_row": lambda repo, rng, data: repo.listing_row(
+        "enrollments", data.pick(rng, "enrollment")
+    ),
+    "students_page": lambda repo, rng, data: repo.page(
+        "students", data.pick(rng, "student") - 1
+    ),
+    "typeahead": lambda repo, rng, data: repo.typeahead(
+        "student", rng.choice(SEED_FIRST_NAMES)[:3], TYPEAHEAD_LIMIT
+    ),
+    "update_marks": lambda repo, rng, data: repo.update(
+        "enrollment", data.pick(rng, "enrollment"), {"marks": rng.randint(0, 100)}
+    ),
+}
+
+
+def statement_phase(
+    backend: Backend,
+    data: BenchData,
+    operation: StatementOperation,
+    iterations: int,
+    warmup: int,
+    seed: int,
+) -> Dict[str, Optional[float]]:
+    conn = backend.connect()
+    repo = Repository(backend, conn=conn)
+    rng = random.Random(seed)
+    try:
+        for _ in range(warmup):
+            operation(repo, rng, data)
+        server = backend.server_time(conn)
+        cpu, wall = time.thread_time(), time.perf_counter()
+        for _ in range(iterations):
+            operation(repo, rng, data)
+        cpu, wall = time.thread_time() - cpu, time.perf_counter() - wall
+        if server is not None:
+            after = backend.server_time(conn)
+            server = None if after is None else after - server
+        repo.rollback()
+    finally:
+        conn.close()
+    scale = 1e6 / iterations
+    return {
+        "wall_us": round(wall * scale, 1),
+        "client_us": round(cpu * scale, 1),
+        "server_us": None if server is None else round(server * scale, 1),
+    }
+
+
+def format_statement_bench(results: Dict[str, Dict[str, Dict]]) -> List[str]:
+    def cell(value: Optional[float]) -> str:
+        return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+
+    lines = [
+        f"{'operation':<16} {'mode':<9} {'wall us':>10} {'client us':>10} "
+        f"{'server us':>10}"
+    ]
+    for name, modes in results.items():
+        for mode, row in modes.items():
+            label = name if mode == "text" else ""
+            lines.append(
+                f"{label:<16} {mode:<9} {cell(row['wall_us'])} "
+                f"{cell(row['client_us'])} {cell(row['server_us'])}"
+            )
+    for column in ("client_us", "server_us"):
+        pairs = [
+            (modes["text"][column], modes["prepared"][column])
+            for modes in results.values()
+            if modes["text"][column] is not None
+            and modes["prepared"][column] is not None
+        ]
+        if not pairs:
+            continue
+        text = sum(before for before, _ in pairs) / len(pairs)
+        saved = text - sum(after for _, after in pairs) / len(pairs)
+        lines.append(
+            f"{column[:-3]} time saved per call: {saved:.1f} us "
+            f"({saved / text * 100 if text else 0:.0f}%)"
+        )
+    return lines
+
+
+def print_summary() -> None:
+    banner = "=" * 40
+    print(banner)
+    print(FEATURES_TEXT)
+    print(SETUP_TEXT)
+    cache = app.jinja_env.bytecode_cache
+    where = f"bytecode cache in {cache.directory}" if cache else "no bytecode cache"
+    print("Templates: served from memory,", where)
+    print("Schema file: run the export-assets command to write", SCHEMA_FILE)
+    print(f"Startup took {(time.perf_counter() - STARTUP_BEGAN) * 1000:.1f} ms")
+    print(banner)
+
+
+def run_export(args: argparse.Namespace) -> int:
+    gzip = args.gzip or args.output.endswith(".gz")
+    with app.app_context():
+        try:
+            chunks = export_stream(args.listing, args.format, gzip)
+        except ExportError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 2
+        if args.output == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            with open(args.output, "wb") as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+    return 0
+
+
+def advisor_queries(backend: Backend) -> List[Tuple[str, str, Tuple]]:
+    size = PAGE_SIZE + 1
+    queries = []
+    for label, (sql, key, _) in LISTINGS.items():
+        queries.append((f"{label} page", f"{sql} ORDER BY {key} LIMIT %s", (size,)))
+        queries.append(
+            (
+                f"{label} next page",
+                f"{sql} WHERE {key} > %s ORDER BY {key} LIMIT %s",
+                (1, size),
+            )
+        )
+    for table, key, column in [
+        ("student", "student_id", "name"),
+        ("course", "course_id", "credits"),
+        ("enrollment", "enroll_id", "marks"),
+    ]:
+        queries.append(
+            (
+                f"{table} update",
+                f"UPDATE {table} SET {column}={column} WHERE {key}=%s",
+                (1,),
+            )
+        )
+        queries.append(
+            (f"{table} delete", f"DELETE FROM {table} WHERE {key}=%s", (1,))
+        )
+    for table, sql in LOOKUP_SQL.items():
+        column = LOOKUP_NAME_COLUMN[table]
+        queries.append(
+            (
+                f"{table} dropdown",
+                f"{sql} ORDER BY {column} LIMIT %s",
+                (LOOKUP_INLINE_LIMIT + 1,),
+            )
+        )
+        queries.append(
+            (
+                f"{table} typeahead",
+                f"{sql} WHERE {column} LIKE %s ESCAPE '!' "
+                f"ORDER BY {column} LIMIT %s",
+                ("a%", TYPEAHEAD_LIMIT),
+            )
+        )
+    for entity in SEARCH_ENTITIES:
+        table = ENTITY_TABLES[entity]
+        sql, params = backend.search(table, TABLE_KEYS[table], ["a"], SEARCH_LIMIT)
+        queries.append((f"{table} search", sql, params))
+    for table, columns in API_FILTERS.items():
+        key = TABLE_KEYS[table]
+        kinds = {column: kind for column, kind, *_ in TABLE_COLUMNS[table]}
+        queries.append(
+            (f"api {table} get", *select_sql(table, ["*"], [(key, "=", 1)], None, 1))
+        )
+        for column in columns:
+            if kinds[column] == "int":
+                filters = [(column, "=", 1)]
+            else:
+                filters = [(column, "LIKE", "a%")]
+            queries.append(
+                (
+                    f"api {table} by {column}",
+                    *select_sql(table, [key], filters, 1, size),
+                )
+            )
+    for column in ("enroll_id", "student_id", "course_id"):
+        queries.append(
+            (
+                f"enrollment facts by {column}",
+                f"{ENROLLMENT_FACTS_SQL} WHERE e.{column} = %s",
+                (1,),
+            )
+        )
+    queries.append(
+        (
+            "marks batch",
+            f"{MARKS_FACTS_SQL} WHERE e.enroll_id IN (%s, %s) AND e.course_id = %s",
+            (1, 2, 1),
+        )
+    )
+    queries.append(("grade sheet", GRADE_SHEET_SQL, (1,)))
+    # The summary, the all-course report and /reports read every aggregate or
+    # enrollment row by design, so only their per-row and paged forms are listed.
+    queries.append(
+        (
+            "course analytics",
+            f"{COURSE_STATS_SQL} WHERE c.course_id = %s ORDER BY c.course_id",
+            (1,),
+        )
+    )
+    queries.append(
+        (
+            "course histogram",
+            "SELECT course_id, marks, students FROM course_marks "
+            "WHERE students > 0 AND course_id = %s ORDER BY course_id, marks",
+            (1,),
+        )
+    )
+    queries.append(
+        (
+            "student analytics page",
+            f"{STUDENT_STATS_SQL} WHERE s.student_id > %s "
+            "ORDER BY s.student_id LIMIT %s",
+            (0, size),
+        )
+    )
+    return queries
+
+
+def run_advisor(args: argparse.Namespace) -> int:
+    flagged = 0
+    with app.app_context():
+        repo = get_repository()
+        queries = advisor_queries(repo.backend)
+        for label, sql, params in queries:
+            problems = repo.explain(sql, params, args.min_rows)
+            status = "FLAG" if problems else "ok"
+            print(f"[{status:>4}] {label}")
+            for problem in problems:
+                print(f"       - {problem}")
+            flagged += bool(problems)
+    print(f"{flagged} of {len(queries)} queries flagged")
+    return 1 if flagged else 0
+
+
+def run_migrate(args: argparse.Namespace) -> int:
+    if args.status:
+        backend = get_backend()
+        conn = backend.connect()
+        cursor = conn.cursor()
+        current = backend.schema_version(cursor)
+        cursor.close()
+        conn.close()
+    else:
+        try:
+            current = migrate(args.target)
+        except MigrationError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+    print(f"Schema version {current} (latest {SCHEMA_VERSION})")
+    for migration in MIGRATIONS:
+        state = "applied" if migration.version <= current else "pending"
+        print(f"  {migration.version:>3} {state:<8} {migration.name}")
+    return 0
+
+
+def run_rebuild_analytics(args: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    with app.app_context():
+        repo = get_repository()
+        rebuild_analytics(repo)
+        summary = analytics_summary(repo)
+    bump_version(*ANALYTICS_TABLES)
+    print(
+        f"Rebuilt grade analytics for {summary['enrollments']} enrollments "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return 0
+
+
+def run_report_command(args: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            frame = load_enrollment_frame(get_repository(), args.chunk_size)
+            loaded = time.perf_counter()
+            params = report_params(args.report, args.course_id, args.width)
+            result = run_report(frame, args.report, **params)
+        except ReportError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 2
+    computed = time.perf_counter()
+    if args.format == "csv":
+        chunks = report_csv(result)
+    else:
+        chunks = iter([json.dumps(report_json(result), default=str).encode("utf-8")])
+    handle = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in chunks:
+            handle.write(chunk)
+    finally:
+        if handle is sys.stdout.buffer:
+            handle.flush()
+        else:
+            handle.close()
+    print(
+        f"{args.report}: {len(frame)} enrollments loaded in {loaded - started:.2f}s, "
+        f"computed in {computed - loaded:.2f}s, "
+        f"written in {time.perf_counter() - computed:.2f}s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def run_seed(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    course_count = args.courses or max(10, args.students // 100)
+    started = time.perf_counter()
+    prepare_app()
+    with app.app_context():
+        repo = get_repository()
+        if args.reset:
+            for table in ("enrollment", "course", "student"):
+                repo.run(f"DELETE FROM {table}")
+            repo.commit()
+        first = {table: last_key(repo, table) + 1 for table in VERSIONED_TABLES}
+        students = range(first["student"], first["student"] + args.students)
+        courses = range(first["course"], first["course"] + course_count)
+        plan = [
+            ("student", seed_students(rng, students)),
+            ("course", seed_courses(rng, courses)),
+            (
+                "enrollment",
+                seed_enrollments(
+                    rng, first["enrollment"], students, courses, args.per_student
+                ),
+            ),
+        ]
+        for table, rows in plan:
+            table_started = time.perf_counter()
+            inserted = seed_rows(repo, table, rows, args.batch_size)
+            elapsed = time.perf_counter() - table_started
+            print(
+                f"{table}: {inserted} rows in {elapsed:.2f}s "
+                f"({inserted / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+        analytics_started = time.perf_counter()
+        rebuild_analytics(repo)
+        print(f"analytics: rebuilt in {time.perf_counter() - analytics_started:.2f}s")
+    bump_version(*VERSIONED_TABLES)
+    print(f"Seeded in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+def run_bench(args: argparse.Namespace) -> int:
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+    if not args.url:
+        prepare_app()
+        if args.no_cache:
+            result_cache.max_bytes = 0
+    with app.app_context():
+        data = bench_data(get_repository())
+    if not all(data.rows.values()):
+        print("error: seed the database first (the seed command)", file=sys.stderr)
+        return 2
+    if args.url:
+        target = args.url
+
+        def make_client() -> HttpBenchClient:
+            return HttpBenchClient(args.url)
+
+    else:
+        target = f"in-process {get_backend().name}"
+        make_client = LocalBenchClient
+    result = run_benchmark(
+        make_client,
+        weights,
+        data,
+        args.requests,
+        args.concurrency,
+        warmup=args.warmup,
+        seed=args.seed,
+        local=not args.url,
+    )
+    result = {
+        "config": {
+            "mix": weights,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "target": target,
+            "cache": not args.no_cache,
+        },
+        "rows": data.rows,
+        **result,
+        "python": sys.version.split()[0],
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    for line in format_benchmark(result):
+        print(line)
+    if args.save:
+        with open(args.save, "w") as handle:
+            json.dump(result, handle, indent=2)
+            handle.write("\n")
+        print(f"Results saved to {args.save}")
+    if baseline is None:
+        return 0
+    print(f"Compared with {args.baseline}:")
+    lines, regressions = compare_benchmarks(
+        baseline, result, args.tolerance, args.min_ms
+    )
+    for line in lines:
+        print(line)
+    return 1 if regressions else 0
+
+
+def run_bench_statements(args: argparse.Namespace) -> int:
+    if args.cache_size <= 0:
+        print("error: --cache-size must be positive", file=sys.stderr)
+        return 2
+    prepare_app()
+    with app.app_context():
+        data = bench_data(get_repository())
+    if not all(data.rows.values()):
+        print("error: seed the database first (the seed command)", file=sys.stderr)
+        return 2
+    backends = {}
+    for mode, size in (("text", 0), ("prepared", args.cache_size)):
+        backends[mode] = copy.copy(get_backend())
+        backends[mode].statement_cache = size
+    results: Dict[str, Dict[str, Dict]] = {}
+    for name, operation in STATEMENT_BENCH.items():
+        results[name] = {
+            mode: statement_phase(
+                backend, data, operation, args.iterations, args.warmup, args.seed
+            )
+            for mode, backend in backends.items()
+        }
+    print(
+        f"{get_backend().name}: {args.iterations} calls per operation, "
+        f"statement cache of {args.cache_size} vs none"
+    )
+    for line in format_statement_bench(results):
+        print(line)
+    return 0
+
+
+def run_export_assets(args: argparse.Namespace) -> int:
+    templates_dir = Path(args.dir) / "templates" if args.dir else TEMPLATES_DIR
+    schema_file = Path(args.dir) / SCHEMA_FILE.name if args.dir else SCHEMA_FILE
+    export_assets(templates_dir, schema_file)
+    print("Templates written to:", templates_dir)
+    print("Schema file:", schema_file)
+    return 0
+
+
+def prepare_app() -> None:
+    precompile_templates()
+    try:
+        migrate()
+    except MigrationError as exc:
+        # later migrations and the aggregate tracking assume every earlier one
+        # has been applied, so a partly migrated schema is not served
+        raise SystemExit(
+            f"error: {exc}\nFix the data, then start again or run the migrate command"
+        )
+
+
+def run_server(args: argparse.Namespace) -> int:
+    prepare_app()
+    print_summary()
+    app.run(debug=True)
+    return 0
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, code="-", size="-") -> None:
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host: str, port: int, wsgi_app, threads: int, **kwargs) -> None:
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+        super().__init__(host, port, wsgi_app, **kwargs)
+
+    def process_request(self, request, client_address) -> None:
+        self.executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def drain(self) -> None:
+        self.shutdown()
+        self.executor.shutdown(wait=True)
+
+
+def parse_bind(bind: str) -> Tuple[str, int]:
+    host, _, port = bind.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def serve_worker(sock: socket.socket, args: argparse.Namespace) -> None:
+    host, port = parse_bind(args.bind)
+    handler = WSGIRequestHandler if args.access_log else QuietRequestHandler
+    server = PooledWSGIServer(
+        host, port, app, args.threads, handler=handler, fd=sock.fileno()
+    )
+
+    def stop(signum, frame) -> None:
+        change_feed.close()
+        threading.Thread(target=server.drain, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server.serve_forever()
+    server.executor.shutdown(wait=True)
+
+
+class AsgiBridge:
+    # responses that stay open for as long as the page does
+    long_lived = ("/events",)
+
+    def __init__(
+        self, wsgi_app, threads: int, streams: int = FEED_MAX_SUBSCRIBERS + 1
+    ) -> None:
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="asgi")
+        # one spare thread lets a request over the subscriber limit get its 503
+        self.streams = ThreadPoolExecutor(streams, thread_name_prefix="asgi-stream")
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    self.streams.shutdown(wait=True)
+                    self.executor.shutdown(wait=True)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return
+            body.write(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body.seek(0)
+        loop = asyncio.get_running_loop()
+        if scope["path"] in self.long_lived:
+            executor = self.streams
+        else:
+            executor = self.executor
+        try:
+            await loop.run_in_executor(executor, self.run, scope, body, send, loop)
+        finally:
+            body.close()
+
+    def environ(self, scope, body) -> Dict[str, Any]:
+        root = scope.get("root_path", "")
+        path = scope["path"]
+        if root and path.startswith(root):
+            path = path[len(root) :]
+        server = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": root.encode("utf-8").decode("latin-1"),
+            "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope["query_string"].decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+            "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1").upper().replace("-", "_")
+            if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = f"HTTP_{name}"
+            value = value.decode("latin-1")
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+        return environ
+
+    def run(self, scope, body, send, loop) -> None:
+        def emit(message: Dict[str, Any]) -> None:
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start: Dict[str, Any] = {}
+
+        def start_response(status: str, headers, exc_info=None):
+            start["type"] = "http.response.start"
+            start["status"] = int(status.split(" ", 1)[0])
+            start["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+            return lambda data: emit(
+                {"type": "http.response.body", "body": data, "more_body": True}
+            )
+
+        result = self.wsgi_app(self.environ(scope, body), start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    emit(start)
+                    started = True
+                emit({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not started:
+                emit(start)
+            emit({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+
+
+def serve_asgi_worker(sock: socket.socket, args: argparse.Namespace) -> None:
+    import uvicorn
+
+    config = uvicorn.Config(
+        AsgiBridge(app, args.threads),
+        access_log=args.access_log,
+        log_level="info" if args.access_log else "warning",
+        timeout_graceful_shutdown=int(args.graceful_timeout),
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve_prefork(args: argparse.Namespace, worker: Callable = serve_worker) -> int:
+    host, port = parse_bind(args.bind)
+    sock = socket.create_server((host, port), backlog=2048)
+    sock.set_inheritable(True)
+    if not hasattr(os, "fork") or args.workers <= 1:
+        if worker is not serve_worker:
+            worker(sock, args)
+            return 0
+        handler = WSGIRequestHandler if args.access_log else QuietRequestHandler
+        server = PooledWSGIServer(
+            host, port, app, args.threads, handler=handler, fd=sock.fileno()
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            change_feed.close()
+            server.drain()
+        return 0
+
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                worker(sock, args)
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        spawn()
+    print(f"Serving on http://{host}:{port} with {args.workers} workers")
+    while not stopping:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid in children:
+            started = children.pop(pid)
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            spawn()
+        else:
+            time.sleep(0.2)
+
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + args.graceful_timeout
+    while children and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    sock.close()
+    return 0
+
+
+def serve_gunicorn(args: argparse.Namespace) -> int:
+    from gunicorn.app.base import BaseApplication
+
+    class GunicornApplication(BaseApplication):
+        def load_config(self) -> None:
+            self.cfg.set("bind", args.bind)
+            self.cfg.set("workers", args.workers)
+            self.cfg.set("threads", args.threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("graceful_timeout", args.graceful_timeout)
+            if args.access_log:
+                self.cfg.set("accesslog", "-")
+
+        def load(self):
+            return app
+
+    GunicornApplication().run()
+    return 0
+
+
+def run_serve(args: argparse.Namespace) -> int:
+    prepare_app()
+    if metrics.directory is None and args.workers > 1:
+        metrics.directory = tempfile.mkdtemp(prefix="sms-metrics-")
+        try:
+            return serve_engine(args)
+        finally:
+            shutil.rmtree(metrics.directory, ignore_errors=True)
+    return serve_engine(args)
+
+
+def serve_engine(args: argparse.Namespace) -> int:
+    engine = args.engine
+    if engine == "auto":
+        try:
+            import gunicorn  # noqa: F401
+
+            engine = "gunicorn"
+        except ImportError:
+            engine = "prefork"
+    if engine == "gunicorn":
+        return serve_gunicorn(args)
+    if engine == "uvicorn":
+        return serve_prefork(args, worker=serve_asgi_worker)
+    return serve_prefork(args)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Student Management System")
+    parser.set_defaults(handler=run_server)
+    commands = parser.add_subparsers(title="commands")
+
+    export_cmd = commands.add_parser("export", help="stream a listing to a file")
+    export_cmd.add_argument("listing", choices=sorted(EXPORTS))
+    export_cmd.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    export_cmd.add_argument(
+        "--output", "-o", default="-", help="file path, or - for stdout"
+    )
+    export_cmd.add_argument("--gzip", action="store_true", help="gzip the output")
+    export_cmd.set_defaults(handler=run_export)
+
+    advise_cmd = commands.add_parser(
+        "advise", help="EXPLAIN the app's queries and flag full scans"
+    )
+    advise_cmd.add_argument(
+        "--min-rows",
+        type=int,
+        default=0,
+        help="ignore scans estimated to touch fewer rows than this",
+    )
+    advise_cmd.set_defaults(handler=run_advisor)
+
+    migrate_cmd = commands.add_parser("migrate", help="apply schema migrations")
+    migrate_cmd.add_argument(
+        "--target", type=int, default=SCHEMA_VERSION, help="stop at this version"
+    )
+    migrate_cmd.add_argument(
+        "--status", action="store_true", help="show versions without applying"
+    )
+    migrate_cmd.set_defaults(handler=run_migrate)
+
+    assets_cmd = commands.add_parser(
+        "export-assets", help="write the templates and SQL schema to disk"
+    )
+    assets_cmd.add_argument("--dir", help="target directory (default: next to the app)")
+    assets_cmd.set_defaults(handler=run_export_assets)
+
+    report_cmd = commands.add_parser(
+        "report", help="compute a vectorized enrollment report (needs numpy)"
+    )
+    report_cmd.add_argument("report", choices=sorted(REPORTS))
+    report_cmd.add_argument("--format", choices=sorted(REPORT_FORMATS), default="csv")
+    report_cmd.add_argument("--course-id", type=int, help="limit to one course")
+    report_cmd.add_argument("--width", type=int, help="histogram bucket width")
+    report_cmd.add_argument(
+        "--chunk-size", type=int, default=REPORT_CHUNK_ROWS, help="rows per fetch"
+    )
+    report_cmd.add_argument(
+        "--output", "-o", default="-", help="file path, or - for stdout"
+    )
+    report_cmd.set_defaults(handler=run_report_command)
+
+    rebuild_cmd = commands.add_parser(
+        "rebuild-analytics", help="recompute the grade aggregates from enrollments"
+    )
+    rebuild_cmd.set_defaults(handler=run_rebuild_analytics)
+
+    seed_cmd = commands.add_parser(
+        "seed", help="insert synthetic students, courses and enrollments"
+    )
+    seed_cmd.add_argument("--students", type=int, default=10000)
+    seed_cmd.add_argument(
+        "--courses", type=int, help="default: one per 100 students, at least 10"
+    )
+    seed_cmd.add_argument(
+        "--per-student", type=int, default=4, help="enrollments per student"
+    )
+    seed_cmd.add_argument("--seed", type=int, default=1, help="random seed")
+    seed_cmd.add_argument(
+        "--batch-size", type=int, default=5000, help="rows per commit"
+    )
+    seed_cmd.add_argument(
+        "--reset", action="store_true", help="delete all existing rows first"
+    )
+    seed_cmd.set_defaults(handler=run_seed)
+
+    bench_cmd = commands.add_parser(
+        "bench", help="load-test the CRUD routes and compare with a baseline"
+    )
+    bench_cmd.add_argument(
+        "--mix",
+        default="mixed",
+        help=f"{', '.join(BENCH_MIXES)}, or name=weight pairs over "
+        f"{', '.join(BENCH_OPERATIONS)}",
+    )
+    bench_cmd.add_argument("--requests", type=int, default=2000)
+    bench_cmd.add_argument("--warmup", type=int, default=200, help="untimed requests")
+    bench_cmd.add_argument(
+        "--concurrency", type=int, default=4, help="concurrent clients"
+    )
+    bench_cmd.add_argument("--seed", type=int, default=1, help="random seed")
+    bench_cmd.add_argument(
+        "--url", help="benchmark a running server instead of the app in-process"
+    )
+    bench_cmd.add_argument(
+        "--no-cache", action="store_true", help="disable the result cache"
+    )
+    bench_cmd.add_argument("--save", help="write the results as JSON to this file")
+    bench_cmd.add_argument("--baseline", help="compare with saved results")
+    bench_cmd.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed slowdown before a metric counts as a regression",
+    )
+    bench_cmd.add_argument(
+        "--min-ms",
+        type=float,
+        default=0.5,
+        help="ignore latency changes smaller than this many milliseconds",
+    )
+    bench_cmd.set_defaults(handler=run_bench)
+
+    statements_cmd = commands.add_parser(
+        "bench-statements",
+        help="time the fixed CRUD statements with and without the statement cache",
+    )
+    statements_cmd.add_argument("--iterations", type=int, default=5000)
+    statements_cmd.add_argument("--warmup", type=int, default=500)
+    statements_cmd.add_argument("--seed", type=int, default=1, help="random seed")
+    statements_cmd.add_argument(
+        "--cache-size",
+        type=int,
+        default=STATEMENT_CACHE_SIZE or 128,
+        help="statements kept per connection in the cached run",
+    )
+    statements_cmd.set_defaults(handler=run_bench_statements)
+
+    serve_cmd = commands.add_parser("serve", help="run the production server")
+    serve_cmd.add_argument("--bind", default="127.0.0.1:8000", help="host:port")
+    serve_cmd.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    serve_cmd.add_argument("--threads", type=int, default=8, help="threads per worker")
+    serve_cmd.add_argument(
+        "--graceful-timeout",
+        type=float,
+        default=30,
+        help="seconds to let in-flight requests finish on shutdown",
+    )
+    serve_cmd.add_argument(
+        "--engine", choices=["auto", "gunicorn", "prefork", "uvicorn"], default="auto"
+    )
+    serve_cmd.add_argument("--access-log", action="store_true")
+    serve_cmd.set_defaults(handler=run_serve)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+import argparse
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+APP_FILE = Path(__file__).resolve().parent.parent / "student management.py"
+STUDENTS = 20000
+
+
+@pytest.fixture(scope="session")
+def sms(tmp_path_factory):
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = str(tmp_path_factory.mktemp("db") / "students.db")
+    spec = importlib.util.spec_from_file_location("student_management", APP_FILE)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    args = argparse.Namespace(
+        seed=7,
+        students=STUDENTS,
+        courses=40,
+        per_student=3,
+        batch_size=5000,
+        reset=True,
+    )
+    module.run_seed(args)
+    yield module
+    module.change_feed.close()
+    module.reset_pool()
+
+
+@pytest.fixture
+def client(sms):
+    return sms.app.test_client()
@@ -0,0 +1,47 @@
+import copy
+import json
+
+
+def bench_result(p95_ms):
+    stats = {"count": 1000, "p50_ms": 4.0, "p95_ms": p95_ms, "p99_ms": 30.0}
+    return {
+        "config": {"mix": {"students": 1}, "requests": 1000},
+        "rows": {"student": 20000},
+        "operations": {"students": stats},
+        "throughput_rps": 200.0,
+        "memory": {"peak_rss_mb": 80.0},
+    }
+
+
+def test_bench_runs_every_operation(sms, tmp_path):
+    saved = tmp_path / "bench.json"
+    argv = ["bench", "--requests", "80", "--warmup", "8", "--concurrency", "2"]
+    assert sms.main([*argv, "--save", str(saved)]) == 0
+    result = json.loads(saved.read_text())
+    assert result["errors"] == 0
+    assert result["overall"]["count"] == 80
+    assert set(result["operations"]) == set(result["config"]["mix"])
+    # a run compared with its own results (and a loose tolerance) passes
+    assert sms.main([*argv, "--baseline", str(saved), "--tolerance", "100"]) == 0
+
+
+def test_compare_flags_only_real_slowdowns(sms):
+    baseline = bench_result(p95_ms=10.0)
+    _, regressions = sms.compare_benchmarks(baseline, copy.deepcopy(baseline), 0.2, 0.5)
+    assert regressions == 0
+    _, regressions = sms.compare_benchmarks(baseline, bench_result(15.0), 0.2, 0.5)
+    assert regressions == 1
+    # within tolerance, and a change below --min-ms
+    _, regressions = sms.compare_benchmarks(baseline, bench_result(11.0), 0.2, 0.5)
+    assert regressions == 0
+    _, regressions = sms.compare_benchmarks(baseline, bench_result(13.0), 0.2, 5.0)
+    assert regressions == 0
+
+
+def test_compare_skips_an_empty_baseline(sms):
+    baseline = bench_result(p95_ms=10.0)
+    baseline["throughput_rps"] = 0.0
+    baseline["memory"]["peak_rss_mb"] = 0.0
+    lines, regressions = sms.compare_benchmarks(baseline, bench_result(10.0), 0.2, 0.5)
+    assert regressions == 0
+    assert not any(line.startswith("throughput") for line in lines)
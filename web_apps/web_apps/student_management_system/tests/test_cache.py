@@ -0,0 +1,32 @@
+def rename(client, listing, row_id, **values):
+    data = {"action": "Update", **values}
+    data["student_id" if listing == "students" else "course_id"] = str(row_id)
+    response = client.post(f"/{listing}", data=data)
+    assert response.status_code == 303
+
+
+def test_write_invalidates_cached_page(client):
+    client.get("/students?size=5")
+    assert b"Cache Probe" not in client.get("/students?size=5").data
+    rename(client, "students", 1, name="Cache Probe", gender="Female")
+    assert b"Cache Probe" in client.get("/students?size=5").data
+
+
+def test_course_rename_invalidates_enrollments_page(client, sms):
+    with sms.app.app_context():
+        (row,) = sms.get_repository().fetch_all(
+            "SELECT course_id FROM enrollment ORDER BY enroll_id LIMIT 1"
+        )
+    client.get("/enrollments?size=5")
+    assert b"Renamed Course" not in client.get("/enrollments?size=5").data
+    rename(client, "courses", row["course_id"], course_name="Renamed Course")
+    assert b"Renamed Course" in client.get("/enrollments?size=5").data
+
+
+def test_repeated_page_is_a_cache_hit(client):
+    client.get("/courses?size=7")
+    before = client.get("/health/cache").get_json()
+    client.get("/courses?size=7")
+    after = client.get("/health/cache").get_json()
+    hits = [stats["namespaces"]["courses"]["hits"] for stats in (before, after)]
+    assert hits[1] == hits[0] + 1
@@ -0,0 +1,24 @@
+def test_unchanged_listing_revalidates_with_304(client):
+    first = client.get("/courses?size=3")
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    again = client.get("/courses?size=3", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+
+
+def test_write_changes_the_etag(client):
+    etag = client.get("/courses?size=3").headers["ETag"]
+    response = client.post(
+        "/courses", data={"action": "Add", "course_name": "ETag Probe", "credits": "3"}
+    )
+    assert response.status_code == 303
+    after = client.get("/courses?size=3", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != etag
+
+
+def test_query_string_is_part_of_the_etag(client):
+    first = client.get("/courses?size=3").headers["ETag"]
+    second = client.get("/courses?size=4").headers["ETag"]
+    assert first != second
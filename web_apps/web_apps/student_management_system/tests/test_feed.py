@@ -0,0 +1,72 @@
+import queue
+import time
+
+import pytest
+
+
+@pytest.fixture
+def follow(sms):
+    subscription = sms.change_feed.subscribe(["students", "enrollments"], None)
+    deadline = time.monotonic() + 2
+    while sms.change_feed.floor is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield subscription
+    sms.change_feed.unsubscribe(subscription)
+
+
+def received(subscription, wait=0.5):
+    events = []
+    while True:
+        try:
+            events.append(subscription.events.get(timeout=wait))
+        except queue.Empty:
+            return [
+                (event["listing"], event["action"], event["id"]) for event in events
+            ]
+
+
+def test_form_update_publishes_the_row(client, follow):
+    data = {
+        "action": "Update",
+        "student_id": "3",
+        "name": "Feed Probe",
+        "gender": "Male",
+    }
+    assert client.post("/students", data=data).status_code == 303
+    event = follow.events.get(timeout=2)
+    assert (event["listing"], event["action"], event["id"]) == ("students", "update", 3)
+    assert "Feed Probe" in event["row"]
+    # enrollment rows show the student's name
+    assert received(follow) == [("enrollments", "stale", None)]
+
+
+def test_api_write_publishes_stale(client, follow):
+    response = client.patch(
+        "/api/v1/students", json=[{"student_id": 4, "department": "Feeds"}]
+    )
+    assert response.status_code == 200
+    assert received(follow) == [
+        ("students", "stale", None),
+        ("enrollments", "stale", None),
+    ]
+
+
+@pytest.mark.parametrize(
+    "listing, data",
+    [
+        ("students", {"action": "Update", "name": "Nobody", "gender": "Male"}),
+        ("students", {"action": "Delete"}),
+        ("courses", {"action": "Update", "course_name": "Nothing"}),
+        ("courses", {"action": "Delete"}),
+        ("enrollments", {"action": "Update", "marks": "50"}),
+        ("enrollments", {"action": "Delete"}),
+    ],
+)
+def test_unknown_row_is_404_and_silent(client, sms, follow, listing, data):
+    key = {"students": "student_id", "courses": "course_id"}.get(listing, "enroll_id")
+    version = sms.table_versions.get(listing[:-1])
+    response = client.post(f"/{listing}", data={**data, key: "999999999"})
+    assert response.status_code == 404
+    assert "not found" in response.get_json()["error"]
+    assert sms.table_versions.get(listing[:-1]) == version
+    assert received(follow, wait=0.3) == []
@@ -0,0 +1,56 @@
+import pytest
+
+
+@pytest.mark.parametrize(
+    "listing, data, message",
+    [
+        ("students", {"action": "Add", "name": "X", "gender": "F"}, "gender"),
+        (
+            "students",
+            {"action": "Add", "name": "X", "gender": "Male", "age": "abc"},
+            "age",
+        ),
+        ("students", {"action": "Update", "name": "X", "gender": "Male"}, "student_id"),
+        ("courses", {"action": "Delete", "course_id": "one"}, "course_id"),
+        ("courses", {"action": "Add", "course_name": ""}, "course_name"),
+        ("enrollments", {"action": "Add", "course_id": "1"}, "student_id"),
+        (
+            "enrollments",
+            {"action": "Update", "enroll_id": "1", "marks": "101"},
+            "marks",
+        ),
+        ("students", {"action": "Rename"}, "action"),
+    ],
+)
+def test_invalid_form_is_400(client, listing, data, message):
+    response = client.post(f"/{listing}", data=data)
+    assert response.status_code == 400
+    assert message in response.get_json()["error"]
+
+
+def test_constraint_violations_are_409(client, sms):
+    with sms.app.app_context():
+        (row,) = sms.get_repository().fetch_all(
+            "SELECT student_id, course_id FROM enrollment ORDER BY enroll_id LIMIT 1"
+        )
+    duplicate = {"action": "Add", **{key: str(value) for key, value in row.items()}}
+    assert client.post("/enrollments", data=duplicate).status_code == 409
+    unknown = {"action": "Add", "student_id": "999999999", "course_id": "1"}
+    assert client.post("/enrollments", data=unknown).status_code == 409
+
+
+@pytest.mark.parametrize(
+    "item, status",
+    [
+        ({"name": "No Key"}, 400),
+        ({"student_id": "4; DROP TABLE student", "name": "X"}, 400),
+        ({"student_id": -4, "name": "X"}, 400),
+        ({"student_id": True, "name": "X"}, 400),
+        ({"student_id": 999999999, "name": "X"}, 404),
+        ({"student_id": 999999999}, 404),
+        ({"student_id": "5"}, 200),
+    ],
+)
+def test_api_patch_checks_the_key(client, item, status):
+    response = client.patch("/api/v1/students", json=[item])
+    assert response.status_code == status
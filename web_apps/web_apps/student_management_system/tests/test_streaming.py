@@ -0,0 +1,29 @@
+import tracemalloc
+
+# a few STREAM_CHUNK_SIZE batches of rows; far below any of the bodies below
+MEMORY_BUDGET = 2 * 1024 * 1024
+
+
+def stream_body(client, url):
+    response = client.get(url, buffered=False)
+    assert response.status_code == 200
+    tracemalloc.start()
+    try:
+        size = sum(len(chunk) for chunk in response.iter_encoded())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        response.close()
+    return size, peak
+
+
+def test_streamed_listing_memory_is_bounded(client):
+    size, peak = stream_body(client, "/students?stream=1")
+    assert size > 4 * MEMORY_BUDGET
+    assert peak < MEMORY_BUDGET
+
+
+def test_export_memory_is_bounded(client):
+    size, peak = stream_body(client, "/export/enrollments.ndjson")
+    assert size > 2 * MEMORY_BUDGET
+    assert peak < MEMORY_BUDGET